@@ -4,6 +4,7 @@ from flask_cors import CORS
 from retrieval.elastic_reranking_retriever import ElasticRerankingRetriever
 from retrieval.elastic_retriever import ElasticRetriever
 from retrieval.elastic_page_retriever import ElasticPageRetriever
+from retrieval.es_client import create_client
 import fasttext
 import logging
 import requests
@@ -20,8 +21,14 @@ def create_app():
         os.makedirs(app.instance_path)
     except OSError:
         pass
-    app.retriever = ElasticRetriever(os.environ['ELASTIC_ADDRESS'])
-    app.page_retriever = ElasticPageRetriever(os.environ['ELASTIC_ADDRESS'])
+    # One pooled, keep-alive client shared by every retriever and request
+    app.es_client = create_client(os.environ['ELASTIC_ADDRESS'],
+                                  maxsize=int(os.environ.get('ELASTIC_POOL_SIZE', 25)),
+                                  timeout=float(os.environ.get('ELASTIC_TIMEOUT', 20)),
+                                  max_retries=int(os.environ.get('ELASTIC_MAX_RETRIES', 3)),
+                                  sniff=os.environ.get('ELASTIC_SNIFF', 'false').lower() == 'true')
+    app.retriever = ElasticRetriever(os.environ['ELASTIC_ADDRESS'], client=app.es_client)
+    app.page_retriever = ElasticPageRetriever(os.environ['ELASTIC_ADDRESS'], client=app.es_client)
     try:
         app.word_embeddings_model = fasttext.load_model('/data/vecs.bin')
     except Exception as e:
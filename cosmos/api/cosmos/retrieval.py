@@ -41,6 +41,7 @@ parameter_defs = {
         'base_confidence': '(float)- Output logit score from detection model. Measures confidence of the initial COSMOS classification. Only results with confidence higher than the specified value will be returned. Default is 1.0.',
         'postprocessing_confidence': '(0.0-1.0) - Confidence score of the COSMOS post-processing model. Only results with confidence higher than the specified value will be returned. Default is 0.7.',
         'document_filter_terms': '(str) - Comma- or space-separated list of additional terms to require at the document level. Applies AND logic to comma- or space-separated words.',
+        'docids': '(str) - Comma-separated list of document ids (file names without .pdf) to restrict results to. Ids must match exactly, including case.',
         'context_filter_terms': '(str) - Comma- or space-separated list of additional terms to require at the object level. Applies AND logic to comma- or space-separated words.',
         'ignore_bytes': '(bool) If true, do not return the bytes of the extracted image (e.g. only return text content of objects)'
         }
@@ -193,15 +194,16 @@ def search():
 
     # TODO: toggle for entity searching
 
-    count = current_app.retriever.search(query, entity_search=False, ndocs=N_RESULTS, page=page_num, cls=obj_type,
-                                               detect_min=base_confidence, postprocess_min=postprocessing_confidence,
-                                               get_count=True, final=False, inclusive=inclusive, document_filter_terms=document_filter_terms, docids=docids, obj_id=obj_id)
     if 'count' in request.endpoint:
+        count = current_app.retriever.search(query, entity_search=False, ndocs=N_RESULTS, page=page_num, cls=obj_type,
+                                             detect_min=base_confidence, postprocess_min=postprocessing_confidence,
+                                             get_count=True, final=False, inclusive=inclusive, document_filter_terms=document_filter_terms, docids=docids, obj_id=obj_id)
         return jsonify({'total_results': count, 'v': VERSION})
     current_app.logger.info(f"page: {page_num}, cls: {obj_type}, detect_min: {base_confidence}, postprocess_min: {postprocessing_confidence}")
     current_app.logger.info(f"Passing in {document_filter_terms}")
-    results = current_app.retriever.search(query, entity_search=False, ndocs=N_RESULTS, page=page_num, cls=obj_type,
-                                         detect_min=base_confidence, postprocess_min=postprocessing_confidence, get_count=False, final=True, inclusive=inclusive, document_filter_terms=document_filter_terms, docids=docids, obj_id=obj_id)
+    # One query returns both the page of results and the total number of matches
+    results, count = current_app.retriever.search_with_count(query, ndocs=N_RESULTS, page=page_num, cls=obj_type,
+                                                             detect_min=base_confidence, postprocess_min=postprocessing_confidence, inclusive=inclusive, document_filter_terms=document_filter_terms, docids=docids, obj_id=obj_id)
     if len(results) == 0:
         return {'page': 0, 'objects': [], 'v': VERSION}
     image_dir = '/data/images'
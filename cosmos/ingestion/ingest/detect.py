@@ -1,19 +1,25 @@
 import io
 from PIL import Image
 from ingest.process.detection.src.infer import run_inference
-from ingest.process.detection.src.torch_model.train.data_layer.sql_types import Base
 import logging
 import base64
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 from dask.distributed import get_worker
+from ingest.utils.page_io import load_page, store_page
+from ingest.utils.page_cache import page_cache, stage_key
 logging.basicConfig(format='%(levelname)s :: %(asctime)s :: %(message)s', level=logging.WARNING)
 logger = logging.getLogger(__name__)
-import pickle
 
-def detect(pkl_path):
-    with open(pkl_path, 'rb') as rf:
-        obj = pickle.load(rf)
+def detect(page):
+    return detect_pages([page])[0]
+
+
+def detect_pages(pages):
+    """
+    Run detection over several pages with a single inference pass, so proposals from different pages share batches
+    :param pages: List of page pickle paths or in-memory page dicts
+    :return: List of page pickle paths or page dicts, in the order given
+    """
+    loaded = [load_page(page) for page in pages]
     try:
         worker = get_worker()
         dp = None
@@ -27,27 +33,43 @@ def detect(pkl_path):
         model = dp.model
         model_config = dp.model_config
         device_str = dp.device_str
-        engine = create_engine('sqlite:///:memory:', echo=False)  
-        Session = sessionmaker()
-        Session.configure(bind=engine)
-        Base.metadata.create_all(engine)
-        session = Session()
-        detect_obj = {'id': '0', 'proposals': obj['proposals']}
-        if type(obj['pad_img']) == str:
-            detect_obj['img'] = Image.open(obj['pad_img']).convert('RGB')
-        else:
-            detect_obj['img'] = Image.open(io.BytesIO(base64.b64decode(obj['pad_img'].encode('ASCII')))).convert('RGB')
-        detected_objs, softmax_detected_objs = run_inference(model, [detect_obj], model_config, device_str, session)
-        detected_objs = detected_objs['0']
-        softmax_detected_objs = softmax_detected_objs['0']
-        session.close()
-        obj['detected_objs'] = detected_objs
-        obj['softmax_objs'] = softmax_detected_objs
-        with open(pkl_path, 'wb') as wf:
-            pickle.dump(obj, wf)
-        return pkl_path
+        # Pages with cached detections skip inference
+        cached = {}
+        for ind, (obj, _) in enumerate(loaded):
+            cache = page_cache(obj)
+            if cache is not None:
+                hit = cache.get(stage_key(obj, 'detect'))
+                if hit is not None:
+                    cached[str(ind)] = hit
+                    obj.pop('padded_img', None)
+        detect_objs = []
+        for ind, (obj, _) in enumerate(loaded):
+            if str(ind) in cached:
+                continue
+            detect_obj = {'id': str(ind), 'proposals': obj['proposals']}
+            if 'padded_img' in obj:
+                detect_obj['img'] = obj.pop('padded_img')
+            elif type(obj['pad_img']) == str:
+                detect_obj['img'] = Image.open(obj['pad_img']).convert('RGB')
+            else:
+                detect_obj['img'] = Image.open(io.BytesIO(base64.b64decode(obj['pad_img'].encode('ASCII')))).convert('RGB')
+            detect_objs.append(detect_obj)
+        detected_objs, softmax_detected_objs = {}, {}
+        if len(detect_objs) > 0:
+            detected_objs, softmax_detected_objs = run_inference(model, detect_objs, model_config, device_str,
+                                                                 batch_size=dp.batch_size)
+        results = []
+        for ind, (obj, pkl_path) in enumerate(loaded):
+            if str(ind) in cached:
+                obj['detected_objs'], obj['softmax_objs'] = cached[str(ind)]
+            else:
+                obj['detected_objs'] = detected_objs[str(ind)]
+                obj['softmax_objs'] = softmax_detected_objs[str(ind)]
+                cache = page_cache(obj)
+                if cache is not None:
+                    cache.put(stage_key(obj, 'detect'), (obj['detected_objs'], obj['softmax_objs']))
+            results.append(store_page(obj, pkl_path))
+        return results
     except Exception as e:
         logging.error(str(e), exc_info=True)
         raise e
-
-
@@ -2,11 +2,11 @@ from typing import List
 import pandas as pd
 import logging
 import os
-from tqdm import tqdm
-import glob
 import functools
+import itertools
 
-from dask.distributed import Client, progress
+from dask.distributed import Client, progress, as_completed
+from ingest.utils.parquet_io import parquet_parts, write_dataset_part
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.ERROR)
@@ -47,8 +47,9 @@ class Enrich:
     def enrich(self, input_path: str, output_path: str, dataset_id: str,
                threshold: float = 0.8, spans: int = 20):
         """
-        main method -calls all other processing methods and outputs enriched parquet file
-        :param input_path: a directory full of parquets (ingest output) to process
+        main method -calls all other processing methods and outputs enriched parquet file. Workers read, enrich and
+        write their own parquet files, so the data never passes through the driver
+        :param input_path: a directory full of parquets and partitioned parquet datasets (ingest output) to process
         :param output_path: a directory to put the output context enriched parquets
         :param dataset_id: ingest process dataset_id
         :param threshold: float cut off for postprocess table detection score to process as table caption
@@ -56,49 +57,54 @@ class Enrich:
                 if None will use regex to pull out full stop to full stop span around the table label
         """
 
-        for pq in glob.glob(os.path.join(input_path, '*.parquet')):
-            logger.info(f'processing file: {pq}')
-            df = pd.read_parquet(pq)
-            basename = os.path.basename(pq)
-
-            needed_columns = [
-                                'content',
-                                'postprocess_cls',
-                                'postprocess_score'
-                             ]
-
-            if needed_columns_are_in_df(needed_columns, list(df.columns)):
-
-                if dataset_id:
-                    logger.info(f'limit enrichment to dataset id: {dataset_id}')
-                    df = df[df['dataset_id'] == dataset_id]
-
-                # GET ALL DOCUMENTS, LIST OF DFs
-                pdf_names = list(df.pdf_name.unique())
-                single_doc_dfs = []
-
-                logger.info('split ingest output into docs')
-                for name in tqdm(pdf_names):
-                    single_doc_dfs.append(df[df['pdf_name'] == name])
-
-                partial_get_context = functools.partial(Enrich.get_contexts,
-                                                        threshold,
-                                                        spans)
-                logger.info('start enrichment processing')
-                enriched = [self.client.submit(partial_get_context,
-                                               doc_df,
-                                               resources={'process': 1})
-                            for doc_df in single_doc_dfs]
-                progress(enriched)
-                logger.info('collecting all enriched docs')
-                enriched = [e.result() for e in tqdm(enriched)]
-                df = pd.concat(enriched)
-                df = df.reset_index(drop=True)
-
-            else:
-                pass
-
-            df.to_parquet(os.path.join(output_path, basename))
+        # Partitioned datasets are enriched part by part, and written out with the same layout. Each part is read,
+        # enriched and written by a worker. Parts hold whole documents, so no part needs rows from another
+        enrich_part = functools.partial(Enrich.enrich_part,
+                                        dataset_id=dataset_id,
+                                        threshold=threshold,
+                                        spans=spans)
+        logger.info('start enrichment processing')
+        enriched = {self.client.submit(enrich_part, pq, output_path, basename, resources={'process': 1}): pq
+                    for pq, basename in parquet_parts(input_path)}
+        progress(list(enriched))
+        for future in as_completed(enriched):
+            logger.info(f'enriched {enriched[future]}: {future.result()} rows')
+
+    @classmethod
+    def enrich_part(cls, pq, output_path, basename, dataset_id, threshold, spans):
+        """
+        Enrich a single parquet file or part, and write it out - code to run on dask cluster worker
+        :param pq: Path to the parquet file
+        :param output_path: Directory to write the enriched file to
+        :param basename: Path of the enriched file relative to output_path. May be the input file, which is replaced
+        :param dataset_id: ingest process dataset_id
+        :param threshold: float cut off for postprocess table detection score to process as table caption
+        :param spans: number of words each side of label to pull in as context for each table label in content text
+        :return: Number of rows written
+        """
+        df = pd.read_parquet(pq)
+
+        needed_columns = [
+                            'content',
+                            'postprocess_cls',
+                            'postprocess_score'
+                         ]
+
+        if needed_columns_are_in_df(needed_columns, list(df.columns)):
+
+            if dataset_id:
+                logger.info(f'limit enrichment to dataset id: {dataset_id}')
+                df = df[df['dataset_id'] == dataset_id]
+
+            docs = [cls.get_contexts(threshold, spans, doc_df) for _, doc_df in df.groupby('pdf_name', sort=False)]
+            if len(docs) > 0:
+                df = pd.concat(docs)
+            df = df.reset_index(drop=True)
+
+        out = os.path.join(output_path, basename)
+        logger.info(f'outputting data: {out}')
+        write_dataset_part(df, os.path.dirname(out), os.path.basename(out))
+        return len(df)
 
     @classmethod
     def get_contexts(cls, threshold, spans, doc_df):
@@ -109,81 +115,53 @@ class Enrich:
         :param doc_df: input dataframe - one doc of output from ingest pipeline
         :return doc_df: input dataframe with any enriched rows added
         """
-        # disable SettingWithCopyWarning - safe since always over writing original
-        pd.options.mode.chained_assignment = None
-        original_df = doc_df.copy()
-
         label_length = 2
         classes = ['Table', 'Table Caption']
 
         # get first label_length words of every content cell in df if it's classified correctly and scored highly enough
         logger.info('setting table labels')
-        doc_df['table_label'] = [
-                                 ' '.join(content.split()[:label_length])
-                                 if (pp_cls in classes) and (pp_score >= threshold)
-                                 else None
-                                 for content, pp_cls, pp_score in zip(doc_df['content'],
-                                                                      doc_df['postprocess_cls'],
-                                                                      doc_df['postprocess_score'])
-                                ]
-
-        # if table_label series has no values, just return original df
-        if len(doc_df[doc_df["table_label"].astype(bool)]) == 0:
-            return original_df
+        table_labels = [
+            tuple(content.split()[:label_length])
+            if (pp_cls in classes) and (pp_score >= threshold)
+            else None
+            for content, pp_cls, pp_score in zip(doc_df['content'],
+                                                 doc_df['postprocess_cls'],
+                                                 doc_df['postprocess_score'])
+        ]
+
+        # if there are no table labels, just return original df
+        if not any(table_labels):
+            return doc_df
 
         # aggregate all doc words into one list of words
         words = ' '.join(doc_df.content.tolist()).split()
 
-        # mark where each label occurs in list of all doc words
-        doc_df['indices'] = [
-                                [
-                                    j
-                                    for j in range(len(words))
-                                    if table_label == ' '.join(words[j:j + label_length])
-                                ]
-                                for table_label in doc_df['table_label']
-                            ]
-
-        # iterate over list in indices column to extract words before labels in content
+        # index where each label occurs in list of all doc words, in one pass over the words. A label shorter than
+        # label_length can only match the words at the very end of the doc
+        positions = {label: [] for label in table_labels if label}
+        ngrams = itertools.chain(zip(*[words[k:] for k in range(label_length)]),
+                                 (tuple(words[j:]) for j in range(max(len(words) - label_length + 1, 0), len(words))))
+        for j, ngram in enumerate(ngrams):
+            if ngram in positions:
+                positions[ngram].append(j)
+
+        # join the words before and after each occurrence of a row's label into its context
         logger.info('getting semantic context')
-        doc_df['prefix'] = [
-                                [
-                                    ' '.join(words[i - spans:i])
-                                    if i - spans >= 0
-                                    else ' '.join(words[0:i])
-                                    for i in index
-                                ]
-                                for index in doc_df['indices']
-                           ]
-
-        # iterate over list in indices column to extract words after labels in content
-        doc_df['suffix'] = [
-                                [
-                                    ' '.join(words[i+label_length:i+label_length + spans])
-                                    if i+label_length + spans <= len(words)
-                                    else ' '.join(words[i+label_length:len(words)])
-                                    for i in index
-                                ]
-                                for index in doc_df['indices']
-                           ]
-
-        # join prefixes and suffixes together
-        doc_df['context'] = [
-                                [
-                                    prefix[i] + ' ' + suffix[i]
-                                    for i in range(len(prefix))
-                                ]
-                                for prefix, suffix in zip(doc_df['prefix'], doc_df['suffix'])
-                            ]
-
-        # remove rows without context (empty lists)
-        logger.info('removing rows with no semantic context')
-        doc_df = doc_df[doc_df['context'].apply(lambda x: len(x) > 0)]
-
-        # replace content with context as text only
-        logger.info('replace content with context')
-        doc_df['content'] = [' '.join(x) for x in doc_df['context']]
-
-        # append context only df to original df using only original columns
+        rows = []
+        contexts = []
+        for row, label in enumerate(table_labels):
+            if not label or len(positions[label]) == 0:
+                continue
+            context = [
+                ' '.join(words[i - spans:i] if i - spans >= 0 else words[0:i])
+                + ' ' + ' '.join(words[i + label_length:i + label_length + spans])
+                for i in positions[label]
+            ]
+            rows.append(row)
+            contexts.append(' '.join(context))
+
+        # append rows with content replaced by context to original df
         logger.info('append context to original and return')
-        return original_df.append(doc_df.loc[:, list(original_df.columns)])
+        context_df = doc_df.iloc[rows].copy()
+        context_df['content'] = contexts
+        return pd.concat([doc_df, context_df])
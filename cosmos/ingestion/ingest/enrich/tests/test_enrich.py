@@ -1,5 +1,12 @@
+import os
+import tempfile
 from unittest import TestCase
 
+import pandas as pd
+
+from ingest.enrich.enrich import Enrich
+from ingest.utils.parquet_io import read_dataset
+
 
 class TestEnrich(TestCase):
     def test_get_file_structure(self):
@@ -34,3 +41,20 @@ class TestEnrich(TestCase):
 
     def test_export_data(self):
         self.fail()
+
+    def test_enrich_part(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            part = os.path.join(tmp_dir, 'ds.parquet', 'part-00000.parquet')
+            os.makedirs(os.path.dirname(part))
+            pd.DataFrame({'pdf_name': ['a.pdf', 'a.pdf', 'b.pdf'],
+                          'dataset_id': ['ds', 'ds', 'other'],
+                          'content': ['Table 1 results', 'as shown in Table 1 above', 'Table 1 elsewhere'],
+                          'postprocess_cls': ['Table', 'Body Text', 'Table'],
+                          'postprocess_score': [0.9, 0.9, 0.9]}).to_parquet(part)
+            # Enriching a part in place replaces it, and leaves no temporary files behind
+            rows = Enrich.enrich_part(part, tmp_dir, os.path.join('ds.parquet', 'part-00000.parquet'), 'ds', 0.8, 2)
+            self.assertEqual(rows, 3)
+            self.assertEqual(os.listdir(os.path.dirname(part)), ['part-00000.parquet'])
+            df = read_dataset(os.path.join(tmp_dir, 'ds.parquet'))
+            self.assertEqual(df['content'].tolist(), ['Table 1 results', 'as shown in Table 1 above',
+                                                      ' results as shown in above'])
@@ -4,27 +4,32 @@ ingest.py
 Main file for handling ingestion related activities
 """
 import pickle
+import hashlib
 import shutil
 import functools
+import operator
+import itertools
 import json
 import os
+import math
 from PIL import Image
-import io
-import subprocess
-import glob
-from ingest.process_page import propose_and_pad, xgboost_postprocess, rules_postprocess
-from ingest.detect import detect
-from dask.distributed import Client, progress, as_completed
+from ingest.process_page import propose_and_pad, xgboost_postprocess, xgboost_postprocess_pages, rules_postprocess
+from ingest.detect import detect, detect_pages
+from dask.distributed import Client, progress, as_completed, wait
 from ingest.utils.preprocess import resize_png
-from ingest.utils.pdf_helpers import get_pdf_names
-from ingest.utils.pdf_extractor import parse_pdf
+from ingest.utils.pdf_helpers import get_pdf_names, rasterize_pdf
+from ingest.utils.page_io import load_page
+from ingest.utils.parquet_io import parquet_parts, read_dataset, write_dataset_part
+from ingest.utils.ledger import IngestLedger, hash_file
+from ingest.utils.page_cache import PageCache, model_fingerprint
+from ingest.utils.pdf_extractor import parse_pdf, get_page_sizes
+from ingest.enrich.enrich import Enrich
 from ingest.process.ocr.ocr import regroup, pool_text
 from ingest.process.aggregation.aggregate import aggregate_router
 from ingest.process.representation_learning.compute_word_vecs import make_vecs
 import pandas as pd
 import signal
 import logging
-from itertools import islice
 from typing import List
 
 logging.basicConfig(format='%(levelname)s :: %(filename) :: %(funcName)s :: %(asctime)s :: %(message)s', level=logging.WARNING)
@@ -40,13 +45,23 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.ERROR)
 
 
+class TimeOutError(Exception):
+    pass
+
+
+def raise_timeout(var1, var2):
+    raise TimeOutError
+
+
 class Ingest:
     """
     Ingest class
     Handles running the ingestion pipeline
     """
     def __init__(self, scheduler_address, use_semantic_detection=False, client=None,
-                       tmp_dir=None, use_xgboost_postprocess=False, use_rules_postprocess=False):
+                       tmp_dir=None, use_xgboost_postprocess=False, use_rules_postprocess=False,
+                       in_memory_pages=False, detect_batch_pages=1, rasterize_processes=1,
+                       cache_dir=None, cache_size_gb=50, postprocess_batch_pages=1):
         """
         :param scheduler_address: Address to existing Dask scheduler
         :param use_semantic_detection: Whether or not to run semantic detection
@@ -54,6 +69,17 @@ class Ingest:
         :param tmp_dir: Path to temporary directory which intermediate files and images will be written
         :param use_xgboost_postprocess: Whether to use the XGBoost postprocessing model
         :param use_rules_postprocess: Whether to utilize the rules postprocessing, which is specific to scientific docs
+        :param in_memory_pages: If True, page objects are passed between pipeline stages as Dask-resident dicts rather
+                                than rewritten to pickles in tmp_dir after every stage
+        :param detect_batch_pages: Number of pages handed to each detection task. Proposals from these pages are batched
+                                   together on the GPU (batch size is set by DETECT_BATCH_SIZE on the detect workers)
+        :param rasterize_processes: Number of Ghostscript processes each PDF conversion task splits its pages across
+        :param cache_dir: Optional directory, shared by the workers, caching per page results by PDF content hash and
+                          model version, so that PDFs seen before (under any name or dataset) skip proposal, detection
+                          and text pooling. Pages are still rasterized
+        :param cache_size_gb: Size bound of the cache, beyond which the least recently used results are evicted
+        :param postprocess_batch_pages: Number of pages handed to each XGBoost postprocessing task. The objects of these
+                                        pages are featurized into one matrix and classified with a single prediction
         """
         logger.info("Initializing Ingest object")
         self.client = client
@@ -64,6 +90,12 @@ class Ingest:
         self.use_xgboost_postprocess = use_xgboost_postprocess
         self.use_rules_postprocess = use_rules_postprocess
         self.use_semantic_detection = use_semantic_detection
+        self.in_memory_pages = in_memory_pages
+        self.detect_batch_pages = detect_batch_pages
+        self.postprocess_batch_pages = postprocess_batch_pages
+        self.rasterize_processes = rasterize_processes
+        self.cache_dir = cache_dir
+        self.cache_size_gb = cache_size_gb
         self.tmp_dir = tmp_dir
         if tmp_dir is None:
             raise ValueError("tmp_dir must be passed in")
@@ -89,16 +121,28 @@ class Ingest:
                ngram=1,
                enrich=False,
                threshold=0.8,
-               spans=20):
+               spans=20,
+               streaming=False,
+               resume=True):
         """
         Handler for ingestion pipeline.
 
         Given a directory of PDFs, run the cosmos ingestion pipeline. This will identifies page objects, and optionally
         perform aggregations over objects (eg associating tables with table captions in scientific document pipelines)
 
-        By default, a single parquet file will be written, containing each identified page object and its text.
+        By default, a partitioned parquet dataset, {dataset_id}.parquet, will be written, containing each identified page
+        object and its text. The dataset is a directory of part files, each holding the objects of a batch of whole PDFs,
+        written as soon as that batch is through the pipeline.
+
+        If additional aggregations are defined, a partitioned dataset will be written for each defined aggregation, with
+        parts matching the object dataset's parts. A {dataset_id}_manifest.json listing the parts is written last.
 
-        If additional aggregations are defined, a parquet file will be written for each defined aggregation.
+        Progress is recorded in a ledger in tmp_dir, keyed by PDF content hash. A later run with the same tmp_dir,
+        dataset_id, aggregations, settings (semantic detection, postprocessing and OCR options) and models keeps the
+        parts already written, skips their PDFs, writes out PDFs whose pages all finished earlier without running them
+        again, and reruns failed or missing work. Running again over a directory that has grown only ingests the new
+        PDFs. Work recorded under other settings or models is redone. PDFs with the same contents are run through the
+        page pipeline once, and their objects are written under each of their file names.
 
         For additional information on the aggregations and schemas for the output files, see the documentation.
 
@@ -109,98 +153,486 @@ class Ingest:
         :param skip_ocr: If True, PDFs with no metadata associated will be skipped. If False, OCR will be performed
         :param visualize_proposals: Debugging option, will write images with bounding boxes from proposals to tmp
         :param aggregations: List of aggregations to run over resulting objects
+        :param batch_size: Number of pages per batch, and per output part
         :param compute_word_vecs: Whether to compute word vectors over the corpus
         :param ngram: n in ngram for word vecs
         :param enrich: If true run semantic enrichment on ingest output parquets
         :param threshold: postprocess_score threshold for identifying an object for context enrichment
         :param spans: number of words either side of an object coreference to capture for context
+        :param streaming: If True, pages of each PDF start detection as soon as that PDF is converted, with at most
+                          batch_size pages in flight. Otherwise all PDFs are converted before detection starts.
+        :param resume: If False, nothing recorded by earlier runs is reused and every PDF is ingested again
         """
         os.makedirs(images_pth, exist_ok=True)
-        pdfnames = get_pdf_names(pdf_directory)
-        pdf_to_images = functools.partial(Ingest.pdf_to_images, dataset_id, self.images_tmp)
+        outputs = [f'{dataset_id}.parquet'] + [f'{dataset_id}_{aggregation}.parquet' for aggregation in aggregations]
+        fingerprint = self._model_fingerprint()
+        ledger = IngestLedger(os.path.join(self.tmp_dir, 'ingest_ledger.sqlite'), dataset_id,
+                              config=self._run_fingerprint(skip_ocr, fingerprint))
+        # Keep the parts written by earlier runs with the same aggregations and config, and drop anything else in the
+        # outputs
+        reusable = {}
+        if resume:
+            reusable = ledger.written_parts(aggregations)
+            reusable = {part: entry for part, entry in reusable.items()
+                        if entry['rows'] == 0 or os.path.exists(os.path.join(result_path, outputs[0], part))}
+        ledger.drop_parts(reusable)
+        for output in outputs:
+            Ingest.remove_output(os.path.join(result_path, output), keep=reusable)
+        written = ledger.written_names(reusable)
+        # Group the PDFs still to write by contents. The first PDF of each group goes through the pipeline
+        copies = {}
+        for pdf in get_pdf_names(pdf_directory):
+            pdf_hash = ledger.pdf_hash(pdf)
+            if written.get(os.path.basename(pdf)) == pdf_hash:
+                continue
+            copies.setdefault(pdf_hash, []).append(pdf)
+        pdfnames = [pdfs[0] for pdfs in copies.values()]
+        names = {os.path.basename(pdfs[0]): [os.path.basename(pdf) for pdf in pdfs] for pdfs in copies.values()}
+        logger.info(f'{len(pdfnames)} PDFs to ingest, {len(reusable)} parts kept from earlier runs')
+        aggregate_pages = functools.partial(Ingest.aggregate_pages,
+                                            aggregations=list(aggregations),
+                                            write_images_pth=images_pth)
+        write_part = functools.partial(Ingest.write_part,
+                                       dataset_id=dataset_id,
+                                       result_path=result_path,
+                                       aggregations=list(aggregations))
+        part_ids = itertools.count(max([int(part[5:10]) + 1 for part in reusable], default=0))
+
+        def submit_part(pages, page_pdf_names):
+            # Each PDF is aggregated by its own task, and written under the name of every PDF with the same contents.
+            # The part writer only concatenates their results
+            pdf_pages = {}
+            for page, pdf_name in zip(pages, page_pdf_names):
+                pdf_pages.setdefault(pdf_name, []).append(page)
+            pdfs = [self.client.submit(aggregate_pages, pdf_pages[pdf_name], names[pdf_name], resources={'process': 1})
+                    for pdf_name in pdf_pages]
+            part_names = sorted({name for pdf_name in pdf_pages for name in names[pdf_name]})
+            return self.client.submit(write_part, pdfs, next(part_ids), resources={'process': 1}), part_names
+
+        # PDFs whose pages all made it through the page pipeline in an earlier run only need to be written out
+        parts = []
+        finished = [(os.path.basename(pdf), ledger.finished_pages(os.path.basename(pdf)) if resume else None)
+                    for pdf in pdfnames]
+        finished = [(pdf_name, pages) for pdf_name, pages in finished if pages is not None]
+        chunk, chunk_names = [], []
+        for pdf_name, pages in finished:
+            chunk.extend(pages)
+            chunk_names.extend([pdf_name] * len(pages))
+            if len(chunk) >= batch_size:
+                parts.append(submit_part(chunk, chunk_names))
+                chunk, chunk_names = [], []
+        if len(chunk) > 0:
+            parts.append(submit_part(chunk, chunk_names))
+        finished = {pdf_name for pdf_name, _ in finished}
+        pdfnames = [pdf for pdf in pdfnames if os.path.basename(pdf) not in finished]
+
+        pdf_to_images = functools.partial(Ingest.pdf_to_images, dataset_id, self.images_tmp,
+                                          rasterize_processes=self.rasterize_processes,
+                                          cache=self._cache_config(fingerprint))
         logger.info('Starting ingestion. Converting PDFs to images.')
-        images = [self.client.submit(pdf_to_images, pdf, resources={'process': 1}) for pdf in pdfnames]
-        class TimeOutError(Exception):
-            pass
-        def raise_timeout(var1, var2):
-            raise TimeOutError
+        images = {self.client.submit(pdf_to_images, pdf, pdf_hash=ledger.pdf_hash(pdf), resources={'process': 1}):
+                  os.path.basename(pdf) for pdf in pdfnames}
         signal.signal(signal.SIGALRM, raise_timeout)
+        if streaming:
+            logger.info('Streaming converted pages into detection and text extraction')
+            parts.extend(self._stream_pages(images, batch_size, visualize_proposals, skip_ocr, submit_part, ledger))
+        else:
+            parts.extend(self._batch_pages(images, batch_size, visualize_proposals, skip_ocr, submit_part, ledger))
+        logger.info('Waiting on output parts')
+        part_pdfs = dict(parts)
+        for part in as_completed(part_pdfs):
+            if part.status != 'finished':
+                logger.error(f'Writing output part failed, its PDFs are retried on the next run: {part_pdfs[part]}')
+                continue
+            ledger.record_part(aggregations, part.result(), part_pdfs[part])
+        parts = sorted(ledger.written_parts(aggregations).values(), key=lambda entry: entry['part'])
+        parts = [entry for entry in parts if entry['rows'] > 0]
+        if len(parts) == 0:
+            logger.info('No objects found')
+            ledger.close()
+            return
+        manifest = {'dataset_id': dataset_id,
+                    'objects': outputs[0],
+                    'aggregations': dict(zip(aggregations, outputs[1:])),
+                    'parts': parts}
+        with open(os.path.join(result_path, f'{dataset_id}_manifest.json'), 'w') as wf:
+            json.dump(manifest, wf, indent=2)
+        if compute_word_vecs:
+            make_vecs(read_dataset(os.path.join(result_path, outputs[0]), columns=['content']), ngram)
+
+        if enrich:
+            # Parts kept from earlier runs may already be enriched, and enriching them again would duplicate their
+            # context rows
+            logger.info('start enrich process')
+            unenriched = {part: [os.path.join(output, part) for output in outputs
+                                 if os.path.exists(os.path.join(result_path, output, part))]
+                          for part in ledger.unenriched_parts()}
+            done = self.enrich(file_path=result_path,
+                               dataset_id=dataset_id,
+                               threshold=threshold,
+                               spans=spans,
+                               parts=[(os.path.join(result_path, pq), pq) for pqs in unenriched.values() for pq in pqs])
+            ledger.record_enriched([part for part, pqs in unenriched.items() if all(pq in done for pq in pqs)])
+        ledger.close()
+
+    def _model_fingerprint(self):
+        """
+        Results depend on the models loaded by the detect and process workers, so fingerprint both
+        :return: Hex digest over the workers' model fingerprints
+        """
+        fingerprints = []
+        if self.use_semantic_detection:
+            fingerprints.append(self.client.submit(model_fingerprint, pure=False, resources={'GPU': 1}).result())
+        fingerprints.append(self.client.submit(model_fingerprint, pure=False, resources={'process': 1}).result())
+        return hashlib.sha256(':'.join(fingerprints).encode()).hexdigest()
+
+    def _run_fingerprint(self, skip_ocr, fingerprint):
+        """
+        :param skip_ocr: skip_ocr option of the run
+        :param fingerprint: Model fingerprint, as returned by _model_fingerprint
+        :return: Hex digest over the settings that change page results, and the models
+        """
+        settings = {'use_semantic_detection': self.use_semantic_detection,
+                    'use_xgboost_postprocess': self.use_xgboost_postprocess,
+                    'use_rules_postprocess': self.use_rules_postprocess,
+                    'skip_ocr': skip_ocr,
+                    'models': fingerprint}
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+    def _cache_config(self, fingerprint):
+        """
+        Set up the result cache for a run
+        :param fingerprint: Model fingerprint, as returned by _model_fingerprint
+        :return: Cache dict handed to pdf_to_images, or None if caching is off
+        """
+        if self.cache_dir is None:
+            return None
+        logger.info(f'Caching results in {self.cache_dir} under model fingerprint {fingerprint}')
+        return {'path': self.cache_dir,
+                'max_bytes': int(self.cache_size_gb * 1e9),
+                'fingerprint': fingerprint}
+
+    def _submit_pages(self, pages, visualize_proposals, skip_ocr):
+        """
+        Submit the per page pipeline (propose -> detect -> regroup -> pool_text -> postprocess) for a list of pages.
+        Each stage depends only on the previous stage for the same page, so pages move through the pipeline independently.
+        :param pages: List of (tmp_dir, pdf_name, page_num) tuples, as returned by pdf_to_images
+        :param visualize_proposals: Debugging option, will write images with bounding boxes from proposals to tmp
+        :param skip_ocr: If True, pages with no metadata associated will not be OCR'd
+        :return: List of futures, one per page, resolving to the final page pickle path (or page dict if in_memory_pages)
+        """
+        partial_propose = functools.partial(propose_and_pad, visualize=visualize_proposals, in_memory=self.in_memory_pages)
+        chunk = self.client.map(partial_propose, pages, resources={'process': 1}, priority=8)
+        if self.use_semantic_detection:
+            if self.detect_batch_pages > 1:
+                chunk = self._detect_grouped(chunk)
+            else:
+                chunk = self.client.map(detect, chunk, resources={'GPU': 1}, priority=8)
+            chunk = self.client.map(regroup, chunk, resources={'process': 1})
+            pool_text_ocr_opt = functools.partial(pool_text, skip_ocr=skip_ocr)
+            chunk = self.client.map(pool_text_ocr_opt, chunk, resources={'process': 1})
+            if self.use_xgboost_postprocess:
+                if self.postprocess_batch_pages > 1:
+                    chunk = self._map_grouped(xgboost_postprocess_pages, chunk, self.postprocess_batch_pages,
+                                              resources={'process': 1})
+                else:
+                    chunk = self.client.map(xgboost_postprocess, chunk, resources={'process': 1})
+                if self.use_rules_postprocess:
+                    chunk = self.client.map(rules_postprocess, chunk, resources={'process': 1})
+        return chunk
+
+    def _record_pages(self, pages, page_futures, ledger):
+        """
+        Record finished pages in the ledger
+        :param pages: List of (tmp_dir, pdf_name, page_num) tuples
+        :param page_futures: Final page futures of the pages, which must have finished or failed
+        :param ledger: IngestLedger of the run
+        """
+        records = []
+        for (_, pdf_name, page_num), future in zip(pages, page_futures):
+            if future.status == 'finished':
+                # In memory pages are not kept anywhere that outlives the run
+                result = None if self.in_memory_pages else future.result()
+                records.append((pdf_name, page_num, 'done', result or None))
+            else:
+                records.append((pdf_name, page_num, 'failed', None))
+        ledger.record_pages(records)
+
+    def _detect_grouped(self, pages):
+        """
+        Run detection over groups of detect_batch_pages pages per task
+        :param pages: List of page futures
+        :return: List of futures, one per page, in the order given
+        """
+        return self._map_grouped(detect_pages, pages, self.detect_batch_pages, resources={'GPU': 1}, priority=8)
 
+    def _map_grouped(self, func, pages, group_size, **kwargs):
+        """
+        Run a stage over groups of pages, one task per group
+        :param func: Stage function, taking a list of pages and returning a list of results in the same order
+        :param pages: List of page futures
+        :param group_size: Number of pages per task
+        :param kwargs: Further arguments to client.submit, eg resources
+        :return: List of futures, one per page, in the order given
+        """
+        results = []
+        priority = kwargs.get('priority', 0)
+        for i in range(0, len(pages), group_size):
+            group = pages[i:i+group_size]
+            group_future = self.client.submit(func, group, **kwargs)
+            results.extend(self.client.map(operator.getitem, [group_future] * len(group), range(len(group)),
+                                           priority=priority))
+        return results
+
+    def _batch_pages(self, conversions, batch_size, visualize_proposals, skip_ocr, submit_part, ledger):
+        """
+        Wait for every PDF to be converted, then run the page pipeline over the pages in chunks of about batch_size
+        pages. Chunks hold whole PDFs, and each chunk is written out as one part.
+        :param conversions: {pdf_to_images future: pdf_name}
+        :param submit_part: Function submitting a part writing task for a list of pages and the PDF name of each page
+        :param ledger: IngestLedger of the run
+        :return: List of (part future, names of the PDFs in the part)
+        """
         try:
-            for _ in as_completed(images):
+            for _ in as_completed(conversions):
                 signal.alarm(0)
                 signal.alarm(180)
         except TimeOutError:
-            images = [i for i in images if i.status == 'finished']
-            pass
+            dropped = [pdf_name for i, pdf_name in conversions.items() if i.status != 'finished']
+            logger.warning(f'Timed out waiting for PDF conversion, these are retried on the next run: {dropped}')
+            self.client.cancel([i for i in conversions if i.status != 'finished'])
+            conversions = {i: pdf_name for i, pdf_name in conversions.items() if i.status == 'finished'}
         else:
             signal.alarm(0)
         logger.info('Done converting to images. Starting detection and text extraction')
-        images = [i.result() for i in images]
-        images = [i for i in images if i is not None]
-        images_queue = [i for il in images for i in il]
-        images = []
-        iterator = iter(images_queue)
-        while chunk := list(islice(iterator, batch_size)):
-            partial_propose = functools.partial(propose_and_pad, visualize=visualize_proposals)
-            chunk = self.client.map(partial_propose, chunk, resources={'process': 1}, priority=8)
-            if self.use_semantic_detection:
-                chunk = self.client.map(detect, chunk, resources={'GPU': 1}, priority=8)
-                chunk = self.client.map(regroup, chunk, resources={'process': 1})
-                pool_text_ocr_opt = functools.partial(pool_text, skip_ocr=skip_ocr)
-                chunk = self.client.map(pool_text_ocr_opt, chunk, resources={'process': 1})
-                if self.use_xgboost_postprocess:
-                    chunk = self.client.map(xgboost_postprocess, chunk, resources={'process': 1})
-                    chunk = [i for i in chunk if i.result() != '']
-                    if self.use_rules_postprocess:
-                        chunk = self.client.map(rules_postprocess, chunk, resources={'process': 1})
-            progress(chunk)
-            images.extend([i.result() for i in chunk])
-        results = []
-        for i in images:
-            with open(i, 'rb') as rf:
-                obj = pickle.load(rf)
-                for ind, c in enumerate(obj['content']):
-                    bb, cls, text = c
-                    scores, classes = zip(*cls)
-                    scores = list(scores)
-                    classes = list(classes)
-                    postprocess_cls = postprocess_score = None
-                    if 'xgboost_content' in obj:
-                        _, postprocess_cls, _, postprocess_score = obj['xgboost_content'][ind]
-                    final_obj = {'pdf_name': obj['pdf_name'],
-                                 'dataset_id': obj['dataset_id'],
-                                 'page_num': obj['page_num'],
-                                 'img_pth': obj['pad_img'],
-                                 'pdf_dims': list(obj['pdf_limit']),
-                                 'bounding_box': list(bb),
-                                 'classes': classes,
-                                 'scores': scores,
-                                 'content': text,
-                                 'postprocess_cls': postprocess_cls,
-                                 'postprocess_score': postprocess_score
-                                }
-                    results.append(final_obj)
-        if len(results) == 0:
-            logger.info('No objects found')
-            return
-        result_df = pd.DataFrame(results)
+        chunks = [[]]
+        for conversion, pdf_name in conversions.items():
+            pdf_pages = conversion.result()
+            ledger.record_conversion(pdf_name, len(pdf_pages) if pdf_pages else None)
+            if not pdf_pages:
+                continue
+            if len(chunks[-1]) > 0 and len(chunks[-1]) + len(pdf_pages) > batch_size:
+                chunks.append([])
+            chunks[-1].extend(pdf_pages)
+        parts = []
+        for chunk in chunks:
+            if len(chunk) == 0:
+                continue
+            futures = self._submit_pages(chunk, visualize_proposals, skip_ocr)
+            progress(futures)
+            wait(futures)
+            self._record_pages(chunk, futures, ledger)
+            parts.append(self._submit_finished_part(chunk, futures, submit_part))
+        return parts
+
+    def _stream_pages(self, conversions, max_in_flight, visualize_proposals, skip_ocr, submit_part, ledger):
+        """
+        Submit each PDF's pages to the page pipeline as soon as that PDF is converted, so that conversion and detection
+        overlap. At most max_in_flight pages are kept in the pipeline; conversion results are not consumed while
+        the pipeline is full. Whole PDFs are grouped into parts of at least max_in_flight pages as they are submitted,
+        and each part is written as soon as all of its pages are through the pipeline.
+        :param conversions: {pdf_to_images future: pdf_name}
+        :param max_in_flight: Maximum number of pages submitted but not yet finished
+        :param submit_part: Function submitting a part writing task for a list of pages and the PDF name of each page
+        :param ledger: IngestLedger of the run
+        :return: List of (part future, names of the PDFs in the part)
+        """
+        in_flight = as_completed()
+        in_flight_pages = {}
+        parts = []
+        part = None
+        consumed = set()
+
+        def close_part():
+            part['closed'] = True
+            if part['pending'] == 0:
+                parts.append(self._submit_finished_part(part['pages'], part['futures'], submit_part))
+
+        def page_done(future):
+            page, page_part = in_flight_pages.pop(future.key)
+            self._record_pages([page], [future], ledger)
+            page_part['pending'] -= 1
+            if page_part['closed'] and page_part['pending'] == 0:
+                parts.append(self._submit_finished_part(page_part['pages'], page_part['futures'], submit_part))
+
+        def submit_conversion(conversion):
+            nonlocal part
+            consumed.add(conversion)
+            pages = conversion.result()
+            ledger.record_conversion(conversions[conversion], len(pages) if pages else None)
+            if pages:
+                futures = self._submit_pages(pages, visualize_proposals, skip_ocr)
+                if part is None:
+                    part = {'pages': [], 'futures': [], 'pending': 0, 'closed': False}
+                part['pages'].extend(pages)
+                part['futures'].extend(futures)
+                part['pending'] += len(futures)
+                for page, future in zip(pages, futures):
+                    in_flight_pages[future.key] = (page, part)
+                    in_flight.add(future)
+                if len(part['futures']) >= max_in_flight:
+                    close_part()
+                    part = None
+            while in_flight.count() > max_in_flight:
+                page_done(next(in_flight))
+
+        try:
+            for conversion in as_completed(conversions):
+                signal.alarm(0)
+                submit_conversion(conversion)
+                signal.alarm(180)
+        except TimeOutError:
+            dropped = [pdf_name for i, pdf_name in conversions.items() if i.status != 'finished']
+            logger.warning(f'Timed out waiting for PDF conversion, these are retried on the next run: {dropped}')
+            self.client.cancel([i for i in conversions if i.status != 'finished'])
+            # Conversions that finished but were not handed out yet still go through the pipeline
+            for conversion in [i for i in conversions if i.status == 'finished' and i not in consumed]:
+                submit_conversion(conversion)
+        else:
+            signal.alarm(0)
+        if part is not None:
+            close_part()
+        logger.info('Done converting to images. Waiting on remaining pages')
+        for future in in_flight:
+            page_done(future)
+        return parts
+
+    def _submit_finished_part(self, pages, page_futures, submit_part):
+        """
+        Submit the writing of a part whose pages are all through the page pipeline. Pages of PDFs with a failed page
+        are left out, so one failed page does not fail the whole part. Those PDFs are not marked as written, and are
+        run again in full on the next run
+        :param pages: List of (tmp_dir, pdf_name, page_num) tuples
+        :param page_futures: Final page futures of the pages, which must have finished or failed
+        :param submit_part: Function submitting a part writing task for a list of pages and the PDF name of each page
+        :return: (part future, names of the PDFs in the part)
+        """
+        failed = {pdf_name for (_, pdf_name, _), future in zip(pages, page_futures) if future.status != 'finished'}
+        if len(failed) > 0:
+            logger.warning(f'Pages failed, these PDFs are left out of their part and retried on the next run: '
+                           f'{sorted(failed)}')
+        kept = [(future, pdf_name) for (_, pdf_name, _), future in zip(pages, page_futures) if pdf_name not in failed]
+        return submit_part([future for future, _ in kept], [pdf_name for _, pdf_name in kept])
+
+    @staticmethod
+    def page_objects(page, pdf_names=None):
+        """
+        Flatten a final page into one record per detected object
+        :param page: Final page pickle path or page dict
+        :param pdf_names: Names of the PDFs to write the objects under, if not just the page's own PDF. Each name
+                          gets its own copy of the objects
+        :return: List of object dicts
+        """
+        obj, _ = load_page(page)
+        objects = []
+        for ind, c in enumerate(obj['content']):
+            bb, cls, text = c
+            scores, classes = zip(*cls)
+            scores = list(scores)
+            classes = list(classes)
+            postprocess_cls = postprocess_score = None
+            if 'xgboost_content' in obj:
+                _, postprocess_cls, _, postprocess_score = obj['xgboost_content'][ind]
+            final_obj = {'pdf_name': obj['pdf_name'],
+                         'dataset_id': obj['dataset_id'],
+                         'page_num': obj['page_num'],
+                         'img_pth': obj['pad_img'],
+                         'pdf_dims': list(obj['pdf_limit']),
+                         'bounding_box': list(bb),
+                         'classes': classes,
+                         'scores': scores,
+                         'content': text,
+                         'postprocess_cls': postprocess_cls,
+                         'postprocess_score': postprocess_score
+                        }
+            objects.append(final_obj)
+        if pdf_names is not None:
+            objects = [dict(o, pdf_name=pdf_name) for pdf_name in pdf_names for o in objects]
+        return objects
+
+    @staticmethod
+    def objects_frame(objects):
+        """
+        Build the output DataFrame from object records
+        :param objects: List of object dicts, as returned by page_objects
+        :return: DataFrame with one row per object
+        """
+        result_df = pd.DataFrame(objects)
         result_df['detect_cls'] = result_df['classes'].apply(lambda x: x[0])
         result_df['detect_score'] = result_df['scores'].apply(lambda x: x[0])
+        return result_df
+
+    @classmethod
+    def aggregate_pages(cls, pages, pdf_names, aggregations, write_images_pth):
+        """
+        Flatten the final pages of one PDF into objects, and run the aggregations over them
+        :param pages: List of final page pickle paths or page dicts, holding every page of the PDF
+        :param pdf_names: Names of the PDFs (with this PDF's contents) to write the objects under
+        :param aggregations: List of aggregation types
+        :param write_images_pth: Path where aggregation images are written
+        :return: (objects DataFrame, {aggregation: DataFrame}), or None if the pages hold no objects
+        """
+        objects = [o for page in pages if page != '' for o in cls.page_objects(page, pdf_names)]
+        if len(objects) == 0:
+            return None
+        result_df = cls.objects_frame(objects)
+        aggregated = {}
         for aggregation in aggregations:
-            aggregate_df = aggregate_router(result_df, aggregate_type=aggregation, write_images_pth=images_pth)
-            name = f'{dataset_id}_{aggregation}.parquet'
-            aggregate_df.to_parquet(os.path.join(result_path, name), engine='pyarrow', compression='gzip')
-        if compute_word_vecs:
-            make_vecs(result_df, ngram)
-        result_df.to_parquet(os.path.join(result_path, f'{dataset_id}.parquet'), engine='pyarrow', compression='gzip')
+            aggregate_df = aggregate_router(result_df, aggregate_type=aggregation, write_images_pth=write_images_pth)
+            if aggregate_df is not None and len(aggregate_df) > 0:
+                aggregated[aggregation] = aggregate_df
+        return result_df, aggregated
 
-        if enrich:
-            logger.info('start enrich process')
-            self.enrich(file_path=result_path,
-                        dataset_id=dataset_id,
-                        threshold=threshold,
-                        spans=spans)
+    @classmethod
+    def write_part(cls, pdfs, part_id, dataset_id, result_path, aggregations):
+        """
+        Write the objects of a batch of PDFs as one part of the {dataset_id}.parquet dataset, and their aggregations as
+        parts of the {dataset_id}_{aggregation}.parquet datasets
+        :param pdfs: List of aggregate_pages results, one per PDF
+        :param part_id: Id of the part, used in its file name
+        :param dataset_id: The dataset id for this PDF set
+        :param result_path: Output directory holding the datasets
+        :param aggregations: List of aggregation types
+        :return: Manifest entry for the part. Nothing is written if the PDFs hold no objects
+        """
+        name = f'part-{part_id:05d}.parquet'
+        pdfs = [pdf for pdf in pdfs if pdf is not None]
+        if len(pdfs) == 0:
+            return {'part': name, 'rows': 0, 'pdf_names': [], 'aggregations': {}}
+        result_df = pd.concat([result_df for result_df, _ in pdfs], ignore_index=True)
+        entry = {'part': name,
+                 'rows': len(result_df),
+                 'pdf_names': sorted(result_df['pdf_name'].unique().tolist()),
+                 'aggregations': {}}
+        write_dataset_part(result_df, os.path.join(result_path, f'{dataset_id}.parquet'), name)
+        for aggregation in aggregations:
+            aggregate_dfs = [aggregated[aggregation] for _, aggregated in pdfs if aggregation in aggregated]
+            if len(aggregate_dfs) == 0:
+                continue
+            # Rows are in pdf_name order, as an aggregation over the whole part would give
+            aggregate_df = pd.concat(aggregate_dfs, ignore_index=True)
+            aggregate_df = aggregate_df.sort_values('pdf_name', kind='mergesort', ignore_index=True)
+            write_dataset_part(aggregate_df, os.path.join(result_path, f'{dataset_id}_{aggregation}.parquet'), name)
+            entry['aggregations'][aggregation] = len(aggregate_df)
+        return entry
+
+    @staticmethod
+    def remove_output(pth, keep=()):
+        """
+        Remove an earlier output, either a single parquet file or a partitioned dataset
+        :param pth: Output path
+        :param keep: Names of the parts of a partitioned dataset to keep
+        """
+        if os.path.isdir(pth):
+            for name in os.listdir(pth):
+                if name in keep:
+                    continue
+                if os.path.isdir(os.path.join(pth, name)):
+                    shutil.rmtree(os.path.join(pth, name))
+                else:
+                    os.remove(os.path.join(pth, name))
+        elif os.path.exists(pth):
+            os.remove(pth)
 
     @staticmethod
     def needed_columns_are_in_df(to_check: List, to_interrogate: List) -> bool:
@@ -212,60 +644,40 @@ class Ingest:
         else:
             return False
 
-    def enrich(self, file_path: str, dataset_id: str, threshold: float, spans: int):
+    def enrich(self, file_path: str, dataset_id: str, threshold: float, spans: int, parts: List = None):
         """
-        iterate over all ingest output parquets and run distributed context enrichment process
-        :param file_path: a directory full of parquets (ingest output) to process
+        iterate over all ingest output parquets and run distributed context enrichment process. Workers read, enrich
+        and write back their own parquet files, so the data never passes through the driver
+        :param file_path: a directory full of parquets and partitioned parquet datasets (ingest output) to process
         :param dataset_id: ingest process dataset_id
         :param threshold: float cut off for postprocess table detection score to process as table caption
         :param spans: number of words each side of label to pull in as context for each table label in content text
                 if None will use regex to pull out full stop to full stop span around the table label
+        :param parts: Optional list of (parquet file path, path relative to file_path) to enrich, instead of every
+                parquet file under file_path
+        :return: Set of the paths relative to file_path that were enriched. Failed files are logged and left as they were
         """
 
-        for pq in glob.glob(os.path.join(file_path, '*.parquet')):
-            logger.info(f'processing file: {pq}')
-            df = pd.read_parquet(pq)
-            basename = os.path.basename(pq)
-
-            needed_columns = [
-                'content',
-                'postprocess_cls',
-                'postprocess_score'
-            ]
-
-            if Ingest.needed_columns_are_in_df(needed_columns, list(df.columns)):
-
-                if dataset_id:
-                    logger.info(f'limit enrichment to dataset id: {dataset_id}')
-                    df = df[df['dataset_id'] == dataset_id]
-
-                # GET ALL DOCUMENTS, LIST OF DFs
-                all_pdf_names = list(df.pdf_name.unique())
-                single_doc_dfs = []
-
-                logger.info('split ingest output into docs')
-                for name in all_pdf_names:
-                    single_doc_dfs.append(df[df['pdf_name'] == name])
-
-                partial_get_context = functools.partial(Ingest.get_contexts,
-                                                        threshold,
-                                                        spans)
-                logger.info(f'start enrichment processing with doc count {len(single_doc_dfs)}')
-                enriched = [self.client.submit(partial_get_context,
-                                               doc_df,
-                                               resources={'process': 1})
-                            for doc_df in single_doc_dfs]
-                progress(enriched)
-                logger.info('collecting all enriched docs')
-                enriched = [e.result() for e in enriched]
-                df = pd.concat(enriched)
-                logger.info(f'size of df returned from enrichment: {len(df)}')
-                df = df.reset_index(drop=True)
-
-            else:
-                pass
-            logger.info(f'outputting data: {os.path.join(file_path, basename)}')
-            df.to_parquet(os.path.join(file_path, basename))
+        # Partitioned datasets are enriched part by part, each part read, enriched and written back by a worker. Parts
+        # hold whole documents, so no part needs rows from another
+        enrich_part = functools.partial(Enrich.enrich_part,
+                                        dataset_id=dataset_id,
+                                        threshold=threshold,
+                                        spans=spans)
+        if parts is None:
+            parts = parquet_parts(file_path)
+        logger.info(f'start enrichment processing with part count {len(parts)}')
+        enriched = {self.client.submit(enrich_part, pq, file_path, basename, resources={'process': 1}): basename
+                    for pq, basename in parts}
+        progress(list(enriched))
+        done = set()
+        for future in as_completed(enriched):
+            if future.status != 'finished':
+                logger.error(f'enriching {enriched[future]} failed')
+                continue
+            logger.info(f'enriched {enriched[future]}: {future.result()} rows')
+            done.add(enriched[future])
+        return done
 
     @classmethod
     def get_contexts(cls, threshold, spans, doc_df):
@@ -276,17 +688,13 @@ class Ingest:
         :param doc_df: input dataframe - one doc of output from ingest pipeline
         :return doc_df: input dataframe with any enriched rows added
         """
-        # disable SettingWithCopyWarning - safe since always over writing original
-        pd.options.mode.chained_assignment = None
-        original_df = doc_df.copy()
-
         label_length = 2
         classes = ['Table', 'Table Caption']
 
         # get first label_length words of every content cell in df if it's classified correctly and scored highly enough
         logger.info('setting table labels')
-        doc_df['table_label'] = [
-            ' '.join(content.split()[:label_length])
+        table_labels = [
+            tuple(content.split()[:label_length])
             if (pp_cls in classes) and (pp_score >= threshold)
             else None
             for content, pp_cls, pp_score in zip(doc_df['content'],
@@ -294,66 +702,42 @@ class Ingest:
                                                  doc_df['postprocess_score'])
         ]
 
-        # if table_label series has no values, just return original df
-        if len(doc_df[doc_df["table_label"].astype(bool)]) == 0:
-            return original_df
+        # if there are no table labels, just return original df
+        if not any(table_labels):
+            return doc_df
 
         # aggregate all doc words into one list of words
         words = ' '.join(doc_df.content.tolist()).split()
 
-        # mark where each label occurs in list of all doc words
-        doc_df['indices'] = [
-            [
-                j
-                for j in range(len(words))
-                if table_label == ' '.join(words[j:j + label_length])
-            ]
-            for table_label in doc_df['table_label']
-        ]
+        # index where each label occurs in list of all doc words, in one pass over the words. A label shorter than
+        # label_length can only match the words at the very end of the doc
+        positions = {label: [] for label in table_labels if label}
+        ngrams = itertools.chain(zip(*[words[k:] for k in range(label_length)]),
+                                 (tuple(words[j:]) for j in range(max(len(words) - label_length + 1, 0), len(words))))
+        for j, ngram in enumerate(ngrams):
+            if ngram in positions:
+                positions[ngram].append(j)
 
-        # iterate over list in indices column to extract words before labels in content
+        # join the words before and after each occurrence of a row's label into its context
         logger.info('getting semantic context')
-        doc_df['prefix'] = [
-            [
-                ' '.join(words[i - spans:i])
-                if i - spans >= 0
-                else ' '.join(words[0:i])
-                for i in index
+        rows = []
+        contexts = []
+        for row, label in enumerate(table_labels):
+            if not label or len(positions[label]) == 0:
+                continue
+            context = [
+                ' '.join(words[i - spans:i] if i - spans >= 0 else words[0:i])
+                + ' ' + ' '.join(words[i + label_length:i + label_length + spans])
+                for i in positions[label]
             ]
-            for index in doc_df['indices']
-        ]
+            rows.append(row)
+            contexts.append(' '.join(context))
 
-        # iterate over list in indices column to extract words after labels in content
-        doc_df['suffix'] = [
-            [
-                ' '.join(words[i + label_length:i + label_length + spans])
-                if i + label_length + spans <= len(words)
-                else ' '.join(words[i + label_length:len(words)])
-                for i in index
-            ]
-            for index in doc_df['indices']
-        ]
-
-        # join prefixes and suffixes together
-        doc_df['context'] = [
-            [
-                prefix[i] + ' ' + suffix[i]
-                for i in range(len(prefix))
-            ]
-            for prefix, suffix in zip(doc_df['prefix'], doc_df['suffix'])
-        ]
-
-        # remove rows without context (empty lists)
-        logger.info('removing rows with no semantic context')
-        doc_df = doc_df[doc_df['context'].apply(lambda x: len(x) > 0)]
-
-        # replace content with context as text only
-        logger.info('replace content with context')
-        doc_df['content'] = [' '.join(x) for x in doc_df['context']]
-
-        # append context only df to original df using only original columns
+        # append rows with content replaced by context to original df
         logger.info('append context to original and return')
-        return original_df.append(doc_df.loc[:, list(original_df.columns)])
+        context_df = doc_df.iloc[rows].copy()
+        context_df['content'] = contexts
+        return pd.concat([doc_df, context_df])
 
     def write_images_for_annotation(self, pdf_dir, img_dir):
         """
@@ -363,7 +747,8 @@ class Ingest:
         """
         logger.info(f"Converting PDFs to images and writing to target directory: {img_dir}")
         pdfnames = get_pdf_names(pdf_dir)
-        pdf_to_images = functools.partial(Ingest.pdf_to_images, 'na', self.images_tmp)
+        pdf_to_images = functools.partial(Ingest.pdf_to_images, 'na', self.images_tmp,
+                                          rasterize_processes=self.rasterize_processes)
         images = [self.client.submit(pdf_to_images, pdf, resources={'process': 1}) for pdf in pdfnames]
         progress(images)
         images = [i.result() for i in images]
@@ -377,64 +762,91 @@ class Ingest:
         logger.info('Done.')
         shutil.rmtree(self.tmp_dir)
 
-    @classmethod
-    def pdf_to_images(cls, dataset_id, tmp_dir, filename):
+    @staticmethod
+    def _parse_pdf(filename):
         """
-        Convert PDFs to images, and log image-pdf provenance. Writes pickle files that will be handled later.
-        :param dataset_id: Dataset id for this PDF set
-        :param tmp_dir: tmp directory where images and pickle files will be written
+        Parse a PDF's metadata and the size of its pages
         :param filename: Path to PDF file
-        :return: [(tmp_dir, pdf_name, page_num)], list of each pdf and the pages associated with it
+        :return: (meta, limit, page_sizes), or None if the PDF could not be parsed
         """
-        if filename is None:
-            return None
         pdf_name = os.path.basename(filename)
-        limit = None
-
         try:
             meta, limit = parse_pdf(filename)
             logger.debug(f'Limit: {limit}')
         except TypeError as te:
             logger.error(str(te), exc_info=True)
             logger.error(f'Logging TypeError for pdf: {pdf_name}')
-            return []
+            return None
         except Exception as e:
             logger.warning(str(e), exc_info=True)
             logger.warning(f'Logging parsing error for pdf: {pdf_name}')
-            return []
+            return None
         if meta is None or limit is None:
             logger.warning(f'parse_pdf returned None for pdf: {pdf_name}')
-            return []
+            return None
 
-        subprocess.run(['gs', '-dBATCH',
-                        '-dNOPAUSE',
-                        '-sDEVICE=png16m',
-                        '-dGraphicsAlphaBits=4',
-                        '-dTextAlphaBits=4',
-                        '-r600',
-                        f'-sOutputFile="{tmp_dir}/{pdf_name}_%d"',
-                        filename
-                        ], stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+        try:
+            page_sizes = get_page_sizes(filename)
+        except Exception as e:
+            logger.warning(str(e), exc_info=True)
+            logger.warning(f'Logging page size error for pdf: {pdf_name}')
+            return None
+        return meta, limit, page_sizes
+
+    @classmethod
+    def pdf_to_images(cls, dataset_id, tmp_dir, filename, rasterize_processes=1, target_size=1920, cache=None,
+                      pdf_hash=None):
+        """
+        Convert PDFs to images, and log image-pdf provenance. Writes pickle files that will be handled later.
+        :param dataset_id: Dataset id for this PDF set
+        :param tmp_dir: tmp directory where images and pickle files will be written
+        :param filename: Path to PDF file
+        :param rasterize_processes: Number of Ghostscript processes rendering page ranges of the PDF concurrently
+        :param target_size: Size of the long side of the page images
+        :param cache: Optional dict with the path, max_bytes and model fingerprint of a result cache. The PDF's parse
+                      is cached, and its pages carry their cache key so later stages can reuse cached results
+        :param pdf_hash: Content hash of the PDF, if already known. Stored with each page, so that page pickles left in
+                         tmp_dir can be told apart from those of another PDF with the same file name
+        :return: [(tmp_dir, pdf_name, page_num)], list of each pdf and the pages associated with it
+        """
+        if filename is None:
+            return None
+        pdf_name = os.path.basename(filename)
+        if pdf_hash is None:
+            pdf_hash = hash_file(filename)
+        page_cache = None
+        if cache is not None:
+            page_cache = PageCache(cache['path'], cache['max_bytes'])
+            parsed = page_cache.get(('parse', pdf_hash))
+            if parsed is None:
+                parsed = cls._parse_pdf(filename)
+                if parsed is not None:
+                    page_cache.put(('parse', pdf_hash), parsed)
+        else:
+            parsed = cls._parse_pdf(filename)
+        if parsed is None:
+            return []
+        meta, limit, page_sizes = parsed
+        # Render each page straight at the resolution that puts its long side at the target size, rather than at 600 DPI
+        resolutions = [int(math.ceil(target_size * 72 / max(w, h))) for w, h in page_sizes]
+        rendered = rasterize_pdf(filename, os.path.join(tmp_dir, pdf_name), resolutions, processes=rasterize_processes)
+        # Partition the metadata by page once, so each page only carries its own rows
+        page_metas = {page: rows for page, rows in meta.groupby('page')}
+        empty_meta = meta.iloc[0:0]
         objs = []
-        names = glob.glob(f'{tmp_dir}/{pdf_name}_*[0-9]')
-        for image in names:
+        for page_num, rendered_path in rendered:
+            image = f'{tmp_dir}/{pdf_name}_{page_num}'
             try:
-                page_num = int(image.split("_")[-1])
-            except ValueError:
-                raise Exception(f'{image}')
-            with open(image, 'rb') as bimage:
-                bstring = bimage.read()
-            bytesio = io.BytesIO(bstring)
-            try:
-                img = Image.open(bytesio).convert('RGB')
+                img = Image.open(rendered_path).convert('RGB')
             except Exception as e:
                 logger.error(str(e), exc_info=True)
                 logger.error(f'Image opening error pdf: {pdf_name}')
                 return []
 
+            rendered_size = img.size
             orig_w, orig_h = img.size
             meta2 = None
-            img, img_size = resize_png(img, return_size=True)
+            img, img_size = resize_png(img, return_size=True, size=target_size)
             w, h = img_size
             dims = [0, 0, w, h]
             if meta is not None:
@@ -446,18 +858,22 @@ class Ingest:
                 logger.debug(f'Original h: {orig_h}')
                 logger.debug(f'New w: {w}')
                 logger.debug(f'New h: {h}')
-                meta2 = meta.copy()
-                meta2.loc[meta2.page == (page_num-1), 'x1'] = meta2.x1 * scale_w
-                meta2.loc[meta2.page == (page_num-1), 'x2'] = meta2.x2 * scale_w
-                meta2.loc[meta2.page == (page_num-1), 'y1'] = meta2.y1 * scale_h
-                meta2.loc[meta2.page == (page_num-1), 'y2'] = meta2.y2 * scale_h
-                meta2 = meta2.to_dict()
-                meta2 = json.dumps(meta2)
-                meta2 = json.loads(meta2)
-
-            # Convert it back to bytes
-            img.save(image, format='PNG')
-            obj = {'orig_w': orig_w, 'orig_h': orig_h, 'dataset_id': dataset_id, 'pdf_name': pdf_name, 'meta': meta2, 'dims': dims, 'pdf_limit': limit, 'page_num': page_num}
+                meta2 = page_metas.get(page_num-1, empty_meta).assign(x1=lambda df: df.x1 * scale_w,
+                                                                       x2=lambda df: df.x2 * scale_w,
+                                                                       y1=lambda df: df.y1 * scale_h,
+                                                                       y2=lambda df: df.y2 * scale_h)
+                # Store only this page's rows, as plain columnar lists
+                meta2 = {col: meta2[col].tolist() for col in meta2.columns}
+
+            # Ghostscript output at the target resolution usually needs no resize, and can be kept as is
+            if img_size == rendered_size:
+                os.replace(rendered_path, image)
+            else:
+                img.save(image, format='PNG')
+                os.remove(rendered_path)
+            obj = {'orig_w': orig_w, 'orig_h': orig_h, 'dataset_id': dataset_id, 'pdf_name': pdf_name, 'pdf_hash': pdf_hash, 'meta': meta2, 'dims': dims, 'pdf_limit': limit, 'page_num': page_num}
+            if cache is not None:
+                obj['cache'] = dict(cache, page_key=f'{pdf_hash}:{page_num}:{target_size}')
             if tmp_dir is not None:
                 with open(os.path.join(tmp_dir, pdf_name) + f'_{page_num}.pkl', 'wb') as wf:
                     pickle.dump(obj, wf)
@@ -8,6 +8,7 @@ class DetectPlugin(WorkerPlugin):
         self.model_config = os.environ.get("MODEL_CONFIG")
         weights_pth = os.environ.get("WEIGHTS_PTH")
         self.device_str = os.environ.get("DEVICE")
+        self.batch_size = int(os.environ.get("DETECT_BATCH_SIZE", 1))
         self.model = get_model(self.model_config, weights_pth, self.device_str)
 
 @click.command()
@@ -1,14 +1,10 @@
 import pandas as pd
+import numpy as np
 import functools
 from PIL import Image
 import uuid
 import os
-
-
-def check_y_overlap(bb1, bb2):
-    _, x1, _, x2 = bb1
-    _, y1, _, y2 = bb2
-    return y2 >= x1 and x2 >= x1
+from ingest.process.aggregation.layout import as_boxes, associate_captions, reading_order
 
 
 def aggregate_equations(page_group, write_images_pth):
@@ -39,42 +35,22 @@ def aggregate_equations(page_group, write_images_pth):
 
 
 def caption_associate(page_group, caption_class, write_images_pth):
-    captions = []
-    objs = []
-    for ind, p in page_group.iterrows():
-        if p['postprocess_cls'] == caption_class:
-            captions.append(p)
-        else:
-            objs.append(p)
+    is_caption = (page_group['postprocess_cls'] == caption_class).to_numpy()
+    captions = page_group[is_caption]
+    objs = page_group[~is_caption]
+    assigned = associate_captions(as_boxes(captions['bounding_box']), as_boxes(objs['bounding_box']))
     final_objs = []
-    for caption in captions:
-        cbb = caption['bounding_box']
-        tlx, tly, brx, bry = cbb
-        mid_x = (tlx + brx) / 2
-        mid_y = (tly + bry) / 2
-        min_sdist = None
-        min_ind = None
+    for caption_ind, obj_ind in enumerate(assigned):
+        if obj_ind < 0:
+            continue
+        caption = captions.iloc[caption_ind]
+        min_obj = objs.iloc[obj_ind]
         group_obj = {'pdf_name': caption['pdf_name'],
                      'dataset_id': caption['dataset_id'],
                      'caption_content': caption['content'],
                      'caption_page': caption['page_num'],
                      'caption_bb': caption['bounding_box'],
                      'pdf_dims': caption['pdf_dims']}
-        if len(objs) == 0:
-            continue
-        for ind, obj in enumerate(objs):
-            tlx, tly, brx, bry = obj['bounding_box']
-            o_mid_x = (tlx + brx) / 2
-            o_mid_y = (tly + bry) / 2
-            sdist = (mid_x - o_mid_x)**2 + (mid_y-o_mid_y)**2
-            if min_sdist is None:
-                min_sdist = sdist
-                min_ind = ind
-                continue
-            if min_sdist > sdist:
-                min_sdist = sdist
-                min_ind = ind
-        min_obj = objs.pop(min_ind)
         group_obj['content'] = min_obj['content']
         group_obj['obj_page'] = min_obj['page_num']
         group_obj['obj_bbs'] = min_obj['bounding_box']
@@ -86,7 +62,9 @@ def caption_associate(page_group, caption_class, write_images_pth):
         img.save(pth)
         group_obj['img_pth'] = pth
         final_objs.append(group_obj)
-    for obj in objs:
+    unassigned = np.ones(len(objs), dtype=bool)
+    unassigned[assigned[assigned >= 0]] = False
+    for _, obj in objs[unassigned].iterrows():
         img = Image.open(obj['img_pth']).convert('RGB').crop(obj['bounding_box'])
         imgid = uuid.uuid4()
         pth = os.path.join(write_images_pth, f'{imgid}.png')
@@ -108,47 +86,8 @@ def caption_associate(page_group, caption_class, write_images_pth):
 
 
 def order_page(page_group):
-    y_groups = []
-    for ind, p in page_group.iterrows():
-        grouped_flag = False
-        for group in y_groups:
-            for member in group:
-                overlaps = check_y_overlap(p['bounding_box'], member['bounding_box'])
-                if overlaps:
-                    group.append(p)
-                    grouped_flag = True
-                    break
-            if grouped_flag:
-                break
-        if not grouped_flag:
-            y_groups.append([p])
-    sorted_groups = []
-    for group in y_groups:
-        slist = sorted(group, key=lambda x: x['bounding_box'][0])
-        nested_slist = []
-        for obj in slist:
-            grouped_flag = False
-            for sublist in nested_slist:
-                for element in sublist:
-                    if abs(element['bounding_box'][0] - obj['bounding_box'][0]) < 20:
-                        sublist.append(obj)
-                        grouped_flag = True
-                        break
-                if grouped_flag:
-                    break
-            if not grouped_flag:
-                nested_slist.append([obj])
-        internal_sort = []
-        for slist in nested_slist:
-            internal_sort.append(sorted(slist, key=lambda x:x['bounding_box'][1]))
-        sorted_groups.append(internal_sort)
-    sorted_groups = sorted(sorted_groups, key=lambda x: x[0][0]['bounding_box'][1])
-    final_ordering = []
-    for group in sorted_groups:
-        for sublist in group:
-            for element in sublist:
-                final_ordering.append(element)
-    return final_ordering
+    order = reading_order(as_boxes(page_group['bounding_box']))
+    return [page_group.iloc[ind] for ind in order]
 
 
 def group_section(obj_list):
@@ -206,21 +145,11 @@ def aggregate_figures(pdf, write_images_pth):
 
 
 def aggregate_pdf(pdf):
-    pdf_obj = {}
-    content = ''
-    obj_pages = []
-    obj_bbs = []
-    for ind, row in pdf.iterrows():
-        if 'pdf_name' not in pdf_obj:
-            pdf_obj['pdf_name'] = row['pdf_name']
-        if 'dataset_id' not in pdf_obj:
-            pdf_obj['dataset_id'] = row['dataset_id']
-        content += f' {row["content"]}'
-        obj_pages.append(row['page_num'])
-        obj_bbs.append(row['bounding_box'])
-    pdf_obj['content'] = content
-    pdf_obj['obj_pages'] = obj_pages
-    pdf_obj['obj_bbs'] = obj_bbs
+    pdf_obj = {'pdf_name': pdf['pdf_name'].iloc[0],
+               'dataset_id': pdf['dataset_id'].iloc[0]}
+    pdf_obj['content'] = ''.join([f' {content}' for content in pdf['content']])
+    pdf_obj['obj_pages'] = pdf['page_num'].tolist()
+    pdf_obj['obj_bbs'] = pdf['bounding_box'].tolist()
     return pdf_obj
 
 
@@ -0,0 +1,93 @@
+"""
+Page layout helpers for aggregation: caption association and reading order over arrays of bounding boxes
+"""
+import numpy as np
+
+
+def as_boxes(bounding_boxes):
+    """
+    Stack bounding boxes into an array
+    :param bounding_boxes: Iterable of (x1, y1, x2, y2) boxes
+    :return: [N x 4] float array
+    """
+    return np.array([list(bb) for bb in bounding_boxes], dtype=float).reshape(-1, 4)
+
+
+def box_centroids(boxes):
+    """
+    :param boxes: [N x 4] array of (x1, y1, x2, y2) boxes
+    :return: [N x 2] array of (x, y) box centers
+    """
+    return np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2], axis=1)
+
+
+def associate_captions(caption_boxes, obj_boxes):
+    """
+    Greedily pair each caption, in order, with the nearest unclaimed object by squared centroid distance.
+    Ties go to the earliest object.
+    :param caption_boxes: [C x 4] array of caption boxes
+    :param obj_boxes: [O x 4] array of object boxes
+    :return: [C] int array with the index of each caption's object, or -1 if every object was already claimed
+    """
+    assigned = np.full(len(caption_boxes), -1, dtype=int)
+    if len(caption_boxes) == 0 or len(obj_boxes) == 0:
+        return assigned
+    diff = box_centroids(caption_boxes)[:, None, :] - box_centroids(obj_boxes)[None, :, :]
+    sdist = diff[:, :, 0]**2 + diff[:, :, 1]**2
+    for ind in range(min(len(caption_boxes), len(obj_boxes))):
+        obj_ind = int(np.argmin(sdist[ind]))
+        assigned[ind] = obj_ind
+        sdist[:, obj_ind] = np.inf
+    return assigned
+
+
+def assign_bands(boxes):
+    """
+    Group boxes into horizontal bands. In order, each box joins the first band whose lowest bottom edge is at or
+    below the box's top edge, or starts a new band. Boxes with a bottom edge above their top always start a new band.
+    :param boxes: [N x 4] array of (x1, y1, x2, y2) boxes
+    :return: [N] int array of band indices, numbered in order of creation
+    """
+    band = np.empty(len(boxes), dtype=int)
+    band_bottom = np.empty(len(boxes))
+    n_bands = 0
+    for ind, (_, y1, _, y2) in enumerate(boxes):
+        hits = np.flatnonzero(band_bottom[:n_bands] >= y1) if y2 >= y1 else []
+        if len(hits) > 0:
+            band[ind] = hits[0]
+            band_bottom[hits[0]] = max(band_bottom[hits[0]], y2)
+        else:
+            band[ind] = n_bands
+            band_bottom[n_bands] = y2
+            n_bands += 1
+    return band
+
+
+def reading_order(boxes, column_tolerance=20):
+    """
+    Reading order of the boxes on a page. Boxes are grouped into bands (see assign_bands), each band is split into
+    columns of boxes whose left edges are within column_tolerance of their left neighbour, and boxes are read
+    band by band, column by column, top to bottom. Bands are read in order of the top of their first column.
+    :param boxes: [N x 4] array of (x1, y1, x2, y2) boxes
+    :param column_tolerance: Maximum left edge gap between boxes of the same column
+    :return: [N] int array of box indices in reading order
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=int)
+    band = assign_bands(boxes)
+    x1 = boxes[:, 0]
+    y1 = boxes[:, 1]
+    # Stable sorts throughout, so ties keep their input order
+    by_x = np.lexsort((x1, band))
+    band_x = band[by_x]
+    new_col = np.ones(len(boxes), dtype=bool)
+    new_col[1:] = (band_x[1:] != band_x[:-1]) | (np.diff(x1[by_x]) >= column_tolerance)
+    col = np.cumsum(new_col)
+    # Column ids increase with x within a band, so a band's first column has its smallest id
+    band_first_col = np.full(band.max() + 1, len(boxes) + 1)
+    np.minimum.at(band_first_col, band_x, col)
+    band_top = np.full(band.max() + 1, np.inf)
+    first_col = col == band_first_col[band_x]
+    np.minimum.at(band_top, band_x[first_col], y1[by_x][first_col])
+    order = np.lexsort((y1[by_x], col, band_top[band_x]))
+    return by_x[order]
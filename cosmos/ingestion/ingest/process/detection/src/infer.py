@@ -3,7 +3,6 @@ from ingest.process.detection.src.torch_model.model.utils.config_manager import
 import torch
 from ingest.process.detection.src.torch_model.inference.inference import InferenceHelper
 from ingest.process.detection.src.torch_model.inference.data_layer.inference_loader import InferenceLoader
-from ingest.process.detection.src.utils.ingest_images import ImageDB
 import logging
 logger = logging.getLogger(__name__)
 
@@ -21,7 +20,7 @@ def get_model(model_config, weights, device_str):
     model.to(device)
     return model
 
-def run_inference(model, page_objs, model_config, device_str, session):
+def run_inference(model, page_objs, model_config, device_str, batch_size=1):
     """
     Main function to run inference. Writes a bunch of XMLs to out_dir
     :param page_objs: List of page objects
@@ -30,17 +29,12 @@ def run_inference(model, page_objs, model_config, device_str, session):
     :param out_dir: Path to output directory
     :param pdf_name: Name of the pdf
     :param device_str: Device config
+    :param batch_size: Number of proposals per forward pass
     """
     cfg = ConfigManager(model_config)
-    ingest_objs = ImageDB.initialize_and_ingest(page_objs,
-                                                         cfg.WARPED_SIZE,
-                                                         'test',
-                                                         cfg.EXPANSION_DELTA,
-                                                         session)
-    loader = InferenceLoader(ingest_objs, cfg.CLASSES, session)
+    loader = InferenceLoader(page_objs, cfg.WARPED_SIZE, cfg.EXPANSION_DELTA, cfg.CLASSES)
     device = torch.device(device_str)
-    infer_session = InferenceHelper(model, loader, device)
+    infer_session = InferenceHelper(model, loader, device, batch_size=batch_size)
     results, softmax_results = infer_session.run()
-    ImageDB.cleanup(ingest_objs, session)
     return results, softmax_results
 
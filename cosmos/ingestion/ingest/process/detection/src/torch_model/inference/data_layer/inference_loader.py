@@ -2,56 +2,88 @@
 Utilities for loading inference data into the model
 """
 # TODO refactor so xml_loader and inference_loader import from a utilities directory
-from ingest.process.detection.src.utils.ingest_images import load_image, load_proposal, get_example_for_uuid, ImageDB
+from ingest.process.detection.src.utils.ingest_images import load_proposal_obj, unpack_page, get_neighborhoods
 from torch.utils.data import Dataset
 import torch
-import os
-from os.path import splitext
-from ingest.process.detection.src.torch_model.train.data_layer.xml_loader import XMLLoader
-from torchvision.transforms import ToTensor
-from ingest.process.detection.src.torch_model.train.data_layer.transforms import NormalizeWrapper
-from collections import namedtuple
+import io
+from PIL import Image
+from ingest.process.detection.src.torch_model.train.data_layer.xml_loader import XMLLoader, Example, get_colorfulness, get_radii, get_angles
+import logging
+logger = logging.getLogger(__name__)
 
-normalizer = NormalizeWrapper(mean=[0.485, 0.456, 0.406],std=[0.229, 0.224, 0.225])
-tens = ToTensor()
-Document = namedtuple("Document", ["windows", "proposals", "identifier"])
 
-class InferenceLoader(XMLLoader):
+class InferenceLoader(Dataset):
     """
-    Inference dataset object, based on XMLLoader
+    Inference dataset object. Examples and their neighborhoods are held in memory, and items are built the same way
+    as XMLLoader builds them from the DB
     """
 
-    def __init__(self, ingest_objs, classes, session):
+    def __init__(self, page_objs, warped_size, expansion_delta, classes):
         """
         Init function
-        :param session: DB Session
-        :param ingest_objs: Database statistics object
+        :param page_objs: List of page objects, each with an id, proposals, and either an img or padded_bytes
+        :param warped_size: Size to warp proposal windows to
+        :param expansion_delta: Neighborhood expansion parameter
         :param classes: List of classes
         """
-        super().__init__(ingest_objs, classes, session)
+        self.classes = classes
+        self.windows = []
+        self.bboxes = []
+        self.page_ids = []
+        self.neighbors = []
+        for obj in page_objs:
+            if 'img' in obj:
+                image = obj['img']
+            else:
+                image = Image.open(io.BytesIO(obj['padded_bytes']))
+            proposals = load_proposal_obj(obj)
+            if proposals is None or proposals.shape[0] == 0:
+                continue
+            pts, _, _ = unpack_page([image, None, proposals, None], warped_size)
+            offset = len(self.bboxes)
+            bboxes = [pt.ex_proposal for pt in pts]
+            for nbhd in get_neighborhoods(torch.stack(bboxes).tolist(), expansion_delta):
+                self.neighbors.append([offset + n for n in nbhd])
+            self.windows.extend(pt.ex_window for pt in pts)
+            self.bboxes.extend(bboxes)
+            self.page_ids.extend([str(obj['id'])] * len(pts))
+        logger.debug(f"# of proposals:{len(self.bboxes)}")
+
+    def __len__(self):
+        return len(self.bboxes)
 
     @staticmethod
     def collate(batch):
         """
         collation function to be used with this dataset class
         :param batch:
-        :return:
+        :return: XMLLoader batch, list of page ids, [B] tensor of the unpadded neighbor count of each example
         """
-        if len(batch) > 1:
-            raise ValueError(f"Inference classes are only meant to be used with a batch size of 1, got {len(batch)}")
-        example = [batch[0][0]]
-        collated = XMLLoader.collate(example)
-        return collated, batch[0][1]
+        examples = [ex for ex, _ in batch]
+        collated = XMLLoader.collate(examples)
+        neighbor_counts = torch.tensor([len(ex.neighbor_boxes) for ex in examples])
+        return collated, [page_id for _, page_id in batch], neighbor_counts
 
     def __getitem__(self, item):
         """
         Get an item
-        :param item: UUID index
-        :return: XMLLoader exmaple, as well as InferenceLoader example
+        :param item: example index
+        :return: XMLLoader example, as well as the id of the page it came from
         """
-        example = super(InferenceLoader, self).__getitem__(item)
-        uuid = self.uuids[item]
-        ex_db = get_example_for_uuid(uuid, self.session)
-        return example, ex_db
+        window = self.windows[item]
+        bbox = self.bboxes[item]
+        neighbors = self.neighbors[item]
+        colorfulness = get_colorfulness(window)
+        if len(neighbors) == 0:
+            neighbor_boxes = [torch.zeros(4), torch.zeros(4)]
+            neighbor_windows = [torch.zeros(window.shape), torch.zeros(window.shape)]
+            neighbor_radii = torch.tensor([-1*torch.ones(1)] *2)
+            neighbor_angles = neighbor_radii
+        else:
+            neighbor_boxes = [self.bboxes[n] for n in neighbors]
+            neighbor_windows = [self.windows[n] for n in neighbors]
+            neighbor_radii = get_radii(bbox, torch.stack(neighbor_boxes))
+            neighbor_angles = get_angles(bbox, torch.stack(neighbor_boxes))
+        example = Example(bbox, None, window, neighbor_boxes, neighbor_windows, neighbor_radii, neighbor_angles, colorfulness)
+        return example, self.page_ids[item]
 
-#
@@ -9,15 +9,18 @@ import logging
 logger = logging.getLogger(__name__)
 
 class InferenceHelper:
-    def __init__(self, model, dataset, device):
+    def __init__(self, model, dataset, device, batch_size=1):
         """
         initialize an inference object
         :param model: a MMFasterRCNN model, expected to have weights loaded
         :param dataset: an inference_loader dataset
+        :param batch_size: number of proposals to run through the model per forward pass. Proposals may come from
+                           different pages.
         """
         self.model = model
         self.dataset = dataset
         self.device = device
+        self.batch_size = batch_size
         self.cls = [val for val in model.cls_names]
 
     def run(self):
@@ -27,32 +30,34 @@ class InferenceHelper:
         :return:
 
         """
-        loader = DataLoader(self.dataset, batch_size=1, collate_fn=self.dataset.collate)
+        loader = DataLoader(self.dataset, batch_size=self.batch_size, collate_fn=self.dataset.collate)
         pred_dict = defaultdict(list)
         s_pred_dict = defaultdict(list)
         for ex in loader:
-            batch, db_ex = ex
+            batch, page_ids, neighbor_counts = ex
             windows = batch.neighbor_windows.to(self.device)
             ex = batch.center_windows.to(self.device)
-            ex_color = get_colorfulness(ex).to(self.device).reshape(-1,1)
-            radii = get_radii(batch.center_bbs[0],batch.neighbor_boxes[0]).to(self.device).reshape(-1,1)
-            angles = get_angles(batch.center_bbs[0], batch.neighbor_boxes[0]).to(self.device).reshape(-1,1)
-            windows_sub = windows[0]
-            ex_sub = ex[0].unsqueeze(0)
-            rois, cls_scores = self.model(ex_sub, windows_sub,radii, angles, ex_color, batch.center_bbs, self.device)
-            bb = batch.center_bbs[0] 
+            B, M = windows.shape[0], windows.shape[1]
+            neighbor_mask = torch.arange(M).unsqueeze(0) < neighbor_counts.unsqueeze(1)
+            # colorfulness and neighbor geometry are computed per example, exactly as for a batch of one
+            ex_color = torch.stack([get_colorfulness(ex[i].unsqueeze(0)) for i in range(B)]).to(self.device).reshape(-1,1)
+            radii = torch.zeros(B, M)
+            angles = torch.zeros(B, M)
+            for i in range(B):
+                n = int(neighbor_counts[i])
+                radii[i, :n] = get_radii(batch.center_bbs[i], batch.neighbor_boxes[i, :n])
+                angles[i, :n] = get_angles(batch.center_bbs[i], batch.neighbor_boxes[i, :n])
+            rois, cls_scores = self.model.forward_batch(ex, windows, neighbor_mask.to(self.device), radii.to(self.device),
+                                                        angles.to(self.device), ex_color, batch.center_bbs, self.device)
             probs, pred_idxs = torch.sort(cls_scores, dim=1, descending=True)
             sprobs = torch.softmax(probs, dim=1)
-            sprobs = sprobs.tolist()[0]
-            pred_idxs = pred_idxs.tolist()[0]
-            pred_cls = [self.cls[i] for i in pred_idxs]
-            prediction = list(zip(probs.tolist()[0], pred_cls))
-            softmax_prediction = list(zip(sprobs, pred_cls))
-            pred_tuple = (bb.tolist(), prediction)
-            s_pred_tuple = (bb.tolist(), softmax_prediction) 
-            page_id = db_ex.page_id
-            pred_dict[page_id].append(pred_tuple)
-            s_pred_dict[page_id].append(s_pred_tuple)
+            for bb, prob, sprob, idxs, page_id in zip(batch.center_bbs.tolist(), probs.tolist(), sprobs.tolist(),
+                                                       pred_idxs.tolist(), page_ids):
+                pred_cls = [self.cls[i] for i in idxs]
+                prediction = list(zip(prob, pred_cls))
+                softmax_prediction = list(zip(sprob, pred_cls))
+                pred_dict[page_id].append((bb, prediction))
+                s_pred_dict[page_id].append((bb, softmax_prediction))
 
         return pred_dict, s_pred_dict
 
@@ -7,8 +7,6 @@ import torch
 from torch import nn
 from torch.nn.functional import softmax
 
-# TODO this code does not yet support batching
-
 class ScaledDotProductAttention(nn.Module):
     def __init__(self):
         super(ScaledDotProductAttention, self).__init__()
@@ -31,6 +29,24 @@ class ScaledDotProductAttention(nn.Module):
         del weighted_V
         return torch.sum(V, dim=0)
 
+    def forward_batch(self, Q, K, V, mask):
+        """
+        Scaled Dot Product Attention over a batch of examples with differing neighbor counts
+        Q = [B x Dims]
+        K = [N x Dims], the unpadded neighbors of every example, in example order
+        V = [N x H x W x 3]
+        mask = [B x M] bool, True where the example has a neighbor in that slot
+        returns [B x H x W x 3]
+        """
+        _, dim = K.shape
+        example_idx = mask.nonzero(as_tuple=True)[0]
+        logits = Q.new_full(mask.shape, float('-inf'))
+        logits[mask] = torch.sum(Q[example_idx] * K, dim=1) / dim
+        weights = softmax(logits, dim=1)[mask]
+        weighted_V = V * weights.view(-1, *([1] * (V.dim() - 1)))
+        out = V.new_zeros((mask.shape[0],) + V.shape[1:])
+        return out.index_add(0, example_idx, weighted_V)
+
 
 
 class MultiHeadAttention(nn.Module):
@@ -47,3 +63,11 @@ class MultiHeadAttention(nn.Module):
         new_ks = [K_head(K) for K_head in self.K_heads]
         head_results = torch.stack([self.attention(new_qs[i], new_ks[i], V) for i in range(self.nheads)])
         return head_results
+
+    def forward_batch(self, Q, K, V, mask):
+        """
+        Batched forward, see ScaledDotProductAttention.forward_batch for shapes
+        :return: [B x nheads x H x W x 3]
+        """
+        head_results = [self.attention.forward_batch(self.Q_heads[i](Q), self.K_heads[i](K), V, mask) for i in range(self.nheads)]
+        return torch.stack(head_results, dim=1)
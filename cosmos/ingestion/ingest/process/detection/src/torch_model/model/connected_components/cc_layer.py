@@ -1,6 +1,6 @@
-import torch
 from torch import nn
 from .connected_components import get_components
+from ...utils.warp import warp_proposals
 
 
 class CCLayer(nn.Module):
@@ -23,11 +23,10 @@ class CCLayer(nn.Module):
             raise ValueError("The CCLayer does not yet support batches greater than 1")
         proposals_lst = proposals[0]
         proposals_lst = proposals_lst.tolist()
-        windows = [CCLayer.warp(img, p, self.warped_size, device) for p in proposals_lst]
-        windows = [w.get() for w in windows]
-        windows = torch.stack(windows).to(device)
+        windows = warp_proposals(img, proposals_lst, self.warped_size, mean=None).to(device)
         return windows, proposals
 
+    @staticmethod
     def warp(img, proposal,warped_size, device):
         """
         warp an image to a fixed size
@@ -35,12 +34,4 @@ class CCLayer(nn.Module):
         :param proposal:
         :return:
         """
-        from torchvision.transforms import ToPILImage, ToTensor
-        pil = ToPILImage()
-        ten = ToTensor()
-        img = pil(img.squeeze(0))
-        img = img.crop(proposal)
-        img = img.resize((warped_size, warped_size))
-        tens = ten(img)
-        img.close()
-        return tens
+        return warp_proposals(img, [proposal], warped_size, mean=None)[0]
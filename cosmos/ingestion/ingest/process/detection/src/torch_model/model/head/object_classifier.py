@@ -65,3 +65,27 @@ class MultiModalClassifier(nn.Module):
         cls_scores = self.cls_branch(x)
         return cls_scores
 
+    def forward_batch(self, roi_maps, attn_maps, colors):
+        """
+        Batched forward
+        :param roi_maps: [NxDxHxW]
+        :param attn_maps: [N x nheads x D x H x W]
+        :param colors: [Nx1]
+        :return: [N x ncls] class scores
+        """
+        N, D, H, W = roi_maps.shape
+        x = roi_maps.view(N, self.depth * self.width * self.height)
+        attn_maps = attn_maps.reshape(N, self.nheads, self.depth * self.width * self.height)
+        attn_processed = self.attn_FC(attn_maps)
+        x = self.FC(x)
+        x = torch.cat((x.unsqueeze(1), attn_processed), dim=1)
+        x = x.view(N, (self.nheads+1)*self.intermediate)
+        x = torch.cat((x, colors), dim=1)
+        x = self.dropout(x)
+        x = relu(x)
+        x = self.FC_2(x)
+        x = self.dropout(x)
+        x = relu(x)
+        cls_scores = self.cls_branch(x)
+        return cls_scores
+
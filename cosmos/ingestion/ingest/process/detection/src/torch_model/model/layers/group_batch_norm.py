@@ -0,0 +1,39 @@
+"""
+Batch norm with statistics computed per group of examples, so that a batch holding several examples gives each one
+the same output it would get when run on its own
+"""
+from contextlib import contextmanager
+import torch
+from torch import nn
+from torch.nn.functional import batch_norm
+
+
+def group_batch_norm(bn, x, sizes):
+    """
+    Train mode batch norm of x, with the mean and variance computed over each group separately
+    :param bn: BatchNorm2d layer
+    :param x: [N x C x H x W] input, holding each group's rows one after the other
+    :param sizes: List of group sizes, summing to N
+    :return: [N x C x H x W] normalized input
+    """
+    chunks = x.split(sizes)
+    return torch.cat([batch_norm(chunk, None, None, bn.weight, bn.bias, True, 0.0, bn.eps) for chunk in chunks])
+
+
+@contextmanager
+def grouped_batch_norm(module, sizes):
+    """
+    Within the context, BatchNorm2d layers of module that are in train mode normalize each group of the batch
+    separately. Layers in eval mode keep using their running statistics
+    :param module: Module holding BatchNorm2d layers
+    :param sizes: List of group sizes of the batches passed through module. Groups are consecutive rows
+    """
+    sizes = [size for size in sizes if size > 0]
+    layers = [m for m in module.modules() if type(m) == nn.BatchNorm2d and m.training]
+    for m in layers:
+        m.forward = lambda x, m=m: group_batch_norm(m, x, sizes)
+    try:
+        yield
+    finally:
+        for m in layers:
+            del m.forward
@@ -6,6 +6,7 @@ from torch import nn
 from .attention.embedder import ImageEmbedder
 from .attention.transformer import MultiHeadAttention
 from .layers.featurization import Featurizer
+from .layers.group_batch_norm import grouped_batch_norm
 from .head.object_classifier import MultiModalClassifier
 from .utils.config_manager import ConfigManager
 from .utils.shape_utils import get_shape_info
@@ -62,6 +63,32 @@ class MMFasterRCNN(nn.Module):
         cls_scores = self.head(maps, attn_maps,colors, proposals)
         return proposals, cls_scores
 
+    def forward_batch(self, input_windows, neighbor_windows, neighbor_mask, radii, angles, colors, proposals, device):
+        """
+        Process a batch of examples through the network in one pass. Batch norm layers left in train mode (see
+        infer.get_model) normalize each example's windows separately, so the scores match a batch of one
+        :param input_windows: [B x 3 x S x S] target window pixels
+        :param neighbor_windows: [B x M x 3 x S x S] neighbor window pixels, padded to the largest neighborhood
+        :param neighbor_mask: [B x M] bool, True for real (non padding) neighbors
+        :param radii: [B x M] neighborhood embedding radii
+        :param angles: [B x M] neighborhood angle input
+        :param colors: [B x 1] Color input
+        :param proposals: proposals list
+        :param device: Device config
+        :return: proposals, [B x ncls] class scores
+        """
+        B = input_windows.shape[0]
+        with grouped_batch_norm(self.featurizer, [1] * B):
+            maps = self.featurizer(input_windows, device)
+        with grouped_batch_norm(self.featurizer, neighbor_mask.sum(dim=1).tolist()):
+            V = self.featurizer(neighbor_windows[neighbor_mask], device)
+        center = torch.zeros(B, 1).to(device)
+        Q = self.embedder(maps, center, center)
+        K = self.embedder(V, radii[neighbor_mask].reshape(-1,1), angles[neighbor_mask].reshape(-1,1))
+        attn_maps = self.attention.forward_batch(Q, K, V, neighbor_mask)
+        cls_scores = self.head.forward_batch(maps, attn_maps, colors)
+        return proposals, cls_scores
+
  
     def set_weights(self,mean, std):
         '''
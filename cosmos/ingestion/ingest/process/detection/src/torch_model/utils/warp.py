@@ -0,0 +1,83 @@
+"""
+Batched cropping and warping of proposal windows
+"""
+import numpy as np
+import torch
+from torch.nn.functional import interpolate
+
+MEAN = [0.485, 0.456, 0.406]
+STD = [0.229, 0.224, 0.225]
+
+
+def crop(img, box):
+    """
+    Crop a box out of an image tensor. As with a PIL crop, the parts of the box outside the image are black
+    :param img: [C x H x W] tensor
+    :param box: (x1, y1, x2, y2) integer pixel coordinates
+    :return: [C x (y2 - y1) x (x2 - x1)] tensor
+    """
+    x1, y1, x2, y2 = box
+    h, w = img.shape[-2:]
+    if x1 >= 0 and y1 >= 0 and x2 <= w and y2 <= h:
+        return img[:, y1:y2, x1:x2]
+    out = img.new_zeros((img.shape[0], y2 - y1, x2 - x1))
+    ix1, iy1, ix2, iy2 = max(x1, 0), max(y1, 0), min(x2, w), min(y2, h)
+    if ix2 > ix1 and iy2 > iy1:
+        out[:, iy1 - y1:iy2 - y1, ix1 - x1:ix2 - x1] = img[:, iy1:iy2, ix1:ix2]
+    return out
+
+
+def resize_bicubic(window, size):
+    """
+    Resize an 8 bit image the way PIL's bicubic resize does
+    :param window: [C x H x W] uint8 tensor
+    :param size: Size of the square output
+    :return: [C x size x size] float tensor with values in [0, 255]
+    """
+    window = window.unsqueeze(0)
+    if window.device.type == 'cpu':
+        # On the CPU, torch resizes 8 bit images with the same fixed point passes as PIL
+        return interpolate(window.contiguous(), size=(size, size), mode='bicubic', align_corners=False,
+                           antialias=True)[0].float()
+    # Elsewhere the passes are emulated in floating point. Antialiased bicubic interpolation uses PIL's kernel, and PIL
+    # resizes the width and then the height, rounding to 8 bits after each pass
+    window = window.float()
+    for pass_size in [(window.shape[2], size), (size, size)]:
+        window = interpolate(window, size=pass_size, mode='bicubic', align_corners=False, antialias=True)
+        window = window.round().clamp(0, 255)
+    return window[0]
+
+
+def warp_proposals(img, proposals, warped_size, mean=MEAN, std=STD):
+    """
+    Crop every proposal out of a page and resize it to warped_size x warped_size, the way a PIL crop followed by a
+    bicubic resize and ToTensor does, so the windows match the inputs the detector was trained on. The page is
+    converted to a tensor once and the windows are normalized together
+    :param img: PIL image, or [3 x H x W] / [1 x 3 x H x W] tensor with values in [0, 1]. Tensors are first
+                quantized to 8 bits, as ToPILImage would
+    :param proposals: [N x 4] tensor or list of (x1, y1, x2, y2) pixel coordinates. Coordinates are truncated to
+                      integers, matching a PIL crop
+    :param warped_size: Size of the output windows
+    :param mean: Per channel mean to normalize with, or None to skip normalization
+    :param std: Per channel standard deviation to normalize with
+    :return: [N x 3 x warped_size x warped_size] tensor of windows, on the same device as img
+    """
+    if not isinstance(img, torch.Tensor):
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img = torch.from_numpy(np.asarray(img).copy()).permute(2, 0, 1)
+    else:
+        if img.dim() == 4:
+            img = img.squeeze(0)
+        if img.is_floating_point():
+            img = img.mul(255).byte()
+    boxes = torch.as_tensor(proposals, dtype=torch.float64).reshape(-1, 4).trunc().long().tolist()
+    windows = torch.empty((len(boxes), img.shape[0], warped_size, warped_size), device=img.device)
+    for k, box in enumerate(boxes):
+        windows[k] = resize_bicubic(crop(img, box), warped_size)
+    windows = windows / 255
+    if mean is not None:
+        mean = torch.tensor(mean, dtype=windows.dtype, device=windows.device).reshape(1, -1, 1, 1)
+        std = torch.tensor(std, dtype=windows.dtype, device=windows.device).reshape(1, -1, 1, 1)
+        windows = (windows - mean) / std
+    return windows
@@ -1,6 +1,5 @@
 import sqlalchemy
 import numpy as np
-from ingest.process.detection.src.evaluate.evaluate import calculate_iou
 from collections import namedtuple
 import torch
 from PIL import Image
@@ -14,6 +13,7 @@ from uuid import uuid4
 import pickle
 from ingest.process.detection.src.torch_model.utils.matcher import match
 from ingest.process.detection.src.torch_model.utils.bbox import BBoxes
+from ingest.process.detection.src.torch_model.utils.warp import warp_proposals
 from ingest.process.detection.src.torch_model.train.data_layer.sql_types import Example as Ex
 from ingest.process.detection.src.torch_model.train.data_layer.sql_types import Neighbor, Base
 from sqlalchemy import create_engine
@@ -145,15 +145,9 @@ def unpack_page(page, warped_size):
         proposals.change_format("xyxy")
         # proposals = proposals[idxs, :].reshape(-1,4)
         #matches = list(filter(lambda x: x != -1, matches))
-    windows = []
     proposals_lst = proposals.tolist()
-    for idx, proposal in enumerate(proposals_lst):
-        proposal = [int(c) for c in proposal]
-        img_sub = img.crop(proposal)
-        img_sub = img_sub.resize((warped_size, warped_size))
-        img_data = tens(img_sub)
-        img_data = normalizer(img_data)
-        windows.append(img_data)
+    # Each window is cloned out of the batch, so pickling one window does not pickle the whole batch with it
+    windows = [window.clone() for window in warp_proposals(img, proposals_lst, warped_size)]
     # switch to list of tensors
     proposals_lst = [torch.tensor(prop) for prop in proposals_lst]
     match_box_lst = None
@@ -283,6 +277,30 @@ def get_example_for_uuid(uuid, session):
     return ex
 
 
+def get_neighborhoods(bboxes, expansion_delta, orig_size=1920):
+    """
+    Compute the neighborhoods of all examples on a page at once. A neighbor is any other example overlapping the
+    example's box expanded by expansion_delta (and clipped to the image)
+    :param bboxes: [N x 4] array-like of (x1, y1, x2, y2) boxes on the page
+    :param expansion_delta: Neighborhood expansion parameter
+    :param orig_size: original size of the image
+    :return: List of N neighbor index lists, indexing into bboxes
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    nbhd = np.stack([np.maximum(0, bboxes[:, 0] - expansion_delta),
+                     np.maximum(0, bboxes[:, 1] - expansion_delta),
+                     np.minimum(orig_size, bboxes[:, 2] + expansion_delta),
+                     np.minimum(orig_size, bboxes[:, 3] + expansion_delta)], axis=1)
+    # Positive IoU is equivalent to a strictly positive intersection along both axes
+    x_left = np.maximum(nbhd[:, None, 0], bboxes[None, :, 0])
+    y_top = np.maximum(nbhd[:, None, 1], bboxes[None, :, 1])
+    x_right = np.minimum(nbhd[:, None, 2], bboxes[None, :, 2])
+    y_bottom = np.minimum(nbhd[:, None, 3], bboxes[None, :, 3])
+    adjacency = (x_right > x_left) & (y_bottom > y_top)
+    np.fill_diagonal(adjacency, False)
+    return [np.flatnonzero(row).tolist() for row in adjacency]
+
+
 def compute_neighborhoods(partition, expansion_delta, session, orig_size=1920):
     """
     Compute the neighborhoods for a target image and input to DB
@@ -294,21 +312,16 @@ def compute_neighborhoods(partition, expansion_delta, session, orig_size=1920):
     logger.debug('Computing neighborhoods')
     avg_nbhd_size = 0.0
     nbhds = 0.0
-    partition_filter = session.query(Ex).filter(Ex.partition == partition)
-    for ex in partition_filter:
-        orig_bbox = ex.bbox
-        nbhd_bbox = [max(0, orig_bbox[0]-expansion_delta), max(0, orig_bbox[1]-expansion_delta), min(orig_size, orig_bbox[2]+expansion_delta), min(orig_size, orig_bbox[3]+expansion_delta)]
-        # Get all the examples on the same page
-        nbhd = []
-        for page_ex in session.query(Ex).filter(Ex.partition == ex.partition).filter(Ex.page_id == ex.page_id).filter(Ex.object_id != ex.object_id):
-            target_bbox = page_ex.bbox
-            iou = calculate_iou(nbhd_bbox, target_bbox)
-            if iou > 0:
-                nbhr = Neighbor(center_object_id=ex.object_id, neighbor_object_id=page_ex.object_id)
-                nbhd.append(nbhr)
-        nbhds += 1.0
-        avg_nbhd_size += len(nbhd)
-        session.add_all(nbhd)
+    pages = {}
+    for ex in session.query(Ex).filter(Ex.partition == partition):
+        pages.setdefault(ex.page_id, []).append(ex)
+    for page_exs in pages.values():
+        bboxes = [[float(c) for c in ex.bbox] for ex in page_exs]
+        for ex, nbhd_inds in zip(page_exs, get_neighborhoods(bboxes, expansion_delta, orig_size)):
+            nbhd = [Neighbor(center_object_id=ex.object_id, neighbor_object_id=page_exs[n].object_id) for n in nbhd_inds]
+            nbhds += 1.0
+            avg_nbhd_size += len(nbhd)
+            session.add_all(nbhd)
     session.commit()
     logger.debug("=== Done Computing Neighborhoods ===")
     if nbhds != 0.0:
@@ -2,57 +2,82 @@ from dask.distributed import get_worker, Client, progress
 import pandas as pd
 import logging
 import click
-import glob
 import os
+from ingest.utils.parquet_io import parquet_parts
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
+def _linking_plugin():
+    worker = get_worker()
+    dp = None
+    for plg in worker.plugins:
+        if 'Linking' in plg:
+            dp = worker.plugins[plg]
+            break
+    if dp is None:
+        raise Exception('No linking plugin registered')
+    return dp
+
+
+def _linked_ents(linking_result, score_threshold):
+    """
+    Collect the entities of a processed text
+    :param linking_result: spaCy Doc, run through the linking pipeline
+    :param score_threshold: Score above which an entity counts as linked
+    :return: (list of unlinked mention texts, list of linked entity ids), each without repeats
+    """
+    ent_set = set()
+    nonlinked_list = set() # We'll only add one copy of the entity mention per paragraph.
+    for ent in linking_result.ents:
+        linked = False
+        for ent_id, score in ent._.kb_ents:
+            if score > score_threshold:
+                linked = True
+                if ent_id in ent_set:
+                    continue
+                ent_set.add(ent_id)
+            break
+        if not linked:
+            nonlinked_list.add(ent.text)
+
+    ent_set = list(ent_set)
+    nonlinked_list = list(nonlinked_list)
+    return nonlinked_list, ent_set
+
+
 def link(content, score_threshold=0.8):
     try:
-        worker = get_worker()
-        dp = None
-        for plg in worker.plugins:
-            if 'Linking' in plg:
-                dp = worker.plugins[plg]
-                break
-        if dp is None:
-            raise Exception('No linking plugin registered')
-
-        linking_result = dp.nlp(content)
-        ent_set = set()
-        nonlinked_list = set() # We'll only add one copy of the entity mention per paragraph.
-        for ent in linking_result.ents:
-            linked = False
-            for ent_id, score in ent._.kb_ents:
-                if score > score_threshold:
-                    linked = True
-                    if ent_id in ent_set:
-                        continue
-                    ent_set.add(ent_id)
-                break
-            if not linked:
-                nonlinked_list.add(ent.text)
-
-        ent_set = list(ent_set)
-        nonlinked_list = list(nonlinked_list)
-        return nonlinked_list, ent_set
+        dp = _linking_plugin()
+        return _linked_ents(dp.nlp(content), score_threshold)
 
     except Exception as e:
         logger.error(str(e), exc_info=True)
         return (None, None)
 
 
+def link_batch(contents, score_threshold=0.8, batch_size=64):
+    """
+    Link a partition of contents, streaming them through the pipeline with nlp.pipe. The pipe runs in the worker's
+    own process: dask workers are daemonic and cannot start the processes of a multiprocess pipe
+    :param contents: List of content strings
+    :param score_threshold: Score above which an entity counts as linked
+    :param batch_size: Number of texts per nlp.pipe batch
+    :return: List of (unlinked mentions, linked entity ids), one per content, as returned by link
+    """
+    try:
+        dp = _linking_plugin()
+        return [_linked_ents(linking_result, score_threshold)
+                for linking_result in dp.nlp.pipe(contents, batch_size=batch_size)]
+    except Exception as e:
+        # Fall back to linking one content at a time, so a bad content only fails its own row
+        logger.error(str(e), exc_info=True)
+        return [link(content, score_threshold) for content in contents]
+
+
 def construct_linked_kb(eids):
     try:
-        worker = get_worker()
-        dp = None
-        for plg in worker.plugins:
-            if 'Linking' in plg:
-                dp = worker.plugins[plg]
-                break
-        if dp is None:
-            raise Exception('No linking plugin registered')
+        dp = _linking_plugin()
         if eids is None:
             return None
         results = []
@@ -78,38 +103,42 @@ def construct_linked_kb(eids):
 @click.option('--output-path', type=str, help='output directory')
 @click.option('--cluster', type=str, help='Scheduler address of dask cluster')
 @click.option('--dataset-id', type=str, help='dataset id to put in output entities file')
-def run_link(input_path, output_path, cluster, dataset_id):
+@click.option('--partition-size', type=int, default=1000, help='number of contents linked per dask task')
+@click.option('--batch-size', type=int, default=64, help='number of contents per nlp.pipe batch')
+def run_link(input_path, output_path, cluster, dataset_id, partition_size, batch_size):
     logger.info("Setting up client")
     client = Client(cluster, serializers=['msgpack', 'dask'], deserializers=['msgpack', 'dask', 'pickle'])
     logger.info(client)
-    full_ent_set = []
-    # Assumption: The input parquet fits into memory. Will need to switch to dask distributed otherwise
-    for pq in glob.glob(os.path.join(input_path, '*.parquet')):
+    # Linked entity ids across all inputs, without repeats, in order of first appearance
+    full_ent_ids = {}
+    # Assumption: Each input parquet, or each part of a partitioned dataset, fits into memory
+    for pq, basename in parquet_parts(input_path):
         df = pd.read_parquet(pq)
         if len(df) == 0:
             logger.warning(f"{pq} is empty -- skipping.")
             continue
         contents = df['content'].tolist()
-        results = [client.submit(link, c, resources={'linking': 1}) for c in contents]
+        results = [client.submit(link_batch, contents[i:i + partition_size],
+                                 batch_size=batch_size, resources={'linking': 1})
+                   for i in range(0, len(contents), partition_size)]
         progress(results)
-        results = [r.result() for r in results]
+        results = [row for r in results for row in r.result()]
         nonlinked_lists, ent_set = zip(*results)
-        nonlinked_lists = list(nonlinked_lists)
-        ent_set = list(ent_set)
-        ent_set = [list(e) if e is not None or len(e) > 0 else None for e in ent_set]
-        full_ent_set.extend(ent_set)
-        nonlinked_lists = [list(e) for e in nonlinked_lists]
+        ent_set = [list(e) if e is not None else None for e in ent_set]
+        for e in ent_set:
+            if e is not None:
+                full_ent_ids.update(dict.fromkeys(e))
+        nonlinked_lists = [list(e) if e is not None else None for e in nonlinked_lists]
         df['ents_linked'] = ent_set
         df['ents_unlinked'] = nonlinked_lists
-        basename = os.path.basename(pq)
+        os.makedirs(os.path.dirname(os.path.join(output_path, basename)), exist_ok=True)
         df.to_parquet(os.path.join(output_path, basename))
 
     logger.info('Starting entity info extraction')
-    dfs = [client.submit(construct_linked_kb, e, resources={'linking': 1}) for e in full_ent_set]
-    progress(dfs)
-    dfs = [d.result() for d in dfs]
-    dfs = [d for d in dfs if d is not None]
-    dfs = pd.concat(dfs)
+    dfs = client.submit(construct_linked_kb, list(full_ent_ids), resources={'linking': 1}).result()
+    if dfs is None or len(dfs) == 0:
+        logger.warning('No linked entities')
+        return
     dfs.drop_duplicates(inplace=True)
     dfs['aliases'] = dfs.apply(lambda row: list(row['aliases']), axis=1)
     dfs['types'] = dfs.apply(lambda row: list(row['types']), axis=1)
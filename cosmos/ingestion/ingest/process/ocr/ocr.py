@@ -2,86 +2,72 @@
 Run OCR over docs, also merge
 """
 
-import functools
 import json
 import logging
 import pytesseract
 from .group_cls import group_cls
 import pandas as pd
+import numpy as np
 from PIL import Image
-import pickle
-from ingest.process.detection.src.evaluate.evaluate import calculate_iou
+from ingest.utils.page_io import load_page, store_page
+from ingest.utils.page_cache import cached_stage
 
 logging.basicConfig(format='%(levelname)s :: %(filename) :: %(funcName)s :: %(asctime)s :: %(message)s', level=logging.ERROR)
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.ERROR)
 
 
-def regroup(pkl_path):
-    with open(pkl_path, 'rb') as rf:
-        obj = pickle.load(rf)
+def regroup(page):
+    obj, pkl_path = load_page(page)
     l = group_cls(obj['detected_objs'], 'Table', do_table_merge=True, merge_over_classes=['Figure', 'Section Header', 'Page Footer', 'Page Header'])
     obj['detected_objs'] = group_cls(l, 'Figure')
-    with open(pkl_path, 'wb') as wf:
-        pickle.dump(obj, wf)
-    return pkl_path
-
-
-def pool_text(pkl_path, skip_ocr=True):
-    with open(pkl_path, 'rb') as rf:
-        obj = pickle.load(rf)
-    meta_df = obj['meta']
-    detect_objs = obj['detected_objs']
-    if meta_df is not None:
-        text_map = _pool_text_meta(meta_df, obj['dims'][3], detect_objs, obj['page_num'])
-    elif not skip_ocr:
-        text_map = _pool_text_ocr(obj['page_path'], detect_objs)
-    else:
-        text_map = _placeholder_map(detect_objs)
-    obj['content'] = text_map
-    with open(pkl_path, 'wb') as wf:
-        pickle.dump(obj, wf)
-    return pkl_path
-
-
-def check_overlap(b2, row):
-    b1 = (row['x1'], row['y1'], row['x2'], row['y2'])
-    iou = calculate_iou(b1, b2)
-    return iou != 0.0
+    return store_page(obj, pkl_path)
+
+
+def pool_text(page, skip_ocr=True):
+    obj, pkl_path = load_page(page)
+
+    def pool():
+        meta_df = obj['meta']
+        detect_objs = obj['detected_objs']
+        if meta_df is not None:
+            return _pool_text_meta(meta_df, obj['dims'][3], detect_objs, obj['page_num'])
+        elif not skip_ocr:
+            return _pool_text_ocr(obj['page_path'], detect_objs)
+        return _placeholder_map(detect_objs)
+
+    obj['content'] = cached_stage(obj, 'pool_text', pool, skip_ocr)
+    return store_page(obj, pkl_path)
 
 
 def _pool_text_meta(meta_df, height, detect_objs, page_num):
     text_df = pd.DataFrame(meta_df)
     logger.debug(f'Page number: {page_num}')
+    text_df = text_df[text_df['page'] == page_num-1]
     # Switch coordinate systems to bottom left is the origin
-    text_df['y1'] = height - text_df['y1']
-    text_df['y2'] = height - text_df['y2']
-    text_df['y3'] = text_df['y1']
-    text_df['y1'] = text_df['y2']
-    text_df['y2'] = text_df['y3']
+    y1 = height - text_df['y2']
+    y2 = height - text_df['y1']
+    text_df = text_df.assign(y1=y1, y2=y2)
+    # Sorting on several columns is stable, so sorting the page once orders every object's text as sorting its own
+    # lines would
+    text_df = text_df.sort_values(by=['y2', 'x1'])
+    lines = text_df[['x1', 'y1', 'x2', 'y2']].to_numpy(dtype=np.float64)
+    texts = text_df['text'].tolist()
+    bbs = np.array([bb for bb, _ in detect_objs], dtype=np.float64).reshape(-1, 4)
+    # have to feather a bit, pdfs dont have tight bounding boxes usually
+    feathered = bbs + np.array([-10, -10, 10, 10])
+    # [objects x lines] overlap matrix. A nonzero IoU is a strictly positive intersection along both axes
+    x_left = np.maximum(feathered[:, None, 0], lines[None, :, 0])
+    y_top = np.maximum(feathered[:, None, 1], lines[None, :, 1])
+    x_right = np.minimum(feathered[:, None, 2], lines[None, :, 2])
+    y_bottom = np.minimum(feathered[:, None, 3], lines[None, :, 3])
+    overlap = (x_right > x_left) & (y_bottom > y_top)
     pooled = []
-    for dobj in detect_objs:
-        bb, scrs = dobj
+    for (bb, scrs), obj_overlap in zip(detect_objs, overlap):
         bb = tuple(bb)
-        tl_x, tl_y, br_x, br_y = bb
-        # have to feather a bit, pdfs dont have tight bounding boxes usually
-        tl_x -= 10
-        br_x += 10
-        tl_y -= 10
-        br_y += 10
-        go = functools.partial(check_overlap, (tl_x, tl_y, br_x, br_y))
-        text_df['overlap'] = text_df.apply(go, axis=1)
         logger.debug(f'Bounding box: {bb}')
-        df = text_df[text_df['overlap'] == True]
-        logger.debug(f'Overlap: {df[["overlap", "x1", "y1", "x2", "y2", "text"]]}')
-        logger.debug(f'Number of overlaps: {text_df.overlap[text_df.overlap == True].count()}')
-        text_pool = text_df.loc[(text_df['page'] == page_num-1) & (text_df['overlap'] == True)]
-        #text_pool = text_df.loc[(text_df['page'] == page_num-1) & (text_df['x2'] <= br_x) & (text_df['y1'] >= tl_y) &
-        #                        (text_df['x1'] >= tl_x) & (text_df['y2'] <= br_y)]
-        text_pool = text_pool.sort_values(by=['y2', 'x1'])
-        text_pool = ' '.join(text_pool['text'].tolist())
+        text_pool = ' '.join([texts[i] for i in np.flatnonzero(obj_overlap)])
         logger.debug(f'Text pool: {text_pool}')
-        logger.debug('-------')
         pooled.append((bb, scrs, text_pool))
     return pooled
 
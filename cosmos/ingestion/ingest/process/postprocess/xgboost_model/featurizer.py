@@ -1,4 +1,4 @@
-from ingest.process.detection.src.evaluate.evaluate import calculate_iou, match_lists
+from ingest.process.detection.src.evaluate.evaluate import match_lists
 from ingest.process.detection.src.converters.xml2list import xml2list
 import numpy as np
 import os, glob
@@ -9,33 +9,58 @@ import ast
 
 expansion_delta = 50
 orig_size=1920
+fig_pattern = re.compile('^(figure|fig)(?:\.)? (?:(\d+\w+(?:\.)?)|(\d+))', flags=re.IGNORECASE|re.MULTILINE)
+table_pattern = re.compile('^(table|tbl|tab)(?:\.)? (?:(\d+\w+(?:\.)?)|(\d+))', flags=re.IGNORECASE|re.MULTILINE)
 
 def get_width_height(bbox):
     return bbox[2]-bbox[0], bbox[3]-bbox[1]
 
-def compute_neighbors(center, predict_list):
-    center_bbox,_,_ = center
-    nbhds = []
-    for cand in predict_list:
-        if(center != cand):
-            nbhd_bbox,_,_ = cand
-            nbhd_bbox = [max(0, nbhd_bbox[0]-expansion_delta), max(0, nbhd_bbox[1]-expansion_delta), min(orig_size, nbhd_bbox[2]+expansion_delta), min(orig_size, nbhd_bbox[3]+expansion_delta)] 
-            iou = calculate_iou(nbhd_bbox, center_bbox)
-            if iou >0:
-                nbhds.append([cand, iou])
-    return nbhds
-
-def compute_neighbors_train(center, predict_list):
-    center_bbox,_,_,_,_ = center
-    nbhds = []
-    for cand in predict_list:
-        if(center != cand):
-            nbhd_bbox,_,_,_,_ = cand
-            nbhd_bbox = [max(0, nbhd_bbox[0]-expansion_delta), max(0, nbhd_bbox[1]-expansion_delta), min(orig_size, nbhd_bbox[2]+expansion_delta), min(orig_size, nbhd_bbox[3]+expansion_delta)] 
-            iou = calculate_iou(nbhd_bbox, center_bbox)
-            if iou >0:
-                nbhds.append([cand, iou])
-    return nbhds
+def neighbor_mask(centers, predict_list):
+    """
+    Neighborhoods of several objects at once. An object is a neighbor of a center object if it is a different object
+    and its bounding box, expanded by expansion_delta, overlaps the center's bounding box.
+    :param centers: List of objects, each a tuple starting with its bounding box
+    :param predict_list: Every object on the page, in the same form
+    :return: [len(centers) x len(predict_list)] bool array, True where predict_list[j] is a neighbor of centers[i]
+    """
+    center_bb = np.array([center[0] for center in centers], dtype=float).reshape(-1, 4)
+    cand_bb = np.array([cand[0] for cand in predict_list], dtype=float).reshape(-1, 4)
+    nbhd_bb = np.concatenate([np.maximum(0, cand_bb[:, :2] - expansion_delta),
+                              np.minimum(orig_size, cand_bb[:, 2:] + expansion_delta)], axis=1)
+    x_left = np.maximum(nbhd_bb[None, :, 0], center_bb[:, None, 0])
+    y_top = np.maximum(nbhd_bb[None, :, 1], center_bb[:, None, 1])
+    x_right = np.minimum(nbhd_bb[None, :, 2], center_bb[:, None, 2])
+    y_bottom = np.minimum(nbhd_bb[None, :, 3], center_bb[:, None, 3])
+    intersection = (x_right - x_left) * (y_bottom - y_top)
+    nbhd_area = (nbhd_bb[:, 2] - nbhd_bb[:, 0]) * (nbhd_bb[:, 3] - nbhd_bb[:, 1])
+    center_area = (center_bb[:, 2] - center_bb[:, 0]) * (center_bb[:, 3] - center_bb[:, 1])
+    union = nbhd_area[None, :] + center_area[:, None] - intersection
+    # Same test as calculate_iou(nbhd_bbox, center_bbox) > 0
+    mask = (x_right >= x_left) & (y_bottom >= y_top) & (intersection > 0) & (union > 0)
+    # Objects equal to the center (itself, or an exact duplicate) are not neighbors. Only objects with the same
+    # bounding box can be equal, so only those are compared in full
+    same_bb = np.all(center_bb[:, None, :] == cand_bb[None, :, :], axis=2) & mask
+    for i, j in zip(*np.nonzero(same_bb)):
+        if centers[i] == predict_list[j]:
+            mask[i, j] = False
+    return mask
+
+def neighbor_classes(centers, predict_list, class_ids, max_nhds=15):
+    """
+    Class indices of the neighbors of several objects at once
+    :param centers: List of objects, each a tuple starting with its bounding box
+    :param predict_list: Every object on the page, in the same form
+    :param class_ids: [len(predict_list)] array of the class index of each object on the page
+    :param max_nhds: Number of neighbors kept per object
+    :return: [len(centers) x max_nhds] int array. Row i holds the class indices of the first max_nhds neighbors of
+             centers[i], in page order, padded with -1
+    """
+    mask = neighbor_mask(centers, predict_list)
+    rank = np.cumsum(mask, axis=1) - 1
+    rows, cols = np.nonzero(mask & (rank < max_nhds))
+    nbhd_classes = np.full((len(centers), max_nhds), -1, dtype=int)
+    nbhd_classes[rows, rank[rows, cols]] = np.asarray(class_ids, dtype=int)[cols]
+    return nbhd_classes
 
 
 def not_ocr(text):
@@ -81,31 +106,47 @@ def process_html(html_file):
         html_list = process_body(soup)    
         return html_list
 
-def get_feat_vec(predict, predict_list, classes):
-    max_nhds = 15
+def class_index_map(classes):
+    """
+    :param classes: List of class names
+    :return: {class name: index}, for constant time class lookups
+    """
+    return {cls: ind for ind, cls in enumerate(classes)}
+
+def page_class_ids(predict_list, class_index):
+    """
+    :param predict_list: List of (bbox, [(score, class)], text) objects
+    :param class_index: class_index_map of the classes
+    :return: [N] array of the predicted class index of each object
+    """
+    return np.array([class_index[cls_scores[0][1]] for _, cls_scores, _ in predict_list], dtype=int)
+
+def get_feat_vec(predict, predict_list, classes, class_index=None, nbhd_classes=None):
+    """
+    Feature vector of a predicted object
+    :param predict: (bbox, [(score, class)], text) object
+    :param predict_list: Every object on the object's page
+    :param classes: List of class names
+    :param class_index: Optional class_index_map(classes), to avoid rebuilding it for every object
+    :param nbhd_classes: Optional row of neighbor_classes for the object, when computed for the whole page at once
+    :return: List of features
+    """
+    if class_index is None:
+        class_index = class_index_map(classes)
     feat_vec = []
     p_bb, p_cls_scores, text = predict
     p_score, p_cls = p_cls_scores[0]
     
     # Neighborhood features
-    nbhds = compute_neighbors(predict, predict_list)
-    nbhds_sorted = sorted(nbhds, key=lambda nbhds: (nbhds[0]))
-    feat_nbhd1 = []
-    nbhr_count = 1
-    for nbhr in nbhds:
-        nbhr_bb, nbhr_cls_scores, _ = nbhr[0]
-        nbhr_score, nbhr_cls = nbhr_cls_scores[0]
-        feat_nbhd1.append(classes.index(nbhr_cls))
-        if nbhr_count == 15:
-            break
-        nbhr_count += 1
-    feat_nbhd1.extend([-1] * (max_nhds - len(feat_nbhd1)))
+    if nbhd_classes is None:
+        nbhd_classes = neighbor_classes([predict], predict_list, page_class_ids(predict_list, class_index))[0]
+    feat_nbhd1 = nbhd_classes.tolist()
     width, height = get_width_height(p_bb)  
         
-    feat_vec.append(classes.index(p_cls))
+    feat_vec.append(class_index[p_cls])
     feat_vec.append(p_score)
 
-    sorted_cls_scores = sorted(p_cls_scores, key=lambda ele: classes.index(ele[1])) # Predicted Confidence scores of all classes sorted based on classes
+    sorted_cls_scores = sorted(p_cls_scores, key=lambda ele: class_index[ele[1]]) # Predicted Confidence scores of all classes sorted based on classes
     sorted_scores = [row[0] for row in sorted_cls_scores]
     feat_vec.extend(sorted_scores)
     
@@ -117,34 +158,37 @@ def get_feat_vec(predict, predict_list, classes):
     
     #Textual features
     
-    fig_matches = 1 if len(re.findall('^(figure|fig)(?:\.)? (?:(\d+\w+(?:\.)?)|(\d+))', text, flags=re.IGNORECASE|re.MULTILINE)) > 0 else 0
-    table_matches = 1 if len(re.findall('^(table|tbl|tab)(?:\.)? (?:(\d+\w+(?:\.)?)|(\d+))', text, flags=re.IGNORECASE|re.MULTILINE)) > 0 else 0  
+    fig_matches = 1 if fig_pattern.search(text) is not None else 0
+    table_matches = 1 if table_pattern.search(text) is not None else 0
     feat_vec.append(fig_matches)
     feat_vec.append(table_matches)
    
     return feat_vec
 
-def get_feat_vec_train(predict, predict_list, classes):
-    max_nhds = 15
+def get_feat_vec_train(predict, predict_list, classes, class_index=None, nbhd_classes=None):
+    """
+    Feature vector of an object parsed from training html
+    :param predict: (bbox, cls_scores, score, class, text) object, as returned by process_html
+    :param predict_list: Every object on the object's page
+    :param classes: List of class names
+    :param class_index: Optional class_index_map(classes)
+    :param nbhd_classes: Optional row of neighbor_classes for the object, when computed for the whole page at once
+    :return: List of features
+    """
+    if class_index is None:
+        class_index = class_index_map(classes)
     feat_vec = []    
     p_bb, cls_scores, p_score, p_cls, text = predict
     
     # Neighbhorhood features
-    nbhds = compute_neighbors_train(predict, predict_list)
-    if len(nbhds) > max_nhds:
-        max_nhds = len(nbhds)
-    nbhds_sorted = sorted(nbhds, key=lambda nbhds: (nbhds[0]))
-    feat_nbhd1 = []
-    for nbhd in nbhds:
-        nbhd_bb, cls_scores, nbhd_score, nbhd_cls, _ = nbhd[0]
-        nbhd_score = 0.1
-        nbhd_bb = tuple(nbhd_bb)
-        feat_nbhd1.append(classes.index(nbhd_cls))
-    feat_nbhd1.extend([-1] * (15 - len(feat_nbhd1)))
+    if nbhd_classes is None:
+        class_ids = [class_index[cand[3]] for cand in predict_list]
+        nbhd_classes = neighbor_classes([predict], predict_list, class_ids)[0]
+    feat_nbhd1 = nbhd_classes.tolist()
 
     width, height = get_width_height(p_bb)  
         
-    feat_vec.append(classes.index(p_cls))
+    feat_vec.append(class_index[p_cls])
     feat_vec.append(p_score)
 
     feat_vec.extend(ast.literal_eval(cls_scores))
@@ -157,14 +201,30 @@ def get_feat_vec_train(predict, predict_list, classes):
 
     #Textual features
     
-    fig_matches = 1 if len(re.findall('^(figure|fig)(?:\.)? (?:(\d+\w+(?:\.)?)|(\d+))', str(text), flags=re.IGNORECASE|re.MULTILINE)) > 0 else 0
-    table_matches = 1 if len(re.findall('^(table|tbl|tab)(?:\.)? (?:(\d+\w+(?:\.)?)|(\d+))', str(text), flags=re.IGNORECASE|re.MULTILINE)) > 0 else 0 
+    fig_matches = 1 if fig_pattern.search(str(text)) is not None else 0
+    table_matches = 1 if table_pattern.search(str(text)) is not None else 0
     feat_vec.append(fig_matches)
     feat_vec.append(table_matches)   
    
     return feat_vec      
 
 
+def page_feat_vecs_train(predict_list, classes, class_index):
+    """
+    Feature vectors of every object parsed from a training html page, with the page's neighborhoods computed at once
+    :param predict_list: List of (bbox, cls_scores, score, class, text) objects, as returned by process_html
+    :param classes: List of class names
+    :param class_index: class_index_map(classes)
+    :return: List of feature vectors
+    """
+    if len(predict_list) == 0:
+        return []
+    class_ids = [class_index[predict[3]] for predict in predict_list]
+    nbhd_classes = neighbor_classes(predict_list, predict_list, class_ids)
+    return [get_feat_vec_train(predict, predict_list, classes, class_index, nbhd)
+            for predict, nbhd in zip(predict_list, nbhd_classes)]
+
+
 def get_target(predict, list_map, classes):
     p_bb,_ , p_score, p_cls,_ = predict
     p_score = 0.1
@@ -177,15 +237,42 @@ def get_target(predict, list_map, classes):
     return classes.index(gt_cls)
 
 
+def page_feat_vecs(predict_list, classes, class_index):
+    """
+    Feature vectors of every object on a page, with the page's neighborhoods computed at once
+    :param predict_list: List of (bbox, [(score, class)], text) objects
+    :param classes: List of class names
+    :param class_index: class_index_map(classes)
+    :return: List of feature vectors
+    """
+    if len(predict_list) == 0:
+        return []
+    nbhd_classes = neighbor_classes(predict_list, predict_list, page_class_ids(predict_list, class_index))
+    return [get_feat_vec(predict, predict_list, classes, class_index, nbhd)
+            for predict, nbhd in zip(predict_list, nbhd_classes)]
+
+
 def load_data_objs(predict_list, classes):
-    features = []
-    for predict in predict_list:
-        features.append(get_feat_vec(predict, predict_list, classes))
-    f = np.asarray(features)
+    f = np.asarray(page_feat_vecs(predict_list, classes, class_index_map(classes)))
     return f
 
 
+def load_data_pages(page_objs, classes):
+    """
+    Featurize the objects of several pages into a single matrix
+    :param page_objs: List of pages, each a list of (bbox, [(score, class)], text) objects
+    :param classes: List of class names
+    :return: ([N x F] feature matrix over every object of every page, in order, [number of objects on each page])
+    """
+    class_index = class_index_map(classes)
+    features = [feat_vec for predict_list in page_objs
+                for feat_vec in page_feat_vecs(predict_list, classes, class_index)]
+    counts = [len(predict_list) for predict_list in page_objs]
+    return np.asarray(features, dtype=float), counts
+
+
 def load_data_train(input_dir, classes):
+    class_index = class_index_map(classes)
     features = []
     targets = []
     for f in glob.glob(os.path.join(input_dir, "html/*.html")):
@@ -195,16 +282,18 @@ def load_data_train(input_dir, classes):
         target_list = xml2list(target_path)
 
         list_map = match_lists(predict_list, target_list)
-        for predict in predict_list:
+        feat_vecs = page_feat_vecs_train(predict_list, classes, class_index)
+        for predict, feat_vec in zip(predict_list, feat_vecs):
             target = get_target(predict, list_map, classes)
             if target == -1:
                 continue
             targets.append(target)
-            features.append(get_feat_vec_train(predict, predict_list, classes))
+            features.append(feat_vec)
     return np.array(features), np.array(targets)
 
 #Use this function to load data for training the model
 def load_data(input_dir, classes):
+    class_index = class_index_map(classes)
     features = []
     targets = []
     for f in glob.glob(os.path.join(input_dir, "html/*.html")):
@@ -214,11 +303,12 @@ def load_data(input_dir, classes):
         target_list = xml2list(target_path)
 
         list_map = match_lists(predict_list, target_list)
-        for predict in predict_list:
+        feat_vecs = page_feat_vecs_train(predict_list, classes, class_index)
+        for predict, feat_vec in zip(predict_list, feat_vecs):
             target = get_target(predict, list_map, classes)
             if target == -1:
                 continue
             targets.append(target)
-            features.append(get_feat_vec_train(predict, predict_list, classes))
+            features.append(feat_vec)
     return np.array(features), np.array(targets)
 
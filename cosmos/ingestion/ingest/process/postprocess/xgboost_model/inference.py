@@ -1,4 +1,4 @@
-from ingest.process.postprocess.xgboost_model.featurizer import load_data_objs
+from ingest.process.postprocess.xgboost_model.featurizer import load_data_objs, load_data_pages
 import yaml
 import joblib
 import xgboost
@@ -25,3 +25,30 @@ def run_inference(model, classes, page_objs):
     pred_cls = [classes[p] for p in pred_idxs]
     return list(zip(p_bb, pred_cls, texts, pred_scores))
 
+
+def run_inference_pages(model, classes, pages):
+    """
+    Postprocess the objects of several pages with a single prediction over one feature matrix
+    :param model: Postprocessing classifier
+    :param classes: List of class names
+    :param pages: List of pages, each a list of (bbox, [(score, class)], text) objects
+    :return: List of pages, each a list of (bbox, class, text, score) objects
+    """
+    features, counts = load_data_pages(pages, classes)
+    if len(features) == 0:
+        return [[] for _ in pages]
+    prob = model.predict_proba(features)
+
+    pred_scores = np.max(prob, axis=1).tolist()
+    pred_cls = [classes[p] for p in np.argmax(prob, axis=1)]
+    results = []
+    start = 0
+    for page_objs, count in zip(pages, counts):
+        end = start + count
+        if count == 0:
+            results.append([])
+        else:
+            p_bb, _, texts = zip(*page_objs)
+            results.append(list(zip(p_bb, pred_cls[start:end], texts, pred_scores[start:end])))
+        start = end
+    return results
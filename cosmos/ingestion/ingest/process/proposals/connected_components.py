@@ -14,34 +14,21 @@ def balance_margins(bmap, img):
     :param img: Map of original image (np nd array)
     :return: Adjusted bmap, Adjusted img, left margin difference (must adjust downstream)
     """
-    img_height = bmap.shape[0]
-    zero_col = np.zeros(img_height)
-    left_w, right_w = 0, 0
-    stop_left, stop_right = False, False
-    for i in range(1, bmap.shape[1]):
-        left = bmap[:, i]
-        right = bmap[:, bmap.shape[1]-i]
-        if not (left == zero_col).all():
-            stop_left = True
-        if not (right == zero_col).all():
-            stop_right = True
-        if stop_left and stop_right:
-            diff = abs(left_w - right_w)
-            if left_w < right_w:
-                img = img[:, :bmap.shape[1]-diff, :]
-                bmap = bmap[:, :bmap.shape[1]-diff]
-            else:
-                img = img[:, diff:, :]
-                bmap = bmap[:, diff:]
-            break
-        elif stop_left:
-            right_w += 1
-        elif stop_right:
-            left_w += 1
-        else:
-            right_w += 1
-            left_w += 1
-    l_diff = left_w - right_w if left_w > right_w else 0
+    width = bmap.shape[1]
+    # Margins are measured from column 1 on the left and column width-1 on the right
+    filled_cols = np.flatnonzero(bmap[:, 1:].any(axis=0)) + 1
+    if len(filled_cols) == 0:
+        return bmap, img, 0
+    left_w = filled_cols[0] - 1
+    right_w = width - filled_cols[-1] - 1
+    diff = abs(left_w - right_w)
+    if left_w < right_w:
+        img = img[:, :width-diff, :]
+        bmap = bmap[:, :width-diff]
+    else:
+        img = img[:, diff:, :]
+        bmap = bmap[:, diff:]
+    l_diff = int(left_w - right_w) if left_w > right_w else 0
     return bmap, img, l_diff
 
 
@@ -52,29 +39,23 @@ def get_blank_rows(inp_np, blank_row_h):
     :param blank_row_h: Blank row height
     :return: [integer denoting separation locations via y axis]
     """
-    blank_row = np.zeros((blank_row_h, inp_np.shape[1]))
-    curr_top = 0
-    curr_bot = blank_row_h
+    # Windows of blank_row_h rows start at every top in [0, n_windows)
+    n_windows = inp_np.shape[0] - 1 - blank_row_h
+    if n_windows <= 0:
+        return []
+    # A window is blank if the row projection profile has no filled rows in it
+    filled = np.concatenate([[0], np.cumsum(inp_np.any(axis=1))])
+    blank = filled[blank_row_h:blank_row_h+n_windows] == filled[:n_windows]
     white_rows = []
-    while curr_bot < inp_np.shape[0]-1:
-        sub_img = inp_np[curr_top:curr_bot, :]
-        if (sub_img == blank_row).all():
-            if len(white_rows) == 0:
-                white_rows.append(curr_bot)
-                curr_top += 1
-                curr_bot = curr_top + blank_row_h
-                continue
-            last_white_bot = white_rows[len(white_rows)-1]
-            if last_white_bot >= curr_top:
-                white_rows[len(white_rows)-1] = curr_bot
-            else:
-                white_rows.append(curr_bot)
-        elif curr_top == 0:
-            white_rows.append(0)
-        elif curr_bot == inp_np.shape[0]-2:
-            white_rows.append(inp_np.shape[0]-1)
-        curr_top += 1
-        curr_bot = curr_top + blank_row_h
+    if not blank[0]:
+        white_rows.append(0)
+    blank_tops = np.flatnonzero(blank)
+    if len(blank_tops) > 0:
+        # Blank windows whose tops are at most blank_row_h apart merge into one band, which ends at its last window
+        band_ends = np.append(np.diff(blank_tops) > blank_row_h, True)
+        white_rows.extend((blank_tops[band_ends] + blank_row_h).tolist())
+    if n_windows > 1 and not blank[-1]:
+        white_rows.append(inp_np.shape[0]-1)
     return white_rows
 
 def get_proposals(img, white_thresh=245, blank_row_height=15, filter_thres=5, min_col_width=50):
@@ -86,19 +67,10 @@ def get_proposals(img, white_thresh=245, blank_row_height=15, filter_thres=5, mi
     :param blank_row_height: row height parameter
     :param filter_thres: Filter object size threshold parameter
     """
-    def remove_fn(x):
-        if x > white_thresh:
-            return 0
-        return 255
     img_np = np.array(img.convert('RGB'))
-    bmap_np = np.array(img.convert('L').point(remove_fn, mode='1')).astype(np.uint8)
+    bmap_np = (np.array(img.convert('L')) <= white_thresh).astype(np.uint8)
 
-    img_np_orig = img_np
     bmap_np, img_np, left_shave = balance_margins(bmap_np, img_np)
-    img_height = bmap_np.shape[0]
-    num_sections = int(img_height / blank_row_height)
-    blank_row = np.zeros((blank_row_height, bmap_np.shape[1]))
-    curr_top = 0
     white_rows = get_blank_rows(bmap_np, blank_row_height)
     rows = []
     for i in range(len(white_rows)-1):
@@ -168,15 +140,15 @@ def get_proposals(img, white_thresh=245, blank_row_height=15, filter_thres=5, mi
                 rows2.append((b[curr:nxt, :], curr, nxt))
             for r, c2, n in rows2:
                 # Replacing components with finding the proper pixel vals
-                one_inds = np.argwhere(r)
-                if len(one_inds) == 0:
+                filled_rows = np.flatnonzero(r.any(axis=1))
+                if len(filled_rows) == 0:
                     continue
-                h_one_inds = np.hsplit(one_inds, 2)
+                filled_cols = np.flatnonzero(r.any(axis=0))
 
-                x1 = int(np.min(h_one_inds[1]))
-                y1 = int(np.min(h_one_inds[0]))
-                x2 = int(np.max(h_one_inds[1]))
-                y2 = int(np.max(h_one_inds[0]))
+                x1 = int(filled_cols[0])
+                y1 = int(filled_rows[0])
+                x2 = int(filled_cols[-1])
+                y2 = int(filled_rows[-1])
 
                 key = (num_cols, column_index)
                 val = (top_coord + c2 + y1, c[0] + x1, top_coord + c2 + y2, c[0]+x2)
@@ -226,9 +198,7 @@ def get_columns_for_row(row):
         for i in range(1, c):
             test_points.append(int(row_w / c * i))
         def mark_empty_block(p):
-            block = row[:, p-half_test_width:p+half_test_width]
-            test_col = np.zeros((block.shape[0], block.shape[1]))
-            return (block == test_col).all()
+            return not row[:, p-half_test_width:p+half_test_width].any()
         test_blocks = [mark_empty_block(p) for p in test_points]
         if False not in test_blocks:
             curr_c = c
@@ -7,10 +7,11 @@ from PIL import Image
 from ingest.utils.visualize import write_regions
 from ingest.process.proposals.connected_components import get_proposals
 from ingest.process.detection.src.preprocess import pad_image
-from ingest.process.postprocess.xgboost_model.inference import run_inference as postprocess
+from ingest.process.postprocess.xgboost_model.inference import run_inference_pages as postprocess_pages
 from ingest.process.postprocess.pp_rules import apply_rules as postprocess_rules
+from ingest.utils.page_io import load_page, store_page
+from ingest.utils.page_cache import cached_stage
 from dask.distributed import get_worker
-import pickle
 import logging
 logging.basicConfig(format='%(levelname)s :: %(asctime)s :: %(message)s', level=logging.INFO)
 logging.getLogger("pdfminer").setLevel(logging.DEBUG)
@@ -19,23 +20,20 @@ logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
-def propose_and_pad(obj, visualize=False):
+def propose_and_pad(obj, visualize=False, in_memory=False):
+    """
+    Propose regions and pad the page image
+    :param obj: (tmp_dir, pdf_name, page_num) tuple, as returned by pdf_to_images
+    :param visualize: Debugging option, will write images with bounding boxes from proposals to tmp
+    :param in_memory: If True, return the page dict (with the padded image attached) instead of writing it back
+    :return: Path to the page pickle, or the page dict if in_memory
+    """
     tmp_dir, pdf_name, page_num = obj
     pkl_path = f'{os.path.join(tmp_dir, pdf_name)}_{page_num}.pkl'
     image_path = f'{os.path.join(tmp_dir, pdf_name)}_{page_num}'
     img = Image.open(image_path).convert('RGB')
-    with open(pkl_path, 'rb') as rf:
-        try:
-            obj = pickle.load(rf)
-        except EOFError as e:
-            logging.error(e)
-            logging.error(f'Pickle path: {pkl_path}')
-            raise e
-        except pickle.UnpicklingError as e:
-            logging.error(e)
-            logging.error(f'Pickle path: {pkl_path}')
-            raise e
-    coords = get_proposals(img)
+    obj, _ = load_page(pkl_path)
+    coords = cached_stage(obj, 'proposals', lambda: get_proposals(img), models=False)
     padded_img = pad_image(img)
     obj['id'] = '0'
     obj['proposals'] = coords
@@ -46,14 +44,14 @@ def propose_and_pad(obj, visualize=False):
     d = f'{tmp_dir}/{pdf_name}_{page_num}_pad'
     padded_img.save(d, "PNG")
     obj['pad_img'] = d
-    with open(pkl_path, 'wb') as wf:
-        pickle.dump(obj, wf)
-    return pkl_path
+    if in_memory:
+        # Save detection from decoding the padded image again. Dropped by detect once used.
+        obj['padded_img'] = padded_img
+        return obj
+    return store_page(obj, pkl_path)
 
 
-def xgboost_postprocess(pkl_path):
-    with open(pkl_path, 'rb') as rf:
-        obj = pickle.load(rf)
+def _process_plugin():
     try:
         worker = get_worker()
         dp = None
@@ -66,24 +64,32 @@ def xgboost_postprocess(pkl_path):
     except Exception as e:
         logger.error(str(e), exc_info=True)
         raise e
+    return dp
 
-    objects = obj['content']
-    objects = postprocess(dp.postprocess_model, dp.classes, objects)
-    # remove empty strings returned from postprocess
-    objects = [i for i in objects if i != '']
 
-    obj['xgboost_content'] = objects
-    with open(pkl_path, 'wb') as wf:
-        pickle.dump(obj, wf)
-    return pkl_path
+def xgboost_postprocess(page):
+    return xgboost_postprocess_pages([page])[0]
 
 
-def rules_postprocess(pkl_path):
-    with open(pkl_path, 'rb') as rf:
-        obj = pickle.load(rf)
+def xgboost_postprocess_pages(pages):
+    """
+    Run the XGBoost postprocessing over several pages with a single prediction
+    :param pages: List of page pickle paths or in-memory page dicts
+    :return: List of page pickle paths or page dicts, in the order given
+    """
+    dp = _process_plugin()
+    loaded = [load_page(page) for page in pages]
+    contents = postprocess_pages(dp.postprocess_model, dp.classes, [obj['content'] for obj, _ in loaded])
+    results = []
+    for (obj, pkl_path), objects in zip(loaded, contents):
+        obj['xgboost_content'] = objects
+        results.append(store_page(obj, pkl_path))
+    return results
+
+
+def rules_postprocess(page):
+    obj, pkl_path = load_page(page)
     objects = obj['xgboost_content']
     objects = postprocess_rules(objects)
     obj['rules_content'] = objects
-    with open(pkl_path, 'wb') as wf:
-        pickle.dump(obj, wf)
-    return pkl_path
+    return store_page(obj, pkl_path)
@@ -9,6 +9,12 @@ import os
 @click.option('--use-semantic-detection/--no-semantic-detection', type=bool, default='True', help='enable or disable semantic detection')
 @click.option('--use-xgboost-postprocess/--no-xgboost-postprocess', type=bool, default='True', help='enable or disable xgboost postprocess')
 @click.option('--use-rules-postprocess/--no-rules-postprocess', type=bool, default='False', help='enable or disable rules postprocess')
+@click.option('--in-memory-pages/--no-in-memory-pages', type=bool, default='False', help='pass page objects between stages in memory instead of through tmp pickles')
+@click.option('--detect-batch-pages', type=int, default=1, help='number of pages batched together per detection task')
+@click.option('--postprocess-batch-pages', type=int, default=1, help='number of pages batched together per xgboost postprocess task')
+@click.option('--rasterize-processes', type=int, default=1, help='number of ghostscript processes rendering page ranges of each pdf')
+@click.option('--cache-dir', type=str, default=None, help='directory caching per page results across runs and datasets')
+@click.option('--cache-size-gb', type=float, default=50, help='size bound of the result cache')
 @click.option('--aggregation', '-a', multiple=True, default=[])
 @click.option('--input-path', type=click.Path(exists=True), help='define the path to your input documents')
 @click.option('--dataset-id', type=str, default='cosmos', help='dataset id')
@@ -21,11 +27,19 @@ import os
 @click.option('--enrich/--no-enrich', type=bool, default='False', help='Compute word vectors')
 @click.option('--threshold', type=float, default=0.8, help='postprocess_score threshold for identifying an object for context enrichment')
 @click.option('--spans', type=int, default=20, help='number of words either side of an object coreference to capture for context')
+@click.option('--streaming/--no-streaming', type=bool, default='False', help='start detection on each PDF as soon as it is converted')
+@click.option('--resume/--no-resume', type=bool, default='True', help='reuse work recorded by earlier runs with the same settings')
 def ingest_documents(cluster,
                      tmp_dir,
                      use_semantic_detection,
                      use_xgboost_postprocess,
                      use_rules_postprocess,
+                     in_memory_pages,
+                     detect_batch_pages,
+                     postprocess_batch_pages,
+                     rasterize_processes,
+                     cache_dir,
+                     cache_size_gb,
                      aggregation,
                      input_path,
                      dataset_id,
@@ -36,13 +50,21 @@ def ingest_documents(cluster,
                      ngram,
                      enrich,
                      threshold,
-                     spans
+                     spans,
+                     streaming,
+                     resume
                      ):
     ingest = Ingest(cluster,
                     tmp_dir=tmp_dir,
                     use_semantic_detection=use_semantic_detection,
                     use_xgboost_postprocess=use_xgboost_postprocess,
-                    use_rules_postprocess=use_rules_postprocess)
+                    use_rules_postprocess=use_rules_postprocess,
+                    in_memory_pages=in_memory_pages,
+                    detect_batch_pages=detect_batch_pages,
+                    postprocess_batch_pages=postprocess_batch_pages,
+                    rasterize_processes=rasterize_processes,
+                    cache_dir=cache_dir,
+                    cache_size_gb=cache_size_gb)
     ingest.ingest(input_path,
                   dataset_id,
                   output_path,
@@ -54,7 +76,9 @@ def ingest_documents(cluster,
                   ngram=ngram,
                   enrich=enrich,
                   threshold=threshold,
-                  spans=spans)
+                  spans=spans,
+                  streaming=streaming,
+                  resume=resume)
 
 
 if __name__ == '__main__':
@@ -12,11 +12,8 @@ import yaml
 from ingest.process.detection.src.converters.xml2list import xml2list
 from ingest.process.ocr.ocr import run as ocr
 from joblib import Parallel, delayed
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 import glob
 from ingest.process.detection.src.infer import run_inference
-from ingest.process.detection.src.torch_model.train.data_layer.sql_types import Base
 import os
 from PIL import Image, ImageFile
 from tqdm import tqdm
@@ -117,11 +114,6 @@ def featurize_obj(obj, xml_dir, classes):
 def featurize_images(image_dir, proposals_dir, xml_dir, model, model_config, device_str, classes, num_processes):
     results = []
     for f in tqdm(glob.glob(os.path.join(image_dir, '*'))):
-        engine = create_engine('sqlite:///:memory:', echo=False)  
-        Session = sessionmaker()
-        Session.configure(bind=engine)
-        Base.metadata.create_all(engine)
-        session = Session()
         id = os.path.basename(f)[:-4]
         ppath = f'{id}.csv'
         with open(os.path.join(proposals_dir, ppath), 'r') as rf:
@@ -133,10 +125,9 @@ def featurize_images(image_dir, proposals_dir, xml_dir, model, model_config, dev
                 proposals.append(coords)
         img = Image.open(f).convert('RGB')
         obj = {'img': img, 'proposals': proposals, 'id': id}
-        detected_objs, _ = run_inference(model, [obj], model_config, device_str, session)
+        detected_objs, _ = run_inference(model, [obj], model_config, device_str)
         detected_objs = detected_objs[id]
         results.append({'id': id, 'img': img, 'detected_objs': detected_objs, 'proposals': proposals})
-        session.close()
 
     featurized = Parallel(n_jobs=num_processes)(delayed(featurize_obj)(r, xml_dir, classes) for r in results)
     final_features = []
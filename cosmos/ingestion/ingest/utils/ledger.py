@@ -0,0 +1,235 @@
+"""
+Durable record of ingestion progress, so that interrupted or repeated runs only redo missing work
+"""
+import sqlite3
+import pickle
+import hashlib
+import json
+import os
+import logging
+from ingest.utils.page_io import load_page
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    pdf_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pdfs (
+    dataset_id TEXT NOT NULL,
+    pdf_hash TEXT NOT NULL,
+    pdf_name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    n_pages INTEGER,
+    part TEXT,
+    PRIMARY KEY (dataset_id, pdf_hash)
+);
+CREATE TABLE IF NOT EXISTS pages (
+    dataset_id TEXT NOT NULL,
+    pdf_hash TEXT NOT NULL,
+    page_num INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    config TEXT,
+    PRIMARY KEY (dataset_id, pdf_hash, page_num)
+);
+CREATE TABLE IF NOT EXISTS parts (
+    dataset_id TEXT NOT NULL,
+    part TEXT NOT NULL,
+    aggregations TEXT NOT NULL,
+    entry TEXT NOT NULL,
+    config TEXT NOT NULL,
+    enriched INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (dataset_id, part)
+);
+CREATE TABLE IF NOT EXISTS outputs (
+    dataset_id TEXT NOT NULL,
+    pdf_name TEXT NOT NULL,
+    pdf_hash TEXT NOT NULL,
+    part TEXT NOT NULL,
+    PRIMARY KEY (dataset_id, pdf_name)
+);
+"""
+
+
+def hash_file(filename, chunk_size=1 << 20):
+    """
+    :param filename: Path to file
+    :param chunk_size: Read size
+    :return: Hex SHA-256 digest of the file's contents
+    """
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as rf:
+        while chunk := rf.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IngestLedger:
+    """
+    SQLite backed ledger of ingestion progress. PDFs are keyed by the hash of their contents, so renamed PDFs are
+    recognized and edited PDFs are ingested again. Per dataset it records:
+      - each PDF's status: converted, failed, or written (its objects are in an output part)
+      - each page's status, and the path of its final page pickle once it is through the page pipeline
+      - each written output part, with its manifest entry and whether it has been enriched
+      - the part each PDF file name was written to. PDFs with the same contents share their page records, but each
+        name is written out
+    Pages and parts are recorded with the config fingerprint of the run that produced them, and only count as done
+    for runs with the same fingerprint.
+    Within a run, PDFs are referred to by file name, which is resolved to the hash recorded by pdf_hash.
+    Only the driver writes to the ledger.
+    """
+    def __init__(self, db_path, dataset_id, config=''):
+        """
+        :param db_path: Path to the SQLite database. Created if missing
+        :param dataset_id: Dataset id of the run
+        :param config: Fingerprint of the run's settings and models
+        """
+        self.db_path = db_path
+        self.dataset_id = dataset_id
+        self.config = config
+        self.hashes = {}
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def pdf_hash(self, filename):
+        """
+        Hash a PDF, and remember the hash for its file name. Hashes are cached by path, size and modification time
+        :param filename: Path to PDF
+        :return: Hex SHA-256 digest
+        """
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        row = self.conn.execute('SELECT size, mtime, pdf_hash FROM files WHERE path = ?', (path,)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime:
+            pdf_hash = row[2]
+        else:
+            pdf_hash = hash_file(path)
+            with self.conn:
+                self.conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                                  (path, stat.st_size, stat.st_mtime, pdf_hash))
+        self.hashes[os.path.basename(filename)] = pdf_hash
+        return pdf_hash
+
+    def written_parts(self, aggregations):
+        """
+        :param aggregations: Aggregations of the current run. Parts written with other aggregations or another config
+                             are not reusable
+        :return: {part name: manifest entry} of the dataset's reusable parts
+        """
+        rows = self.conn.execute('SELECT part, aggregations, entry FROM parts WHERE dataset_id = ? AND config = ?',
+                                 (self.dataset_id, self.config))
+        return {part: json.loads(entry) for part, aggs, entry in rows if json.loads(aggs) == sorted(aggregations)}
+
+    def drop_parts(self, keep):
+        """
+        Forget the dataset's parts other than those kept, once they are removed from the output
+        :param keep: Names of the parts to keep
+        """
+        keep = set(keep)
+        rows = self.conn.execute('SELECT part FROM parts WHERE dataset_id = ?', (self.dataset_id,)).fetchall()
+        dropped = [(self.dataset_id, part) for part, in rows if part not in keep]
+        with self.conn:
+            self.conn.executemany('DELETE FROM parts WHERE dataset_id = ? AND part = ?', dropped)
+            self.conn.executemany('DELETE FROM outputs WHERE dataset_id = ? AND part = ?', dropped)
+
+    def written_names(self, parts):
+        """
+        :param parts: Names of the parts that are still present in the output
+        :return: {pdf_name: pdf_hash} of the PDF file names whose objects are in those parts, with the hash of the
+                 contents they were written from
+        """
+        rows = self.conn.execute('SELECT pdf_name, pdf_hash, part FROM outputs WHERE dataset_id = ?', (self.dataset_id,))
+        return {pdf_name: pdf_hash for pdf_name, pdf_hash, part in rows if part in parts}
+
+    def finished_pages(self, pdf_name):
+        """
+        Final page pickles of a PDF whose pages all finished the page pipeline in an earlier run with the same config.
+        The PDF may have been written out under another name with the same contents
+        :param pdf_name: PDF file name
+        :return: List of final page pickle paths, or None if any page is missing, failed, no longer on disk, or its
+                 pickle has since been overwritten by another PDF or dataset
+        """
+        pdf_hash = self.hashes[pdf_name]
+        row = self.conn.execute("SELECT n_pages FROM pdfs WHERE dataset_id = ? AND pdf_hash = ? "
+                                "AND status IN ('converted', 'written')", (self.dataset_id, pdf_hash)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        results = self.conn.execute("SELECT result FROM pages WHERE dataset_id = ? AND pdf_hash = ? AND status = 'done' "
+                                    "AND config = ? ORDER BY page_num", (self.dataset_id, pdf_hash, self.config)).fetchall()
+        results = [r for r, in results]
+        if len(results) != row[0] or not all(r is not None and os.path.exists(r) for r in results):
+            return None
+        # Page pickles are named by PDF file name in a tmp_dir shared by runs and datasets
+        for result in results:
+            try:
+                obj, _ = load_page(result)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                return None
+            if obj.get('pdf_hash') != pdf_hash or obj.get('dataset_id') != self.dataset_id:
+                return None
+        return results
+
+    def record_conversion(self, pdf_name, n_pages):
+        """
+        Record a PDF's conversion to page images. Any earlier page records of the PDF are dropped
+        :param pdf_name: PDF file name
+        :param n_pages: Number of converted pages, or None if conversion failed
+        """
+        pdf_hash = self.hashes[pdf_name]
+        status = 'failed' if n_pages is None else 'converted'
+        with self.conn:
+            self.conn.execute('DELETE FROM pages WHERE dataset_id = ? AND pdf_hash = ?', (self.dataset_id, pdf_hash))
+            self.conn.execute('INSERT OR REPLACE INTO pdfs VALUES (?, ?, ?, ?, ?, NULL)',
+                              (self.dataset_id, pdf_hash, pdf_name, status, n_pages))
+
+    def record_pages(self, pages):
+        """
+        Record pages that are through the page pipeline
+        :param pages: List of (pdf_name, page_num, status, result) tuples. status is done or failed, and result is
+                      the final page pickle path, or None if the page failed or was held in memory
+        """
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)',
+                                  [(self.dataset_id, self.hashes[pdf_name], page_num, status, result, self.config)
+                                   for pdf_name, page_num, status, result in pages])
+
+    def record_part(self, aggregations, entry, pdf_names):
+        """
+        Record a written output part, marking its PDFs as written
+        :param aggregations: Aggregations the part was written with
+        :param entry: Manifest entry of the part
+        :param pdf_names: File names of every PDF in the part, including those without objects
+        """
+        outputs = [(self.dataset_id, pdf_name, self.hashes[pdf_name], entry['part']) for pdf_name in pdf_names]
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO parts VALUES (?, ?, ?, ?, ?, 0)',
+                              (self.dataset_id, entry['part'], json.dumps(sorted(aggregations)), json.dumps(entry),
+                               self.config))
+            self.conn.executemany("UPDATE pdfs SET status = 'written', part = ? WHERE dataset_id = ? AND pdf_hash = ?",
+                                  [(entry['part'], self.dataset_id, self.hashes[pdf_name]) for pdf_name in pdf_names])
+            self.conn.executemany('INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?)', outputs)
+
+    def unenriched_parts(self):
+        """
+        :return: Names of the dataset's recorded parts that have not been enriched yet
+        """
+        rows = self.conn.execute('SELECT part FROM parts WHERE dataset_id = ? AND enriched = 0 ORDER BY part',
+                                 (self.dataset_id,))
+        return [part for part, in rows]
+
+    def record_enriched(self, parts):
+        """
+        Record parts whose files have all been enriched, so later runs do not enrich them again
+        :param parts: Names of the enriched parts
+        """
+        with self.conn:
+            self.conn.executemany('UPDATE parts SET enriched = 1 WHERE dataset_id = ? AND part = ?',
+                                  [(self.dataset_id, part) for part in parts])
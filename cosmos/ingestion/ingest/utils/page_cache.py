@@ -0,0 +1,221 @@
+"""
+Content addressed cache of per page pipeline results, so that unchanged PDFs are not processed again
+"""
+import hashlib
+import pickle
+import sqlite3
+import time
+import os
+import uuid
+import logging
+logger = logging.getLogger(__name__)
+
+# Environment variables naming the model files the cached results depend on
+MODEL_ENV_VARS = ['WEIGHTS_PTH', 'MODEL_CONFIG', 'PP_WEIGHTS_PTH', 'CLASSES_PTH']
+# Size index of the cache entries, shared by every process using the cache directory
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_used ON entries (used);
+CREATE TABLE IF NOT EXISTS total (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO total VALUES (0, 0);
+"""
+# Index paths whose schema this process has set up
+_indexes = set()
+
+
+def model_fingerprint():
+    """
+    Fingerprint the models configured on this worker
+    :return: Hex digest over the contents of the files named by MODEL_ENV_VARS that are set
+    """
+    digest = hashlib.sha256()
+    for var in MODEL_ENV_VARS:
+        pth = os.environ.get(var)
+        if pth is None or not os.path.isfile(pth):
+            continue
+        digest.update(var.encode())
+        with open(pth, 'rb') as rf:
+            while chunk := rf.read(1 << 20):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PageCache:
+    """
+    Directory of pickled values named by the hash of their key. Several processes may share a cache directory. A
+    SQLite index in the directory keeps the size and last use of each entry and the total size, so that writes can
+    keep the cache within max_bytes, by evicting the least recently used entries, without listing the directory.
+    """
+    def __init__(self, path, max_bytes):
+        """
+        :param path: Cache directory
+        :param max_bytes: Size bound of the cache
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(path, 'index.sqlite')
+        if self.index_path not in _indexes:
+            os.makedirs(path, exist_ok=True)
+            conn = self._connect()
+            try:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.executescript(INDEX_SCHEMA)
+            finally:
+                conn.close()
+            _indexes.add(self.index_path)
+
+    def _connect(self):
+        # Autocommit, so that writes take the database lock for exactly the transactions begun below
+        return sqlite3.connect(self.index_path, timeout=60, isolation_level=None)
+
+    @staticmethod
+    def _entry_name(key):
+        return hashlib.sha256(repr(key).encode()).hexdigest()
+
+    def _entry_path(self, name):
+        return os.path.join(self.path, name[:2], name)
+
+    def get(self, key):
+        """
+        :param key: Tuple of strings and numbers
+        :return: Cached value, or None if the key is not cached
+        """
+        name = self._entry_name(key)
+        pth = self._entry_path(name)
+        try:
+            with open(pth, 'rb') as rf:
+                value = pickle.load(rf)
+        except FileNotFoundError:
+            return None
+        except (EOFError, pickle.UnpicklingError) as e:
+            logger.warning(f'Dropping unreadable cache entry {pth}: {e}')
+            self._update(name, None)
+            return None
+        conn = self._connect()
+        try:
+            conn.execute('UPDATE entries SET used = ? WHERE name = ?', (time.time(), name))
+        finally:
+            conn.close()
+        return value
+
+    def put(self, key, value):
+        """
+        :param key: Tuple of strings and numbers
+        :param value: Picklable value
+        """
+        name = self._entry_name(key)
+        pth = self._entry_path(name)
+        os.makedirs(os.path.dirname(pth), exist_ok=True)
+        tmp_pth = f'{pth}.{uuid.uuid4()}.tmp'
+        with open(tmp_pth, 'wb') as wf:
+            pickle.dump(value, wf)
+        size = os.path.getsize(tmp_pth)
+        os.replace(tmp_pth, pth)
+        self._update(name, size)
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache is within max_bytes
+        """
+        self._update(None, None)
+
+    def _update(self, name, size):
+        """
+        Record a written or removed entry in the index, then evict entries while the total is over max_bytes. Entries
+        are removed while the index is locked, so the index and the directory agree
+        :param name: Entry name, or None to only evict
+        :param size: Size of the written entry, or None if the entry is removed
+        """
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            total, = conn.execute('SELECT size FROM total').fetchone()
+            if name is not None:
+                row = conn.execute('SELECT size FROM entries WHERE name = ?', (name,)).fetchone()
+                if row is not None:
+                    total -= row[0]
+                if size is None:
+                    conn.execute('DELETE FROM entries WHERE name = ?', (name,))
+                    self._remove(self._entry_path(name))
+                else:
+                    conn.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?)', (name, size, time.time()))
+                    total += size
+            evicted = []
+            if total > self.max_bytes:
+                for evict_name, evict_size in conn.execute('SELECT name, size FROM entries ORDER BY used'):
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append(evict_name)
+                    total -= evict_size
+            for evict_name in evicted:
+                conn.execute('DELETE FROM entries WHERE name = ?', (evict_name,))
+                self._remove(self._entry_path(evict_name))
+            conn.execute('UPDATE total SET size = ?', (total,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _remove(pth):
+        try:
+            os.remove(pth)
+        except FileNotFoundError:
+            pass
+
+
+def page_cache(obj):
+    """
+    :param obj: Page dict
+    :return: The PageCache the page's results go to, or None if caching is off
+    """
+    cache = obj.get('cache')
+    if cache is None:
+        return None
+    return PageCache(cache['path'], cache['max_bytes'])
+
+
+def cached_stage(obj, stage, compute, *extra, models=True):
+    """
+    Look up a stage's result for a page, computing and caching it on a miss
+    :param obj: Page dict, as set up by pdf_to_images
+    :param stage: Stage name
+    :param compute: Function computing the result
+    :param extra: Any further values the result depends on
+    :param models: Whether the result depends on the models
+    :return: Stage result
+    """
+    cache = page_cache(obj)
+    if cache is None:
+        return compute()
+    key = stage_key(obj, stage, *extra, models=models)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.put(key, value)
+    return value
+
+
+def stage_key(obj, stage, *extra, models=True):
+    """
+    Cache key of a stage's result for a page
+    :param obj: Page dict, as set up by pdf_to_images
+    :param stage: Stage name
+    :param extra: Any further values the result depends on
+    :param models: Whether the result depends on the models, in which case the key includes the model fingerprint
+    :return: Key tuple
+    """
+    cache = obj['cache']
+    key = (stage, cache['page_key'])
+    if models:
+        key += (cache['fingerprint'],)
+    return key + extra
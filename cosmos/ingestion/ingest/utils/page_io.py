@@ -0,0 +1,38 @@
+"""
+Helpers for passing page objects between pipeline stages, either as pickle files in tmp_dir or as in-memory dicts
+"""
+import pickle
+import logging
+logger = logging.getLogger(__name__)
+
+
+def load_page(page):
+    """
+    Load a page object
+    :param page: Either a path to a page pickle, or an in-memory page dict
+    :return: (page dict, pickle path or None if the page is held in memory)
+    """
+    if isinstance(page, dict):
+        return page, None
+    with open(page, 'rb') as rf:
+        try:
+            obj = pickle.load(rf)
+        except (EOFError, pickle.UnpicklingError) as e:
+            logger.error(e)
+            logger.error(f'Pickle path: {page}')
+            raise e
+    return obj, page
+
+
+def store_page(obj, pkl_path):
+    """
+    Hand a page object on to the next stage
+    :param obj: Page dict
+    :param pkl_path: Path the page was loaded from. If None, the page is held in memory and returned as is
+    :return: pkl_path if the page was written, else the page dict
+    """
+    if pkl_path is None:
+        return obj
+    with open(pkl_path, 'wb') as wf:
+        pickle.dump(obj, wf)
+    return pkl_path
@@ -0,0 +1,64 @@
+"""
+Helpers for reading and writing ingest outputs, which are either single parquet files or partitioned datasets:
+directories of part files written as batches of pages complete
+"""
+import os
+import glob
+import uuid
+import pandas as pd
+
+
+def dataset_parts(path):
+    """
+    List the parquet files making up a dataset
+    :param path: Path to a parquet file, or to a directory of parquet part files
+    :return: Sorted list of parquet file paths. Files starting with '_' or '.' (eg manifests) are skipped
+    """
+    # The ingestion and retrieval packages are installed separately, so each carries a copy of this function. Keep it
+    # in step with the one in cosmos/retrieval/retrieval/parquet_io.py
+    if not os.path.isdir(path):
+        return [path]
+    parts = glob.glob(os.path.join(path, '*.parquet'))
+    return sorted(p for p in parts if not os.path.basename(p).startswith(('_', '.')))
+
+
+def parquet_parts(directory):
+    """
+    List every parquet file of every dataset in a directory
+    :param directory: Directory holding parquet files and/or partitioned datasets
+    :return: List of (parquet file path, path relative to directory). Writing a processed part to the same relative
+             path under another directory mirrors the input layout
+    """
+    parts = []
+    for pq in sorted(glob.glob(os.path.join(directory, '*.parquet'))):
+        for part in dataset_parts(pq):
+            parts.append((part, os.path.relpath(part, directory)))
+    return parts
+
+
+def read_dataset(path, columns=None):
+    """
+    Read a parquet file or partitioned dataset into a single DataFrame. Parts are read separately, so parts whose
+    column types differ (eg a column that is all null in one part) still combine
+    :param path: Path to a parquet file, or to a directory of parquet part files
+    :param columns: Optional list of columns to read
+    :return: DataFrame
+    """
+    dfs = [pd.read_parquet(part, columns=columns) for part in dataset_parts(path)]
+    if len(dfs) == 0:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(dfs, ignore_index=True)
+
+
+def write_dataset_part(df, dataset_path, name):
+    """
+    Write a DataFrame as a part of a partitioned dataset. The part is written under a temporary name and then
+    renamed, so readers never see a partially written part
+    :param df: DataFrame to write
+    :param dataset_path: Dataset directory
+    :param name: File name of the part
+    """
+    os.makedirs(dataset_path, exist_ok=True)
+    tmp_pth = os.path.join(dataset_path, f'.{name}.{uuid.uuid4()}')
+    df.to_parquet(tmp_pth, engine='pyarrow', compression='gzip')
+    os.replace(tmp_pth, os.path.join(dataset_path, name))
@@ -82,3 +82,19 @@ def parse_pdf(fp):
         "page": pages
                        })
     return df, layout.bbox
+
+
+def get_page_sizes(fp):
+    """
+    Get the size of each page of a pdf without parsing their content
+    :param fp: Input file.
+    :return: List of (width, height) of each page's media box, in points
+    """
+    with open(fp, "rb") as fh:
+        parser = PDFParser(fh)
+        doc = PDFDocument(parser)
+        sizes = []
+        for page in PDFPage.create_pages(doc):
+            x1, y1, x2, y2 = page.mediabox
+            sizes.append((abs(x2 - x1), abs(y2 - y1)))
+        return sizes
@@ -8,6 +8,8 @@ import base64
 import pickle
 import json
 import subprocess
+import math
+import itertools
 import logging
 logging.basicConfig(format='%(levelname)s :: %(asctime)s :: %(message)s', level=logging.DEBUG)
 logging.getLogger("pdfminer").setLevel(logging.WARNING)
@@ -27,4 +29,48 @@ def get_pdf_names(directory: str):
     return files
 
 
-
+def rasterize_pdf(filename, out_prefix, resolutions, processes=1):
+    """
+    Render the pages of a PDF to PNGs with Ghostscript. The document is split into contiguous page ranges of equal
+    resolution, each rendered by its own Ghostscript process, and up to processes of them run concurrently
+    :param filename: Path to PDF file
+    :param out_prefix: Prefix of the output image paths
+    :param resolutions: Render resolution of each page, in DPI
+    :param processes: Maximum number of concurrent Ghostscript processes
+    :return: [(page_num, image_path)] for every page that was rendered, page_num starting at 1
+    """
+    n_pages = len(resolutions)
+    processes = max(1, min(processes, n_pages))
+    range_size = int(math.ceil(n_pages / processes))
+    ranges = []
+    for resolution, run in itertools.groupby(range(1, n_pages + 1), key=lambda page_num: resolutions[page_num - 1]):
+        run = list(run)
+        for i in range(0, len(run), range_size):
+            ranges.append((run[i], run[min(i + range_size, len(run)) - 1], resolution))
+    procs = []
+    for first, last, resolution in ranges:
+        if len(procs) == processes:
+            procs.pop(0).wait()
+        # Ghostscript numbers output pages from 1 within each range
+        procs.append(subprocess.Popen(['gs', '-dBATCH',
+                                       '-dNOPAUSE',
+                                       '-sDEVICE=png16m',
+                                       '-dGraphicsAlphaBits=4',
+                                       '-dTextAlphaBits=4',
+                                       f'-r{resolution}',
+                                       f'-dFirstPage={first}',
+                                       f'-dLastPage={last}',
+                                       f'-sOutputFile={out_prefix}_{first}-%d',
+                                       filename
+                                       ], stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT))
+    for proc in procs:
+        proc.wait()
+    pages = []
+    for first, last, _ in ranges:
+        for page_num in range(first, last + 1):
+            path = f'{out_prefix}_{first}-{page_num - first + 1}'
+            if os.path.exists(path):
+                pages.append((page_num, path))
+            else:
+                logger.warning(f'Ghostscript did not render page {page_num} of {filename}')
+    return pages
@@ -12,7 +12,7 @@ def resize_png(im, return_size = False, size: int = 1920) -> Image:
     """
     w, h = im.size
     if w >= size or h >= size:
-        maxsize = (1920, 1920)
+        maxsize = (size, size)
         im.thumbnail(maxsize, Image.ANTIALIAS)
     else:
         im = resize_image(im, size)
@@ -0,0 +1,39 @@
+"""
+Tests for cropping and warping proposal windows
+"""
+
+import pickle
+import numpy as np
+import torch
+from PIL import Image
+from torchvision.transforms import ToTensor, Normalize
+from ingest.process.detection.src.torch_model.utils.bbox import BBoxes
+from ingest.process.detection.src.torch_model.utils.warp import warp_proposals, MEAN, STD
+from ingest.process.detection.src.utils.ingest_images import unpack_page
+
+
+def page_image(size=400, seed=0):
+    r = np.random.RandomState(seed)
+    arr = (r.rand(size // 8, size // 8, 3) * 255).astype(np.uint8)
+    return Image.fromarray(arr).resize((size, size), Image.NEAREST)
+
+
+def test_warp_matches_pil_bicubic():
+    img = page_image()
+    proposals = [[10, 20, 110, 80], [0, 0, 400, 400], [350, 300, 450, 420], [5.7, 6.2, 40.9, 300.1]]
+    windows = warp_proposals(img, proposals, 64)
+    tens, normalize = ToTensor(), Normalize(MEAN, STD)
+    expected = torch.stack([normalize(tens(img.crop([int(c) for c in p]).resize((64, 64), Image.BICUBIC)))
+                            for p in proposals])
+    # Values are at most a few 8 bit levels apart, and almost all identical
+    diff = (windows - expected).abs() * torch.tensor(STD).reshape(1, -1, 1, 1) * 255
+    assert diff.max() <= 3.5
+    assert (diff > 0.5).float().mean() < 0.01
+
+
+def test_unpack_page_windows_pickle_alone():
+    img = page_image()
+    proposals = BBoxes(torch.tensor([[i, i, i + 50, i + 60] for i in range(0, 300, 6)]), 'xyxy')
+    examples = unpack_page([img, None, proposals, 'page'], 64).examples
+    window = examples[0].ex_window
+    assert len(pickle.dumps(window)) < 2 * window.numel() * window.element_size()
@@ -0,0 +1,95 @@
+"""
+Tests for the ingestion progress ledger
+"""
+
+import pickle
+from ingest.utils.ledger import IngestLedger
+
+
+def make_pdf(directory, name, contents):
+    pth = directory / name
+    pth.write_bytes(contents)
+    return str(pth)
+
+
+def finish_pdf(ledger, directory, pdf_name, n_pages, dataset_id='ds'):
+    """
+    Record a converted PDF whose pages all made it through the page pipeline, with their final page pickles
+    """
+    ledger.record_conversion(pdf_name, n_pages)
+    pages = []
+    for page_num in range(1, n_pages + 1):
+        pkl = directory / f'{pdf_name}_{page_num}.pkl'
+        with open(pkl, 'wb') as wf:
+            pickle.dump({'pdf_name': pdf_name, 'pdf_hash': ledger.hashes[pdf_name], 'dataset_id': dataset_id,
+                         'page_num': page_num}, wf)
+        pages.append((pdf_name, page_num, 'done', str(pkl)))
+    ledger.record_pages(pages)
+    return [str(directory / f'{pdf_name}_{page_num}.pkl') for page_num in range(1, n_pages + 1)]
+
+
+def test_finished_pages_are_resumed(tmp_path):
+    ledger = IngestLedger(str(tmp_path / 'ledger.sqlite'), 'ds', config='c1')
+    ledger.pdf_hash(make_pdf(tmp_path, 'a.pdf', b'a'))
+    results = finish_pdf(ledger, tmp_path, 'a.pdf', 3)
+    ledger.close()
+
+    ledger = IngestLedger(str(tmp_path / 'ledger.sqlite'), 'ds', config='c1')
+    ledger.pdf_hash(str(tmp_path / 'a.pdf'))
+    assert ledger.finished_pages('a.pdf') == results
+
+
+def test_failed_and_unconfigured_pages_are_not_resumed(tmp_path):
+    ledger = IngestLedger(str(tmp_path / 'ledger.sqlite'), 'ds', config='c1')
+    ledger.pdf_hash(make_pdf(tmp_path, 'a.pdf', b'a'))
+    finish_pdf(ledger, tmp_path, 'a.pdf', 2)
+    ledger.record_pages([('a.pdf', 2, 'failed', None)])
+    assert ledger.finished_pages('a.pdf') is None
+
+    ledger.pdf_hash(make_pdf(tmp_path, 'b.pdf', b'b'))
+    finish_pdf(ledger, tmp_path, 'b.pdf', 2)
+    other = IngestLedger(str(tmp_path / 'ledger.sqlite'), 'ds', config='c2')
+    other.pdf_hash(str(tmp_path / 'b.pdf'))
+    assert other.finished_pages('b.pdf') is None
+
+
+def test_overwritten_page_pickles_are_not_resumed(tmp_path):
+    ledger = IngestLedger(str(tmp_path / 'ledger.sqlite'), 'ds', config='c1')
+    ledger.pdf_hash(make_pdf(tmp_path, 'a.pdf', b'a'))
+    finish_pdf(ledger, tmp_path, 'a.pdf', 2)
+    # Another dataset ingests a different PDF with the same file name into the same tmp_dir
+    other_dir = tmp_path / 'other'
+    other_dir.mkdir()
+    other = IngestLedger(str(tmp_path / 'ledger.sqlite'), 'other', config='c1')
+    other.pdf_hash(make_pdf(other_dir, 'a.pdf', b'not a'))
+    with open(tmp_path / 'a.pdf_1.pkl', 'wb') as wf:
+        pickle.dump({'pdf_name': 'a.pdf', 'pdf_hash': other.hashes['a.pdf'], 'dataset_id': 'other'}, wf)
+    assert ledger.finished_pages('a.pdf') is None
+
+
+def test_written_pdfs_are_skipped(tmp_path):
+    ledger = IngestLedger(str(tmp_path / 'ledger.sqlite'), 'ds', config='c1')
+    a_hash = ledger.pdf_hash(make_pdf(tmp_path, 'a.pdf', b'a'))
+    ledger.pdf_hash(make_pdf(tmp_path, 'copy.pdf', b'a'))
+    finish_pdf(ledger, tmp_path, 'a.pdf', 1)
+    entry = {'part': 'part-00000.parquet', 'rows': 4, 'pdf_names': ['a.pdf', 'copy.pdf'], 'aggregations': {}}
+    ledger.record_part(['sections'], entry, ['a.pdf', 'copy.pdf'])
+
+    assert ledger.written_parts(['sections']) == {'part-00000.parquet': entry}
+    assert ledger.written_names({'part-00000.parquet'}) == {'a.pdf': a_hash, 'copy.pdf': a_hash}
+    # Parts written with other aggregations or another config are not reusable
+    assert ledger.written_parts(['tables']) == {}
+    assert IngestLedger(str(tmp_path / 'ledger.sqlite'), 'ds', config='c2').written_parts(['sections']) == {}
+
+    ledger.drop_parts(set())
+    assert ledger.written_parts(['sections']) == {}
+    assert ledger.written_names({'part-00000.parquet'}) == {}
+
+
+def test_parts_are_enriched_once(tmp_path):
+    ledger = IngestLedger(str(tmp_path / 'ledger.sqlite'), 'ds', config='c1')
+    for part in ['part-00000.parquet', 'part-00001.parquet']:
+        ledger.record_part([], {'part': part, 'rows': 1, 'pdf_names': [], 'aggregations': {}}, [])
+    assert ledger.unenriched_parts() == ['part-00000.parquet', 'part-00001.parquet']
+    ledger.record_enriched(['part-00000.parquet'])
+    assert ledger.unenriched_parts() == ['part-00001.parquet']
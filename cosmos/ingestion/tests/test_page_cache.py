@@ -0,0 +1,59 @@
+"""
+Tests for the content addressed page result cache
+"""
+
+import itertools
+import os
+import sqlite3
+from ingest.utils import page_cache
+from ingest.utils.page_cache import PageCache
+
+
+def entry_files(path):
+    return sorted(name for _, _, names in os.walk(path) for name in names if not name.startswith('index.sqlite'))
+
+
+def index_total(cache):
+    conn = sqlite3.connect(cache.index_path)
+    try:
+        total, = conn.execute('SELECT size FROM total').fetchone()
+        entries, = conn.execute('SELECT SUM(size) FROM entries').fetchone()
+    finally:
+        conn.close()
+    return total, entries
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    clock = itertools.count()
+    monkeypatch.setattr(page_cache.time, 'time', lambda: next(clock))
+    value = b'x' * 1000
+    cache = PageCache(str(tmp_path), 3500)
+    for k in range(3):
+        cache.put(('page', k), value)
+    assert cache.get(('page', 0)) == value
+    # Over the bound, the entry used longest ago goes: page 1, since page 0 was just read
+    cache.put(('page', 3), value)
+    assert cache.get(('page', 1)) is None
+    assert all(cache.get(('page', k)) == value for k in [0, 2, 3])
+    assert len(entry_files(str(tmp_path))) == 3
+    total, entries = index_total(cache)
+    assert total == entries <= 3500
+
+    # Another process sharing the directory with a smaller bound evicts down to it
+    PageCache(str(tmp_path), 1500).evict()
+    assert [cache.get(('page', k)) is not None for k in range(4)] == [False, False, False, True]
+    assert index_total(cache)[0] == index_total(cache)[1] <= 1500
+
+
+def test_rewritten_and_unreadable_entries_keep_the_size_right(tmp_path):
+    cache = PageCache(str(tmp_path), 10000)
+    cache.put(('page', 0), b'x' * 1000)
+    cache.put(('page', 0), b'x' * 10)
+    total, entries = index_total(cache)
+    assert total == entries < 1000
+
+    with open(cache._entry_path(cache._entry_name(('page', 0))), 'wb') as wf:
+        wf.write(b'not a pickle')
+    assert cache.get(('page', 0)) is None
+    assert entry_files(str(tmp_path)) == []
+    assert index_total(cache) == (0, None)
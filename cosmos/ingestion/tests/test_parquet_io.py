@@ -0,0 +1,32 @@
+"""
+Tests for writing and reading partitioned ingest outputs
+"""
+
+import pandas as pd
+from ingest.utils.parquet_io import dataset_parts, parquet_parts, read_dataset, write_dataset_part
+
+
+def test_written_parts_are_read_back(tmp_path):
+    dataset = tmp_path / 'ds.parquet'
+    write_dataset_part(pd.DataFrame({'pdf_name': ['b.pdf'], 'page': [None]}), str(dataset), 'part-00001.parquet')
+    write_dataset_part(pd.DataFrame({'pdf_name': ['a.pdf', 'a.pdf'], 'page': [1, 2]}), str(dataset),
+                       'part-00000.parquet')
+    # Unfinished writes and manifests are not parts
+    (dataset / '.part-00002.parquet.tmp').write_bytes(b'')
+    (dataset / '_manifest.parquet').write_bytes(b'')
+
+    assert dataset_parts(str(dataset)) == [str(dataset / 'part-00000.parquet'), str(dataset / 'part-00001.parquet')]
+    df = read_dataset(str(dataset))
+    assert df['pdf_name'].tolist() == ['a.pdf', 'a.pdf', 'b.pdf']
+    assert df['page'].tolist()[:2] == [1, 2] and pd.isna(df['page'].iloc[2])
+    assert read_dataset(str(dataset), columns=['pdf_name']).columns.tolist() == ['pdf_name']
+
+
+def test_single_files_and_datasets_are_listed(tmp_path):
+    pd.DataFrame({'pdf_name': ['a.pdf']}).to_parquet(tmp_path / 'ds_sections.parquet')
+    write_dataset_part(pd.DataFrame({'pdf_name': ['a.pdf']}), str(tmp_path / 'ds.parquet'), 'part-00000.parquet')
+
+    assert dataset_parts(str(tmp_path / 'ds_sections.parquet')) == [str(tmp_path / 'ds_sections.parquet')]
+    assert parquet_parts(str(tmp_path)) == [(str(tmp_path / 'ds.parquet' / 'part-00000.parquet'),
+                                             'ds.parquet/part-00000.parquet'),
+                                            (str(tmp_path / 'ds_sections.parquet'), 'ds_sections.parquet')]
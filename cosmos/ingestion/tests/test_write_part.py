@@ -0,0 +1,46 @@
+"""
+Tests for aggregating PDFs and writing them out as dataset parts
+"""
+
+from ingest.ingest import Ingest
+from ingest.utils.parquet_io import read_dataset
+
+
+def make_page(pdf_name, page_num, objects):
+    """
+    Build a final page dict from (postprocess class, text) pairs, stacked top to bottom
+    """
+    content, xgboost_content = [], []
+    for ind, (cls, text) in enumerate(objects):
+        bb = [10, 10 + 50 * ind, 500, 50 + 50 * ind]
+        content.append((bb, [(0.9, cls)], text))
+        xgboost_content.append((bb, cls, text, 0.8))
+    return {'pdf_name': pdf_name, 'dataset_id': 'ds', 'page_num': page_num, 'pad_img': 'img.png',
+            'pdf_limit': [0, 0, 612, 792], 'content': content, 'xgboost_content': xgboost_content}
+
+
+def test_write_part_concatenates_pdfs(tmp_path):
+    b = Ingest.aggregate_pages([make_page('b.pdf', 1, [('Section Header', 'Intro'), ('Body Text', 'b one')]),
+                                make_page('b.pdf', 2, [('Body Text', 'b two')])],
+                               ['b.pdf', 'copy.pdf'], ['sections'], str(tmp_path))
+    a = Ingest.aggregate_pages([make_page('a.pdf', 1, [('Body Text', 'a one')])], ['a.pdf'], ['sections'],
+                               str(tmp_path))
+    empty = Ingest.aggregate_pages([make_page('c.pdf', 1, []), ''], ['c.pdf'], ['sections'], str(tmp_path))
+    assert empty is None
+
+    entry = Ingest.write_part([b, empty, a], 3, 'ds', str(tmp_path), ['sections'])
+    assert entry == {'part': 'part-00003.parquet', 'rows': 7, 'pdf_names': ['a.pdf', 'b.pdf', 'copy.pdf'],
+                     'aggregations': {'sections': 3}}
+    objects = read_dataset(str(tmp_path / 'ds.parquet'))
+    assert sorted(objects['pdf_name']) == ['a.pdf', 'b.pdf', 'b.pdf', 'b.pdf', 'copy.pdf', 'copy.pdf', 'copy.pdf']
+    sections = read_dataset(str(tmp_path / 'ds_sections.parquet'))
+    # Sections come out in pdf_name order, as an aggregation over the whole part would give
+    assert sections['pdf_name'].tolist() == ['a.pdf', 'b.pdf', 'copy.pdf']
+    assert sections['content'].tolist() == ['a one', 'b one b two', 'b one b two']
+    assert sections['section_header'].tolist()[1:] == ['Intro', 'Intro']
+
+
+def test_write_part_without_objects(tmp_path):
+    entry = Ingest.write_part([None], 0, 'ds', str(tmp_path), ['sections'])
+    assert entry == {'part': 'part-00000.parquet', 'rows': 0, 'pdf_names': [], 'aggregations': {}}
+    assert not (tmp_path / 'ds.parquet').exists()
@@ -1,11 +1,10 @@
 from retrieval.retriever import Retriever
 from elasticsearch_dsl import Search, Q, query
-from elasticsearch_dsl.connections import connections
-from elasticsearch import RequestsHttpConnection
-from elasticsearch_dsl import Document, Text, connections, Integer, Float, Keyword
+from retrieval.es_client import create_client
+from elasticsearch_dsl import Document, Text, Integer, Float, Keyword
 from elasticsearch.helpers import bulk
 import hashlib
-import pandas as pd
+from retrieval.parquet_io import read_parquet_parts
 import os
 import logging
 import base64
@@ -56,28 +55,25 @@ class Page(Document):
         }
 
 class ElasticPageRetriever(Retriever):
-    def __init__(self, hosts=['localhost'], awsauth=None):
+    def __init__(self, hosts=['localhost'], awsauth=None, client=None):
+        """
+        :param hosts: Elasticsearch hosts
+        :param awsauth: Optional AWS request signer
+        :param client: Elasticsearch client to share with other retrievers. If None, a pooled client is created once
+                       here and reused by every call
+        """
         self.hosts = hosts
         self.awsauth = awsauth
+        self.client = client if client is not None else create_client(hosts, awsauth)
 
     def search(self, page_id='next_prediction'):
-        if self.awsauth is not None:
-            connections.create_connection(hosts=self.hosts,
-                                          http_auth=self.awsauth,
-                                          use_ssl=True,
-                                          verify_certs=True,
-                                          connection_class=RequestsHttpConnection
-                                          )
-        else:
-            connections.create_connection(hosts=self.hosts)
-
 #        q = Q('match', dataset_id='documents')
         if page_id == "next_prediction":
             q = Q('function_score', functions=[query.SF("random_score")])
         else:
             q = Q('match', _id=page_id)
 
-        s = Search(index='page').query(q)[0]
+        s = Search(using=self.client, index='page').query(q)[0]
         logger.info("About to execute")
         resp = s.execute().to_dict()
         hit = resp['hits']['hits'][0]['_source']
@@ -104,70 +100,42 @@ class ElasticPageRetriever(Retriever):
         return [t]
 
     def get_object(self, id):
-        if self.awsauth is not None:
-            connections.create_connection(hosts=self.hosts,
-                                          http_auth=self.awsauth,
-                                          use_ssl=True,
-                                          verify_certs=True,
-                                          connection_class=RequestsHttpConnection
-                                          )
-        else:
-            connections.create_connection(hosts=self.hosts)
-        return Object.get(id=id)
+        return Object.get(id=id, using=self.client)
 
     def build_index(self, document_parquet):
-        if self.awsauth is not None:
-            connections.create_connection(hosts=self.hosts,
-                                          http_auth=self.awsauth,
-                                          use_ssl=True,
-                                          verify_certs=True,
-                                          connection_class=RequestsHttpConnection
-                                          )
-        else:
-            connections.create_connection(hosts=self.hosts)
         logger.info('Building elastic index')
-        connections.create_connection(hosts=self.hosts)
-        Page.init()
-        # This is a parquet file to load from
-        df = pd.read_parquet(document_parquet)
-        unique_pages = df.groupby(['pdf_name', 'page_num', 'dataset_id', 'img_pth']).agg(lambda x: list(x))
+        Page.init(using=self.client)
+        # This is a parquet file or partitioned dataset to load from. Parts hold whole documents, so pages can be grouped per part
         to_add = []
-        for i, row in unique_pages.iterrows():
-            to_add.append(Page(pdf_name=i[0],
-                    page_num=i[1],
-                    dataset_id=i[2],
-                    img_pth=i[3],
-                    pdf_dims=row['pdf_dims'][0].tolist(),
-                    bbox=[j.tolist() for j in row['bounding_box']],
-                    classes=[j.tolist() for j in row['classes']],
-                    scores=[j.tolist() for j in row['scores']],
-                    postprocess_cls=row['postprocess_cls'],
-                    postprocess_score=row['postprocess_score'],
-                    detect_cls=row['detect_cls'],
-                    detect_score=row['detect_score']
-                    ))
-            if len(to_add) == 1000:
-                bulk(connections.get_connection(), (upsert(d) for d in to_add))
-                to_add = []
-        bulk(connections.get_connection(), (upsert(d) for d in to_add))
+        for df in read_parquet_parts(document_parquet):
+            unique_pages = df.groupby(['pdf_name', 'page_num', 'dataset_id', 'img_pth']).agg(lambda x: list(x))
+            for i, row in unique_pages.iterrows():
+                to_add.append(Page(pdf_name=i[0],
+                        page_num=i[1],
+                        dataset_id=i[2],
+                        img_pth=i[3],
+                        pdf_dims=row['pdf_dims'][0].tolist(),
+                        bbox=[j.tolist() for j in row['bounding_box']],
+                        classes=[j.tolist() for j in row['classes']],
+                        scores=[j.tolist() for j in row['scores']],
+                        postprocess_cls=row['postprocess_cls'],
+                        postprocess_score=row['postprocess_score'],
+                        detect_cls=row['detect_cls'],
+                        detect_score=row['detect_score']
+                        ))
+                if len(to_add) == 1000:
+                    bulk(self.client, (upsert(d) for d in to_add))
+                    to_add = []
+        bulk(self.client, (upsert(d) for d in to_add))
         logger.info('Done building page index')
 
     def delete(self, dataset_id):
-        if self.awsauth is not None:
-            connections.create_connection(hosts=self.hosts,
-                                          http_auth=self.awsauth,
-                                          use_ssl=True,
-                                          verify_certs=True,
-                                          connection_class=RequestsHttpConnection
-                                          )
-        else:
-            connections.create_connection(hosts=self.hosts)
-        s = Search(index='fulldocument')
+        s = Search(using=self.client, index='fulldocument')
         q = Q()
         q = q & Q('match', dataset_id__raw=dataset_id)
         result = s.query(q).delete()
         logger.info(result)
-        s = Search(index='object')
+        s = Search(using=self.client, index='object')
         q = Q()
         q = q & Q('match', dataset_id__raw=dataset_id)
         result = s.query(q).delete()
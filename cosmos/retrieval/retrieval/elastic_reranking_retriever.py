@@ -9,8 +9,8 @@ import os
 
 
 class ElasticRerankingRetriever(Retriever):
-    def __init__(self, client, hosts=[os.environ["ELASTIC_ADDRESS"]]):
-        self.elastic_retriever = ElasticRetriever(hosts)
+    def __init__(self, client, hosts=[os.environ["ELASTIC_ADDRESS"]], es_client=None):
+        self.elastic_retriever = ElasticRetriever(hosts, client=es_client)
         self.reranker = BertRerankingRetriever(client)
 
 
@@ -48,7 +48,7 @@ class ElasticRerankingRetriever(Retriever):
             doc_set.add(result['docname'])
             final_results.append(result)
         final_results = [r['id'] for r in final_results]
-        final_results = [self.elastic_retriever.get_object(i) for i in final_results]
+        final_results = self.elastic_retriever.get_objects(final_results)
         final_results = [
             {
                 'header': {},
@@ -74,8 +74,8 @@ class ElasticRerankingRetriever(Retriever):
     def rerank(self, query, contexts):
         return self.reranker.rerank(query, contexts)
 
-    def build_index(self, document_parquet, entities_parquet, section_parquet, tables_parquet, figures_parquet, equations_parquet):
-        self.elastic_retriever.build_index(document_parquet, entities_parquet, section_parquet, tables_parquet, figures_parquet, equations_parquet)
+    def build_index(self, document_parquet, entities_parquet, section_parquet, tables_parquet, figures_parquet, equations_parquet, chunk_size=500, thread_count=4):
+        self.elastic_retriever.build_index(document_parquet, entities_parquet, section_parquet, tables_parquet, figures_parquet, equations_parquet, chunk_size=chunk_size, thread_count=thread_count)
 
     def delete(self, dataset_id):
         self.elastic_retriever.delete(dataset_id)
@@ -1,11 +1,13 @@
 from retrieval.retriever import Retriever
 from elasticsearch_dsl import Search, Q
-from elasticsearch_dsl.connections import connections
-from elasticsearch import RequestsHttpConnection
-from elasticsearch_dsl import Document, Text, connections, Integer, Float, Keyword, Join
-from elasticsearch.helpers import bulk
+from retrieval.es_client import create_client, bulk_loading
+from elasticsearch_dsl import Document, Text, Integer, Float, Keyword, Join, Long
+from elasticsearch.helpers import parallel_bulk
 import hashlib
-import pandas as pd
+import json
+from collections import deque
+import time
+from retrieval.parquet_io import iter_parquet_rows
 import hashlib
 import logging
 
@@ -65,7 +67,7 @@ class Entity(EntityObjectIndex):
         '''
         return hashlib.sha1(f"{self.canonical_id}{self.name}{self.description}{self.types}{self.aliases}{self.dataset_id}".encode('utf-8')).hexdigest()
 
-    def add_object(self, cls, dataset_id, content, header_content, area, detect_score, postprocess_score, pdf_name, img_path=None, commit=True):
+    def add_object(self, cls, dataset_id, content, header_content, area, detect_score, postprocess_score, pdf_name, img_path=None, commit=True, using=None):
         obj = Object(
             # required make sure the answer is stored in the same shard
             _routing=self.meta.id,
@@ -85,12 +87,12 @@ class Entity(EntityObjectIndex):
             img_path=img_path
         )
         if commit:
-            obj.save()
+            obj.save(using=using)
         return obj
 
-    def search_objects(self):
+    def search_objects(self, using=None):
         # search only our index
-        s = Object.search()
+        s = Object.search(using=using)
         # filter for answers belonging to us
         s = s.filter("parent_id", type="object", id=self.meta.id)
         # add routing to only go to specific shard
@@ -162,29 +164,45 @@ class FullDocument(Document):
         }
 
 
+class DocumentFilter(Document):
+    """
+    Names of the PDFs whose full text matches a set of document filter terms. Object searches look the names up from
+    here with a terms lookup, so they stay in Elasticsearch instead of passing through the retriever
+    """
+    terms = Keyword(multi=True)
+    pdf_names = Keyword(multi=True)
+    created = Long()
+
+    class Index:
+        name = 'document_filter'
+        settings = {
+            'number_of_shards': 1,
+            'number_of_replicas': 0
+        }
+
+
 class ElasticRetriever(Retriever):
-    def __init__(self, hosts=['localhost'], awsauth=None):
+    def __init__(self, hosts=['localhost'], awsauth=None, client=None, document_filter_ttl=3600):
+        """
+        :param hosts: Elasticsearch hosts
+        :param awsauth: Optional AWS request signer
+        :param client: Elasticsearch client to share with other retrievers. If None, a pooled client is created once
+                       here and reused by every call
+        :param document_filter_ttl: Seconds a resolved set of document filter terms is reused before being resolved again
+        """
         self.hosts = hosts
         self.awsauth = awsauth
+        self.client = client if client is not None else create_client(hosts, awsauth)
+        self.document_filter_ttl = document_filter_ttl
 
     def search(self, query, entity_search=False, ndocs=30, page=0, cls=None, detect_min=None, postprocess_min=None, get_count=False, final=False, inclusive=False, document_filter_terms=[], docids=[], obj_id=None):
-        if self.awsauth is not None:
-            connections.create_connection(hosts=self.hosts,
-                                          http_auth=self.awsauth,
-                                          use_ssl=True,
-                                          verify_certs=True,
-                                          connection_class=RequestsHttpConnection
-                                          )
-        else:
-            connections.create_connection(hosts=self.hosts, timeout=20)
-
         if entity_search:
-            es = Entity.search()
+            es = Entity.search(using=self.client)
             q = Q('match', name=query)
             response = es.query(q).execute()
             logger.info('Done finding entity')
             for hit in response:
-                s = hit.search_objects()
+                s = hit.search_objects(using=self.client)
                 if cls is not None:
                     s = s.filter('term', cls__raw=cls)
                 if detect_min is not None:
@@ -196,355 +214,298 @@ class ElasticRetriever(Retriever):
                 contexts = []
                 cq = Q('match', content=query)
                 os_response = s.query(cq)[start:end].execute()
-                final_results = [r.meta.id for r in os_response]
-                final_results = [self.get_object(i) for i in final_results]
+                final_results = self.hit_objects(os_response)
         else:
-            logging.info(f"document_filter_terms: {document_filter_terms}")
-            # TODO: pull this out and do it above the entity level
-            # Run a  query against 'fulldocument' index.
-            doc_filter = False
-            dq = Q()
-            logging.info(f"docids: {docids}")
-
-            if len(docids) > 0:
-                dq = dq & Q('bool', should=[Q('match_phrase', name=f"{i}.pdf") for i in docids])
-                doc_filter=True
-            if len(document_filter_terms) > 0:
-                dq = dq & Q('bool', must=[Q('match_phrase', content=i) for i in document_filter_terms])
-                doc_filter=True
-
-            if doc_filter:
-                ds = Search(index='fulldocument')
-                ds = ds.query(dq)
-                pdf_names = []
-                for resp in ds.scan():
-                    pdf_names.append(resp['name'])
-                logging.info(f"{len(pdf_names)} pdfs found")
-
-            q = Q()
-            if query is None:
-                query_list = []
-            elif "," in query:
-                query_list = query.split(",")
-            else:
-                query_list = [query]
-            if inclusive:
-                q = q & Q('bool', must=[Q('match_phrase', content=i) for i in query_list])
-            else:
-                q = q & Q('bool', should=[Q('match_phrase', content=i) for i in query_list])
-            start = page * ndocs
-            end = start + ndocs
-            s = Search(index='object')
-            if cls is not None:
-                s = s.filter('term', cls__raw=cls)
-            if detect_min is not None:
-                s = s.filter('range', detect_score={'gte': detect_min})
-            if postprocess_min is not None:
-                s = s.filter('range', postprocess_score={'gte': postprocess_min})
-
-            if doc_filter > 0:
-                s = s.filter('terms', pdf_name__raw=pdf_names)
-
-            if obj_id is not None:
-                q = q & Q('ids', values=[obj_id])
+            s = self.object_search(query, cls=cls, detect_min=detect_min, postprocess_min=postprocess_min,
+                                   inclusive=inclusive, document_filter_terms=document_filter_terms, docids=docids,
+                                   obj_id=obj_id)
 
             if get_count:
-                return s.query(q).count()
-
-            s = s.query(q)[start:end]
+                return s.count()
 
-            response = s.execute()
-            final_results = [r.meta.id for r in response]
-            final_results = [self.get_object(i) for i in final_results]
+            start = page * ndocs
+            end = start + ndocs
+            response = s[start:end].execute()
+            final_results = self.hit_objects(response)
 
         if final:
-            contexts = [
-                {
-                    'header': {},
-                    'pdf_name': obj.pdf_name,
-                    'children': [{
-                        'id': obj.meta.id,
-                        'bytes': obj.img_pth,
-                        'cls': obj.cls,
-                        'postprocessing_confidence': obj.postprocess_score,
-                        'base_confidence': obj.detect_score,
-                        'content': obj.content,
-                        'header_content': obj.header_content,
-                    }],
-                } for obj in final_results
-            ]
+            contexts = self.object_contexts(final_results)
         logger.error(f'Found {len(contexts)} contexts')
         return contexts
 
-    def get_object(self, id):
-        if self.awsauth is not None:
-            connections.create_connection(hosts=self.hosts,
-                                          http_auth=self.awsauth,
-                                          use_ssl=True,
-                                          verify_certs=True,
-                                          connection_class=RequestsHttpConnection
-                                          )
+    def search_with_count(self, query, ndocs=30, page=0, cls=None, detect_min=None, postprocess_min=None, inclusive=False, document_filter_terms=[], docids=[], obj_id=None):
+        """
+        Run an object search once for both a page of results and the total number of matches
+        :return: (list of contexts, as returned by search with final=True, total number of matching objects)
+        """
+        s = self.object_search(query, cls=cls, detect_min=detect_min, postprocess_min=postprocess_min,
+                               inclusive=inclusive, document_filter_terms=document_filter_terms, docids=docids,
+                               obj_id=obj_id)
+        start = page * ndocs
+        end = start + ndocs
+        # Count every match exactly, as count() does, rather than stopping at the default of 10000
+        response = s[start:end].extra(track_total_hits=True).execute()
+        total = response.hits.total
+        # Elasticsearch 7 reports the total as {'value': n, 'relation': 'eq'}, earlier versions as n
+        total = total.value if hasattr(total, 'value') else total
+        contexts = self.object_contexts(self.hit_objects(response))
+        logger.info(f'Found {len(contexts)} of {total} contexts')
+        return contexts, total
+
+    def object_search(self, query, cls=None, detect_min=None, postprocess_min=None, inclusive=False, document_filter_terms=[], docids=[], obj_id=None):
+        """
+        Build the search over the object index, with any document filters applied server side
+        :return: elasticsearch_dsl Search, with the query and filters applied
+        """
+        q = Q()
+        if query is None:
+            query_list = []
+        elif "," in query:
+            query_list = query.split(",")
         else:
-            connections.create_connection(hosts=self.hosts)
-        return Object.get(id=id)
-
-    def build_index(self, document_parquet, entities_parquet, section_parquet, tables_parquet, figures_parquet, equations_parquet):
-        if self.awsauth is not None:
-            connections.create_connection(hosts=self.hosts,
-                                          http_auth=self.awsauth,
-                                          use_ssl=True,
-                                          verify_certs=True,
-                                          connection_class=RequestsHttpConnection
-                                          )
+            query_list = [query]
+        if inclusive:
+            q = q & Q('bool', must=[Q('match_phrase', content=i) for i in query_list])
         else:
-            connections.create_connection(hosts=self.hosts)
+            q = q & Q('bool', should=[Q('match_phrase', content=i) for i in query_list])
+        s = Search(using=self.client, index='object')
+        if cls is not None:
+            s = s.filter('term', cls__raw=cls)
+        if detect_min is not None:
+            s = s.filter('range', detect_score={'gte': detect_min})
+        if postprocess_min is not None:
+            s = s.filter('range', postprocess_score={'gte': postprocess_min})
+
+        # Document filters are applied server side: docids name the PDFs directly, and the PDFs matching the filter
+        # terms are looked up from their stored DocumentFilter
+        logging.info(f"docids: {docids}")
+        if len(docids) > 0:
+            s = s.filter('terms', pdf_name__raw=[f"{i}.pdf" for i in docids])
+        logging.info(f"document_filter_terms: {document_filter_terms}")
+        if len(document_filter_terms) > 0:
+            s = s.filter('terms', pdf_name__raw={'index': DocumentFilter._index._name,
+                                                 'id': self.document_filter(document_filter_terms),
+                                                 'path': 'pdf_names'})
+
+        if obj_id is not None:
+            q = q & Q('ids', values=[obj_id])
+
+        return s.query(q)
+
+    def document_filter(self, document_filter_terms):
+        """
+        Resolve document filter terms to the PDFs whose full text contains all of them, storing the result as a
+        DocumentFilter unless a stored one younger than document_filter_ttl exists
+        :param document_filter_terms: List of phrases
+        :return: Id of the DocumentFilter
+        """
+        terms = sorted(set(document_filter_terms))
+        filter_id = hashlib.sha1(json.dumps(terms).encode('utf-8')).hexdigest()
+        now = int(time.time())
+        doc_filter = DocumentFilter.get(id=filter_id, using=self.client, ignore=404)
+        if doc_filter is None or now - doc_filter.created > self.document_filter_ttl:
+            ds = Search(using=self.client, index='fulldocument')
+            ds = ds.query(Q('bool', must=[Q('match_phrase', content=i) for i in terms])).source(['name'])
+            pdf_names = [resp['name'] for resp in ds.scan()]
+            logging.info(f"{len(pdf_names)} pdfs found")
+            if doc_filter is None:
+                # Saving into a missing index would create it with dynamic mappings, so create it with its own first.
+                # A 400 means it already exists
+                self.client.indices.create(index=DocumentFilter._index._name, body=DocumentFilter._index.to_dict(),
+                                           ignore=400)
+            DocumentFilter(meta={'id': filter_id}, terms=terms, pdf_names=pdf_names, created=now).save(using=self.client)
+        return filter_id
+
+    def clear_document_filters(self):
+        """
+        Drop every stored DocumentFilter, eg once the documents they were resolved against have changed. The index
+        itself is kept, so that filters stored afterwards still get its mappings
+        """
+        s = Search(using=self.client, index=DocumentFilter._index._name)
+        s.params(ignore_unavailable=True, conflicts='proceed', refresh=True).query(Q('match_all')).delete()
+
+    @staticmethod
+    def object_contexts(objects):
+        """
+        :param objects: List of Objects
+        :return: List of contexts, one per object, as returned by search with final=True
+        """
+        return [
+            {
+                'header': {},
+                'pdf_name': obj.pdf_name,
+                'children': [{
+                    'id': obj.meta.id,
+                    'bytes': obj.img_pth,
+                    'cls': obj.cls,
+                    'postprocessing_confidence': obj.postprocess_score,
+                    'base_confidence': obj.detect_score,
+                    'content': obj.content,
+                    'header_content': obj.header_content,
+                }],
+            } for obj in objects
+        ]
+
+    @staticmethod
+    def hit_objects(response):
+        """
+        Build Objects straight from the _source of each hit of a search response, instead of fetching every hit again
+        :param response: Executed search response
+        :return: List of Objects, in hit order
+        """
+        return [Object.from_es(hit) for hit in response.to_dict()['hits']['hits']]
+
+    def get_object(self, id):
+        return Object.get(id=id, using=self.client)
+
+    def get_objects(self, ids):
+        """
+        Fetch several Objects in a single mget round trip
+        :param ids: List of object ids
+        :return: List of Objects, in the order given
+        """
+        if len(ids) == 0:
+            return []
+        return Object.mget(ids, using=self.client, missing='raise')
+
+    def build_index(self, document_parquet, entities_parquet, section_parquet, tables_parquet, figures_parquet, equations_parquet, chunk_size=500, thread_count=4):
+        """
+        Load ingest outputs into the indices. Rows are streamed from the parquet files and sent with parallel bulk
+        requests, while refreshes and replicas of the indices are turned off
+        :param chunk_size: Number of documents per bulk request
+        :param thread_count: Number of bulk requests in flight at once
+        """
         logger.info('Building elastic index')
-        connections.create_connection(hosts=self.hosts)
         index_template = EntityObjectIndex._index.as_template("base")
-        index_template.save()
-        FullDocument.init()
-
-        # This is a parquet file to load from
-        if document_parquet != '':
-            to_add = []
-            df = pd.read_parquet(document_parquet)
-            for ind, row in df.iterrows():
-                to_add.append(FullDocument(name=row['pdf_name'], dataset_id=row['dataset_id'], content=row['content']))
-                if len(to_add) == 1000:
-                    bulk(connections.get_connection(), (upsert(d) for d in to_add))
-                    to_add = []
-            bulk(connections.get_connection(), (upsert(d) for d in to_add))
-            logger.info('Done building document index')
-
-        if entities_parquet != '':
-            df = pd.read_parquet(entities_parquet)
-            for ind, row in df.iterrows():
-                Entity(canonical_id=row['id'],
-                       name=row['name'],
-                       description=row['description'],
-                       types=row['types'].tolist(),
-                       aliases=row['aliases'].tolist(),
-                       dataset_id=row['dataset_id']).save()
-            logger.info('Done building entities index')
-
-        if section_parquet != '':
-            if entities_parquet != '': # TODO: better way to recognize that we're using entities
-                df = pd.read_parquet(section_parquet)
-                for ind, row in df.iterrows():
-                    entities = row['ents_linked']
-                    to_add = []
-                    for entity in entities:
-                        es = Entity.search()
-                        es = es.filter('term', canonical_id__raw=entity)
-                        response = es.execute()
-                        for hit in response:
-                            to_add.append(hit.add_object('Section',
-                                           row['dataset_id'],
-                                           row['content'],
-                                           row['section_header'],
-                                           50,
-                                           row['detect_score'],
-                                           row['postprocess_score'],
-                                           row['pdf_name'],
-                                           commit=False))
-                            if len(to_add) == 100:
-                                bulk(connections.get_connection(), (o.to_dict(True) for o in to_add), request_timeout=20, max_retries=1)
-                                to_add = []
-                    if to_add == []: continue
-                    bulk(connections.get_connection(), (o.to_dict(True) for o in to_add), request_timeout=20, max_retries=1)
-                    to_add = []
-            else:
-                df = pd.read_parquet(section_parquet)
-                to_add = []
-                for ind, row in df.iterrows():
-                    to_add.append(
-                            Object(cls='Section',
-                                dataset_id=row['dataset_id'],
-                                content=row['content'],
-                                header_content=row['section_header'],
-                                area=50,
-                                detect_score=row['detect_score'],
-                                postprocess_score=row['postprocess_score'],
-                                pdf_name=row['pdf_name'],
-                           ))
-                    if len(to_add) == 1000:
-                        bulk(connections.get_connection(), (upsert(d) for d in to_add))
-                        to_add = []
-                bulk(connections.get_connection(), (upsert(d) for d in to_add))
-
-            logger.info('Done building section index')
-
-        if tables_parquet != '':
-            df = pd.read_parquet(tables_parquet)
-            to_add = []
-            if entities_parquet != '': # TODO: better way to recognize that we're using entities
-                for ind, row in df.iterrows():
-                    entities = row['ents_linked']
-                    for entity in entities:
-                        es = Entity.search()
-                        es = es.filter('term', canonical_id__raw=entity)
-                        response = es.execute()
-                        for hit in response:
-                            to_add.append(hit.add_object('Table',
-                                           row['dataset_id'],
-                                           row['content'],
-                                           row['caption_content'],
-                                           50,
-                                           row['detect_score'],
-                                           row['postprocess_score'],
-                                           row['pdf_name'],
-                                           row['img_pth'],
-                                           commit=False))
-                            if len(to_add) == 100:
-                                bulk(connections.get_connection(), (o.to_dict(True) for o in to_add), request_timeout=20, max_retries=1)
-                                to_add = []
-                    if to_add == []: continue
-                    bulk(connections.get_connection(), (o.to_dict(True) for o in to_add), request_timeout=20, max_retries=1)
-                    to_add = []
-            else:
-                for ind, row in df.iterrows():
-                    to_add.append(Object(cls='Table',
-                        dataset_id=row['dataset_id'],
-                        content=row['content'],
-                        header_content=row['caption_content'],
-                        area=50,
-                        detect_score=row['detect_score'],
-                        postprocess_score=row['postprocess_score'],
-                        pdf_name=row['pdf_name'],
-                        img_pth=row['img_pth'],
-                        ))
-                    if len(to_add) == 1000:
-                        bulk(connections.get_connection(), (upsert(d) for d in to_add))
-                        to_add = []
-            bulk(connections.get_connection(), (upsert(d) for d in to_add))
-            to_add = []
-            logger.info('Done building tables index')
-
-        if figures_parquet != '':
-            df = pd.read_parquet(figures_parquet)
-            to_add = []
-            if entities_parquet != '': # TODO: better way to recognize that we're using entities
-                for ind, row in df.iterrows():
-                    entities = row['ents_linked']
-                    for entity in entities:
-                        es = Entity.search()
-                        es = es.filter('term', canonical_id__raw=entity)
-                        response = es.execute()
-                        for hit in response:
-                            to_add.append(hit.add_object('Figure',
-                                           row['dataset_id'],
-                                           row['content'],
-                                           row['caption_content'],
-                                           50,
-                                           row['detect_score'],
-                                           row['postprocess_score'],
-                                           row['pdf_name'],
-                                           row['img_pth'],
-                                           commit=False))
-                            if len(to_add) == 100:
-                                bulk(connections.get_connection(), (o.to_dict(True) for o in to_add), request_timeout=20, max_retries=1)
-                                to_add = []
-                    if to_add == []: continue
-                bulk(connections.get_connection(), (o.to_dict(True) for o in to_add), request_timeout=20, max_retries=1)
-                to_add = []
-            else:
-                for ind, row in df.iterrows():
-                    to_add.append(Object(cls='Figure',
-                           dataset_id=row['dataset_id'],
-                           content=row['content'],
-                           header_content=row['caption_content'],
-                           area=50,
-                           detect_score=row['detect_score'],
-                           postprocess_score=row['postprocess_score'],
-                           pdf_name=row['pdf_name'],
-                           img_pth=row['img_pth'],
-                           ))
-                    if len(to_add) == 1000:
-                        bulk(connections.get_connection(), (upsert(d) for d in to_add))
-                        to_add = []
-                bulk(connections.get_connection(), (upsert(d) for d in to_add))
-                to_add = []
-            logger.info('Done building figures index')
-
-        if equations_parquet != '':
-            df = pd.read_parquet(equations_parquet)
-            to_add = []
+        index_template.save(using=self.client)
+        FullDocument.init(using=self.client)
+        DocumentFilter.init(using=self.client)
+        # Stored document filters were resolved against the documents as they were
+        self.clear_document_filters()
+        # The template sets up the mappings of the object index when it is created
+        if not self.client.indices.exists(index=EntityObjectIndex._index._name):
+            self.client.indices.create(index=EntityObjectIndex._index._name)
+
+        with bulk_loading(self.client, [FullDocument._index._name, EntityObjectIndex._index._name]):
+            # This is a parquet file to load from
+            if document_parquet != '':
+                rows = iter_parquet_rows(document_parquet, columns=['pdf_name', 'dataset_id', 'content'])
+                self._bulk((upsert(FullDocument(name=row['pdf_name'], dataset_id=row['dataset_id'], content=row['content']))
+                            for row in rows), chunk_size, thread_count)
+                logger.info('Done building document index')
+
+            parents = None
             if entities_parquet != '': # TODO: better way to recognize that we're using entities
-                for ind, row in df.iterrows():
-                    entities = row['ents_linked']
-                    for entity in entities:
-                        es = Entity.search()
-                        es = es.filter('term', canonical_id__raw=entity)
-                        response = es.execute()
-                        for hit in response:
-                            to_add.append(hit.add_object('Equation',
-                                           row['dataset_id'],
-                                           row['content'],
-                                           None,
-                                           50,
-                                           row['detect_score'],
-                                           row['postprocess_score'],
-                                           row['pdf_name'],
-                                           row['img_pth'],
-                                           commit=False))
-                            if len(to_add) == 100:
-                                bulk(connections.get_connection(), (o.to_dict(True) for o in to_add), request_timeout=20, max_retries=1)
-                                to_add = []
-                    if to_add == []: continue
-                    bulk(connections.get_connection(), (o.to_dict(True) for o in to_add), request_timeout=20, max_retries=1)
-                to_add = []
-            else:
-                for ind, row in df.iterrows():
-                    to_add.append(Object(cls='Equation',
-                           dataset_id=row['dataset_id'],
-                           content=row['content'],
-                           header_content='',
-                           area=50,
-                           detect_score=row['detect_score'],
-                           postprocess_score=row['postprocess_score'],
-                           pdf_name=row['pdf_name'],
-                           img_pth=row['img_pth'],
-                           ))
-                    if len(to_add) == 1000:
-                        bulk(connections.get_connection(), (upsert(d) for d in to_add))
-                        to_add = []
-                bulk(connections.get_connection(), (upsert(d) for d in to_add))
-            logger.info('Done building equations index')
+                rows = iter_parquet_rows(entities_parquet, columns=['id', 'name', 'description', 'types', 'aliases', 'dataset_id'])
+                self._bulk((upsert(Entity(canonical_id=row['id'],
+                                          name=row['name'],
+                                          description=row['description'],
+                                          types=row['types'],
+                                          aliases=row['aliases'],
+                                          dataset_id=row['dataset_id'],
+                                          entity_object='entity'))
+                            for row in rows), chunk_size, thread_count)
+                logger.info('Done building entities index')
+                parents = self.entity_parents()
+
+            objects = [(section_parquet, 'Section', 'section_header', False, 'section'),
+                       (tables_parquet, 'Table', 'caption_content', True, 'tables'),
+                       (figures_parquet, 'Figure', 'caption_content', True, 'figures'),
+                       (equations_parquet, 'Equation', None, True, 'equations')]
+            for parquet, cls, header_column, has_img, name in objects:
+                if parquet == '':
+                    continue
+                self._bulk(self.object_actions(parquet, cls, header_column, has_img, parents), chunk_size, thread_count,
+                           request_timeout=20)
+                logger.info(f'Done building {name} index')
         logger.info('Done building object index')
 
+    def _bulk(self, actions, chunk_size, thread_count, **kwargs):
+        """
+        Send bulk actions with parallel bulk requests. Raises BulkIndexError if any action fails
+        :param actions: Iterable of bulk actions
+        :param chunk_size: Number of actions per request
+        :param thread_count: Number of requests in flight at once
+        """
+        # parallel_bulk is lazy, so the results are consumed to send the requests
+        deque(parallel_bulk(self.client, actions, chunk_size=chunk_size, thread_count=thread_count, **kwargs), maxlen=0)
+
+    def entity_parents(self):
+        """
+        Map every indexed entity's canonical id to the entities that objects linked to it are added under, with one scan
+        of the entity index instead of a search per linked entity
+        :return: {canonical_id: [Entity]}. The Entities only carry their id and index
+        """
+        self.client.indices.refresh(index=EntityObjectIndex._index._name)
+        parents = {}
+        for hit in Entity.search(using=self.client).source(['canonical_id', 'entity_object']).scan():
+            parents.setdefault(hit.canonical_id, []).append(Entity(meta={'id': hit.meta.id, 'index': hit.meta.index}))
+        return parents
+
+    @staticmethod
+    def object_actions(parquet, cls, header_column, has_img, parents=None):
+        """
+        Stream the bulk actions indexing one type of object
+        :param parquet: Path to the objects' parquet file or dataset
+        :param cls: Object class name
+        :param header_column: Column holding the objects' header content, or None if they have none
+        :param has_img: Whether the objects have an img_pth column
+        :param parents: Map from entity_parents. If given, each object is added under every entity it links to,
+                        otherwise objects are upserted on their own
+        :return: Generator of bulk actions
+        """
+        columns = ['dataset_id', 'content', 'detect_score', 'postprocess_score', 'pdf_name']
+        if header_column is not None:
+            columns.append(header_column)
+        if has_img:
+            columns.append('img_pth')
+        if parents is not None:
+            columns.append('ents_linked')
+        for row in iter_parquet_rows(parquet, columns=columns):
+            header_content = row[header_column] if header_column is not None else None
+            img_pth = row['img_pth'] if has_img else None
+            if parents is None:
+                # Objects without a header are upserted with an empty one, which their ids are hashed from
+                yield upsert(Object(cls=cls,
+                                    dataset_id=row['dataset_id'],
+                                    content=row['content'],
+                                    header_content=header_content if header_column is not None else '',
+                                    area=50,
+                                    detect_score=row['detect_score'],
+                                    postprocess_score=row['postprocess_score'],
+                                    pdf_name=row['pdf_name'],
+                                    img_pth=img_pth))
+                continue
+            # Rows that failed linking have no entities
+            for entity in row['ents_linked'] or []:
+                for parent in parents.get(entity, []):
+                    yield parent.add_object(cls,
+                                            row['dataset_id'],
+                                            row['content'],
+                                            header_content,
+                                            50,
+                                            row['detect_score'],
+                                            row['postprocess_score'],
+                                            row['pdf_name'],
+                                            img_pth,
+                                            commit=False).to_dict(True)
+
     def count(self, index):
-        if self.awsauth is not None:
-            connections.create_connection(hosts=self.hosts,
-                                          http_auth=self.awsauth,
-                                          use_ssl=True,
-                                          verify_certs=True,
-                                          connection_class=RequestsHttpConnection
-                                          )
-        else:
-            connections.create_connection(hosts=self.hosts)
-        s = Search(index=index)
+        s = Search(using=self.client, index=index)
         return s.count()
 
     def delete(self, dataset_id):
-        if self.awsauth is not None:
-            connections.create_connection(hosts=self.hosts,
-                                          http_auth=self.awsauth,
-                                          use_ssl=True,
-                                          verify_certs=True,
-                                          connection_class=RequestsHttpConnection
-                                          )
-        else:
-            connections.create_connection(hosts=self.hosts)
-        s = Search(index='fulldocument')
+        s = Search(using=self.client, index='fulldocument')
         q = Q()
         q = q & Q('match', dataset_id__raw=dataset_id)
         result = s.query(q).delete()
         logger.info(result)
-        s = Search(index='eo-site')
+        s = Search(using=self.client, index='eo-site')
         q = Q()
         q = q & Q('match', dataset_id__raw=dataset_id)
         result = s.query(q).delete()
         logger.info(result)
+        self.clear_document_filters()
 
     def rerank(self, query, contexts):
         raise NotImplementedError('ElasticRetriever does not rerank results')
@@ -0,0 +1,67 @@
+"""
+Long lived Elasticsearch clients, shared by the retrievers and the API so that connections are pooled and kept alive
+across requests instead of being set up for every call
+"""
+from contextlib import contextmanager
+from elasticsearch import Elasticsearch, RequestsHttpConnection
+
+
+class PooledRequestsHttpConnection(RequestsHttpConnection):
+    """
+    RequestsHttpConnection whose session keeps up to maxsize connections alive, like the default urllib3 connection.
+    Used for signed (AWS) requests
+    """
+    def __init__(self, *args, maxsize=10, **kwargs):
+        super().__init__(*args, **kwargs)
+        from requests.adapters import HTTPAdapter
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=maxsize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+
+def create_client(hosts, awsauth=None, maxsize=25, timeout=20, max_retries=3, retry_on_timeout=True, sniff=False):
+    """
+    Create a thread safe Elasticsearch client. Connections to each node are pooled and reused across calls
+    :param hosts: Elasticsearch host or list of hosts
+    :param awsauth: Optional AWS request signer. If set, requests are signed and sent over TLS
+    :param maxsize: Number of connections kept open to each node
+    :param timeout: Request timeout in seconds
+    :param max_retries: Number of times a failed request is retried on another connection
+    :param retry_on_timeout: Whether timed out requests are retried
+    :param sniff: Whether to discover the cluster's nodes on start, periodically, and when a node fails
+    :return: Elasticsearch client
+    """
+    kwargs = {'maxsize': maxsize,
+              'timeout': timeout,
+              'max_retries': max_retries,
+              'retry_on_timeout': retry_on_timeout}
+    if sniff:
+        kwargs.update(sniff_on_start=True, sniff_on_connection_fail=True, sniffer_timeout=60)
+    if awsauth is not None:
+        kwargs.update(http_auth=awsauth,
+                      use_ssl=True,
+                      verify_certs=True,
+                      connection_class=PooledRequestsHttpConnection)
+    return Elasticsearch(hosts, **kwargs)
+
+
+@contextmanager
+def bulk_loading(client, indices):
+    """
+    Turn off refreshes and replicas of indices while they are bulk loaded. Afterwards their earlier settings are
+    restored and they are refreshed once
+    :param client: Elasticsearch client
+    :param indices: List of index names, which must exist
+    """
+    settings = ['index.refresh_interval', 'index.number_of_replicas']
+    previous = client.indices.get_settings(index=','.join(indices), name=settings, flat_settings=True)
+    client.indices.put_settings(index=','.join(indices), body={'index.refresh_interval': '-1',
+                                                                'index.number_of_replicas': 0})
+    try:
+        yield
+    finally:
+        for index, index_settings in previous.items():
+            # Settings that were never set go back to their defaults
+            client.indices.put_settings(index=index, body={setting: index_settings['settings'].get(setting)
+                                                           for setting in settings})
+        client.indices.refresh(index=','.join(indices))
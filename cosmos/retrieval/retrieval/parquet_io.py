@@ -0,0 +1,45 @@
+"""
+Helpers for reading ingest outputs, which are either single parquet files or partitioned datasets: directories of
+part files
+"""
+import os
+import glob
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+def dataset_parts(path):
+    """
+    List the parquet files making up a dataset
+    :param path: Path to a parquet file, or to a directory of parquet part files
+    :return: Sorted list of parquet file paths. Files starting with '_' or '.' (eg manifests) are skipped
+    """
+    # The ingestion and retrieval packages are installed separately, so each carries a copy of this function. Keep it
+    # in step with the one in cosmos/ingestion/ingest/utils/parquet_io.py
+    if not os.path.isdir(path):
+        return [path]
+    parts = glob.glob(os.path.join(path, '*.parquet'))
+    return sorted(p for p in parts if not os.path.basename(p).startswith(('_', '.')))
+
+
+def read_parquet_parts(path):
+    """
+    Read a dataset one part at a time, so that only one part is held in memory
+    :param path: Path to a parquet file, or to a directory of parquet part files
+    :return: Generator of DataFrames, one per part
+    """
+    for part in dataset_parts(path):
+        yield pd.read_parquet(part)
+
+
+def iter_parquet_rows(path, columns=None, batch_size=10000):
+    """
+    Stream the rows of a dataset, reading each part a batch of rows at a time rather than whole
+    :param path: Path to a parquet file, or to a directory of parquet part files
+    :param columns: Optional list of columns to read
+    :param batch_size: Maximum number of rows read at once
+    :return: Generator of rows, as {column: value} dicts of Python values
+    """
+    for part in dataset_parts(path):
+        for batch in pq.ParquetFile(part).iter_batches(batch_size=batch_size, columns=columns):
+            yield from batch.to_pylist()
@@ -11,14 +11,17 @@ import os
 @click.option('--entities-parquet', type=str, help='', default='')
 @click.option('--aws-host', type=str, help='', default='')
 @click.option('--host', type=str, help='', default='localhost')
-def run(sections_parquet, documents_parquet, tables_parquet, figures_parquet, equations_parquet, entities_parquet, aws_host, host):
+@click.option('--chunk-size', type=int, help='Number of documents per bulk request', default=500)
+@click.option('--thread-count', type=int, help='Number of bulk requests in flight at once', default=4)
+def run(sections_parquet, documents_parquet, tables_parquet, figures_parquet, equations_parquet, entities_parquet, aws_host, host, chunk_size, thread_count):
     if aws_host != '':
         auth = AWS4Auth(os.environ.get('AWS_ACCESS_KEY_ID'), os.environ.get('AWS_SECRET_ACCESS_KEY'), os.environ.get('AWS_DEFAULT_REGION'), 'es', session_token=os.environ.get('AWS_SESSION_TOKEN'))
         ret = ElasticRetriever(hosts=[{'host':aws_host, 'port':443}], awsauth=auth)
     else:
         ret = ElasticRetriever(hosts=[host])
     print('Connected to retriever, building indices')
-    ret.build_index(documents_parquet, entities_parquet, sections_parquet, tables_parquet, figures_parquet, equations_parquet)
+    ret.build_index(documents_parquet, entities_parquet, sections_parquet, tables_parquet, figures_parquet, equations_parquet,
+                    chunk_size=chunk_size, thread_count=thread_count)
     print('Done building index')
 
 if __name__ == '__main__':